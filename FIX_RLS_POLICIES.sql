@@ -33,6 +33,13 @@ CREATE POLICY "Allow insert submissions"
     ON submissions FOR INSERT
     WITH CHECK (true);
 
+-- 5. Allow updating saved submissions (deferred feedback is written back to the row)
+DROP POLICY IF EXISTS "Allow update submissions" ON submissions;
+CREATE POLICY "Allow update submissions"
+    ON submissions FOR UPDATE
+    USING (true)
+    WITH CHECK (true);
+
 -- Verify the policies
 SELECT schemaname, tablename, policyname, permissive, roles, cmd, qual 
 FROM pg_policies 
@@ -0,0 +1,13 @@
+-- Indexes for the paged submission listings (keyset pagination on id, newest first)
+-- Run this in Supabase SQL Editor
+-- Each filter the teacher/student tables push down gets an index ending in id DESC,
+-- so "WHERE <filter> AND id < cursor ORDER BY id DESC LIMIT n" reads only one page
+
+CREATE INDEX IF NOT EXISTS idx_submissions_username_id ON submissions(username, id DESC);
+CREATE INDEX IF NOT EXISTS idx_submissions_student_name_id ON submissions(student_name, id DESC);
+CREATE INDEX IF NOT EXISTS idx_submissions_resultado_id ON submissions(resultado, id DESC);
+
+-- Verify the indexes
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'submissions';
@@ -0,0 +1,42 @@
+-- Store the scoring features with each submission and the teacher's resolution of 'Revisar' answers
+-- Run this in Supabase SQL Editor; until then the app keeps saving submissions without these columns
+-- retrain.py refits model_kw.joblib / params_kw.json from these columns, without re-embedding answers
+
+-- The 7 features of logica.features, keyed by name: {"avg_correct": 0.71, ..., "kw_f1": 0.5}
+ALTER TABLE submissions
+ADD COLUMN IF NOT EXISTS features JSONB;
+
+-- Label chosen by the teacher for an answer the model sent to 'Revisar'
+ALTER TABLE submissions
+ADD COLUMN IF NOT EXISTS resultado_docente TEXT;
+
+ALTER TABLE submissions
+ADD COLUMN IF NOT EXISTS revisado_at TIMESTAMPTZ;
+
+ALTER TABLE submissions
+DROP CONSTRAINT IF EXISTS submissions_resultado_docente_check;
+
+ALTER TABLE submissions
+ADD CONSTRAINT submissions_resultado_docente_check
+CHECK (resultado_docente IS NULL OR resultado_docente IN ('Correcta', 'Incorrecta'));
+
+-- Teacher-labelled rows are a small subset: keep them cheap to find
+CREATE INDEX IF NOT EXISTS idx_submissions_resultado_docente
+ON submissions(id DESC)
+WHERE resultado_docente IS NOT NULL;
+
+-- Resolving a case updates existing rows (same policy as FIX_SUBMISSION_FEEDBACK_UPDATE.sql)
+DROP POLICY IF EXISTS "Allow update submissions" ON submissions;
+CREATE POLICY "Allow update submissions"
+    ON submissions FOR UPDATE
+    USING (true)
+    WITH CHECK (true);
+
+-- Make the new columns visible to the API right away
+NOTIFY pgrst, 'reload schema';
+
+-- Verify the change
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'submissions'
+AND column_name IN ('features', 'resultado_docente', 'revisado_at');
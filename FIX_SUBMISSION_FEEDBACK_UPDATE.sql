@@ -0,0 +1,15 @@
+-- Allow the app to update submissions it has already saved
+-- Run this in Supabase SQL Editor before turning on DEFERRED_FEEDBACK
+-- The deferred feedback worker (and the spool) write the AI feedback back with an UPDATE.
+-- Without an UPDATE policy, RLS filters every row out and PostgREST updates 0 rows without an error.
+
+DROP POLICY IF EXISTS "Allow update submissions" ON submissions;
+CREATE POLICY "Allow update submissions"
+    ON submissions FOR UPDATE
+    USING (true)
+    WITH CHECK (true);
+
+-- Verify the policy
+SELECT policyname, cmd
+FROM pg_policies
+WHERE tablename = 'submissions';
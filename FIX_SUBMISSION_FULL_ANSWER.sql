@@ -0,0 +1,18 @@
+-- Keep the whole answer when the app cuts 'respuesta' to 200 characters for display
+-- Run this in Supabase SQL Editor; until then the app keeps saving submissions without this column
+-- near_duplicates.py embeds respuesta_completa (falling back to respuesta), so long answers hit the
+-- embedding cache filled at grading time and answers that only share their first 200 characters
+-- are not reported as copies
+
+-- NULL when the answer fit in 'respuesta'
+ALTER TABLE submissions
+ADD COLUMN IF NOT EXISTS respuesta_completa TEXT;
+
+-- Make the new column visible to the API right away
+NOTIFY pgrst, 'reload schema';
+
+-- Verify the change
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'submissions'
+AND column_name = 'respuesta_completa';
@@ -0,0 +1,28 @@
+-- Idempotency key for submissions written through the local submission spool
+-- Run this in Supabase SQL Editor before enabling SUBMISSION_SPOOL
+-- The spool upserts batches ON CONFLICT (idempotency_key), so a batch retried after
+-- a lost response never inserts the same answer twice
+
+ALTER TABLE submissions
+ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+-- Rows saved directly by the app keep NULL (NULLs never conflict)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_idempotency_key
+ON submissions(idempotency_key);
+
+-- Feedback attached after a row was written is re-sent as ON CONFLICT DO UPDATE,
+-- which RLS denies (42501) without an UPDATE policy
+DROP POLICY IF EXISTS "Allow update submissions" ON submissions;
+CREATE POLICY "Allow update submissions"
+    ON submissions FOR UPDATE
+    USING (true)
+    WITH CHECK (true);
+
+-- Make the new column visible to the API right away
+NOTIFY pgrst, 'reload schema';
+
+-- Verify the change
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'submissions'
+AND column_name = 'idempotency_key';
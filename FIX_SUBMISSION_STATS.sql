@@ -0,0 +1,76 @@
+-- Server-side aggregation for the teacher dashboard statistics
+-- Run this in Supabase SQL Editor
+-- Without these functions database.get_submission_stats falls back to counting in Python
+
+-- 1. Overall counts, optionally for one student (username) and/or one question
+CREATE OR REPLACE FUNCTION submission_stats(
+    p_username TEXT DEFAULT NULL,
+    p_pregunta_id TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    total BIGINT,
+    correctas BIGINT,
+    incorrectas BIGINT,
+    revisar BIGINT,
+    students BIGINT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        COUNT(*),
+        COUNT(*) FILTER (WHERE resultado = 'Correcta'),
+        COUNT(*) FILTER (WHERE resultado = 'Incorrecta'),
+        COUNT(*) FILTER (WHERE resultado = 'Revisar'),
+        COUNT(DISTINCT student_name)
+    FROM submissions
+    WHERE (p_username IS NULL OR username = p_username)
+      AND (p_pregunta_id IS NULL OR pregunta_id = p_pregunta_id);
+$$;
+
+-- 2. The same counts per student or per question
+--    p_group_by: 'student_name' (default), 'username' or 'pregunta_id'
+CREATE OR REPLACE FUNCTION submission_stats_grouped(
+    p_group_by TEXT DEFAULT 'student_name'
+)
+RETURNS TABLE (
+    group_key TEXT,
+    total BIGINT,
+    correctas BIGINT,
+    incorrectas BIGINT,
+    revisar BIGINT,
+    students BIGINT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        CASE p_group_by
+            WHEN 'username' THEN username
+            WHEN 'pregunta_id' THEN pregunta_id
+            ELSE student_name
+        END AS group_key,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE resultado = 'Correcta'),
+        COUNT(*) FILTER (WHERE resultado = 'Incorrecta'),
+        COUNT(*) FILTER (WHERE resultado = 'Revisar'),
+        COUNT(DISTINCT student_name)
+    FROM submissions
+    GROUP BY 1
+    ORDER BY 1;
+$$;
+
+GRANT EXECUTE ON FUNCTION submission_stats(TEXT, TEXT) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION submission_stats_grouped(TEXT) TO anon, authenticated;
+
+-- Indexes for the filters and groupings the functions use (same names as SUPABASE_SETUP.md,
+-- so databases created from it are left as they are)
+CREATE INDEX IF NOT EXISTS idx_submissions_username ON submissions(username);
+CREATE INDEX IF NOT EXISTS idx_submissions_student_name ON submissions(student_name);
+CREATE INDEX IF NOT EXISTS idx_submissions_resultado ON submissions(resultado);
+CREATE INDEX IF NOT EXISTS idx_submissions_pregunta_id ON submissions(pregunta_id);
+
+-- Make the new functions visible to the API right away
+NOTIFY pgrst, 'reload schema';
+
+-- Verify
+SELECT * FROM submission_stats();
+SELECT * FROM submission_stats_grouped('pregunta_id');
@@ -7,6 +7,12 @@ import time
 
 # Import database functions
 import database as db
+import database_async as db_async
+import feedback_worker
+import submission_spool
+import metrics
+import near_duplicates
+import retrain
 
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(page_title="EvalIA - App", layout="wide")
@@ -27,6 +33,9 @@ st.markdown("""
 # Note: All database functions are now in database.py
 # This keeps the code clean and modular
 
+# Respuestas 'Revisar' que se muestran a la vez en Estadísticas
+CASOS_POR_REVISAR = 10
+
 # --- FUNCIONES DE AUTENTICACIÓN ---
 def register_page():
     """Página de registro para nuevos estudiantes"""
@@ -127,8 +136,12 @@ if not st.session_state['logged_in']:
 # Usuario autenticado - inicializar resto de estados
 if 'current_qid' not in st.session_state:
     st.session_state['current_qid'] = None
-if 'df_preguntas' not in st.session_state:
-    st.session_state['df_preguntas'] = logica.cargar_dataset()
+
+# Banco de preguntas compartido por todas las sesiones (no se copia en session_state)
+banco = logica.cargar_banco_preguntas()
+
+# Modelos, índice de referencias y stopwords se cargan en segundo plano tras el login
+logica.iniciar_precarga()
 
 # --- HEADER ---
 col_header1, col_header2 = st.columns([4, 1])
@@ -154,23 +167,19 @@ if st.session_state['role'] == "teacher":
     
     with tab1:
         # Sección de selección de preguntas
-        if 'df_preguntas' in st.session_state and not st.session_state['df_preguntas'].empty:
-            df = st.session_state['df_preguntas']
-            preguntas_disponibles = df['QUESTION'].tolist()
+        if len(banco) > 0:
+            preguntas_disponibles = banco.texts
             
             st.subheader("Seleccione Pregunta:")
 
             pregunta_elegida_texto = st.selectbox(
                 "Seleccione una pregunta para evaluar:",
                 preguntas_disponibles,
-                index=preguntas_disponibles.index(st.session_state.get('current_question_text', preguntas_disponibles[0]))
-                if 'current_question_text' in st.session_state and st.session_state['current_question_text'] in preguntas_disponibles
-                else 0
+                index=banco.position(st.session_state.get('current_question_text')) or 0
             )
 
             if pregunta_elegida_texto:
-                selected_row = df[df['QUESTION'] == pregunta_elegida_texto].iloc[0]
-                selected_qid = selected_row['QUESTION_ID']
+                selected_qid = banco.by_text(pregunta_elegida_texto).question_id
                 
                 st.session_state['current_question_text'] = pregunta_elegida_texto
                 
@@ -180,21 +189,20 @@ if st.session_state['role'] == "teacher":
                     st.rerun()
                     
         else:
-            st.error("Error: El DataFrame de preguntas ('df_preguntas') no está cargado o está vacío.")
+            st.error("Error: El banco de preguntas no está cargado o está vacío.")
 
         st.divider()
         st.info("🎯 Como docente, puedes probar el sistema evaluando respuestas y viendo métricas detalladas.")
 
         # CUERPO PRINCIPAL - Docente
         if st.session_state['current_qid']:
-            df = st.session_state['df_preguntas']
-            fila = df[df['QUESTION_ID'] == st.session_state['current_qid']].iloc[0]
+            pregunta = banco[st.session_state['current_qid']]
             
-            st.subheader(f"Pregunta {fila['QUESTION_ID']}")
-            st.markdown(f"### {fila['QUESTION']}")
+            st.subheader(f"Pregunta {pregunta.question_id}")
+            st.markdown(f"### {pregunta.question}")
             
             with st.form("eval_form_teacher"):
-                respuesta_usuario = st.text_area("Validación del pensamiento crítico:", height=150, placeholder="Escribe aquí para probar el sistema...", key=f"student_answer_{fila['QUESTION_ID']}")
+                respuesta_usuario = st.text_area("Validación del pensamiento crítico:", height=150, placeholder="Escribe aquí para probar el sistema...", key=f"student_answer_{pregunta.question_id}")
                 submitted = st.form_submit_button("📊 Evaluar Respuesta")
                 
             if submitted:
@@ -203,21 +211,23 @@ if st.session_state['role'] == "teacher":
                 else:
                     with st.spinner("Analizando semántica y generando feedback..."):
                         resultado_metricas = logica.get_semantic_similarity(
-                            model_correct=fila["ANSWER_CORRECT"],
-                            model_wrong=fila["WRONG_EXAMPLES"],
+                            model_correct=pregunta.correct_answers,
+                            model_wrong=pregunta.wrong_answers,
                             student_answer=respuesta_usuario,
-                            keywords=logica.parse_list(fila.get("KEYWORDS", []))
+                            keywords=pregunta.keywords,
+                            question_id=pregunta.question_id
                         )
                         
                         score = logica.scorer_logreg_kw(resultado_metricas)
                         interpretacion = logica.interpretar_3clases(score)
                         
                         feedback_ia, modelo = logica.generar_feedback_genai(
-                            pregunta=fila["QUESTION"],
+                            pregunta=pregunta.question,
                             student_answer=respuesta_usuario,
                             interpretacion=interpretacion,
-                            referencia=fila["ANSWER_CORRECT"],
-                            hint=fila["HINT"]
+                            referencia=pregunta.answer_correct,
+                            hint=pregunta.hint,
+                            question_id=pregunta.question_id
                         )
                         
                         st.session_state['last_result'] = {
@@ -225,8 +235,8 @@ if st.session_state['role'] == "teacher":
                             "feedback": feedback_ia,
                             "score": score,
                             "metrics": resultado_metricas,
-                            "referencia": fila["ANSWER_CORRECT"],
-                            "hint": fila["HINT"]
+                            "referencia": pregunta.answer_correct,
+                            "hint": pregunta.hint
                         }
                         st.rerun()
 
@@ -264,33 +274,45 @@ if st.session_state['role'] == "teacher":
     with tab2:
         st.subheader("📊 Estadísticas de Estudiantes")
         
-        all_submissions = db.get_all_submissions()
+        # Estadísticas, resumen por estudiante y usuarios se consultan en paralelo
+        dashboard = db_async.load_teacher_dashboard()
+        stats = dashboard["stats"]
+        resumen_estudiantes = dashboard["students"]
         
-        if all_submissions:
-            st.metric("Total de respuestas evaluadas", len(all_submissions))
-            
-            # Crear DataFrame con todas las respuestas
-            df_submissions = pd.DataFrame(all_submissions)
+        if stats["total"] > 0:
+            col1, col2, col3, col4, col5 = st.columns(5)
+            col1.metric("Total de respuestas evaluadas", stats["total"])
+            col2.metric("Correctas", stats["correctas"])
+            col3.metric("Incorrectas", stats["incorrectas"])
+            col4.metric("Revisar", stats["revisar"])
+            col5.metric("Estudiantes activos", f"{stats['students']} / {len([u for u in dashboard['users'] if u.get('role') == 'student'])}")
             
-            # Filtros
+            # Filtros (se aplican en la base de datos)
             col1, col2 = st.columns(2)
             with col1:
-                estudiantes = list(set([s['student_name'] for s in all_submissions]))
+                estudiantes = [r['group_key'] for r in resumen_estudiantes]
                 filtro_estudiante = st.selectbox("Filtrar por estudiante:", ["Todos"] + estudiantes)
             
             with col2:
                 filtro_resultado = st.selectbox("Filtrar por resultado:", ["Todos", "Correcta", "Incorrecta", "Revisar"])
             
-            # Aplicar filtros
-            df_filtered = df_submissions.copy()
-            if filtro_estudiante != "Todos":
-                df_filtered = df_filtered[df_filtered['student_name'] == filtro_estudiante]
-            if filtro_resultado != "Todos":
-                df_filtered = df_filtered[df_filtered['resultado'] == filtro_resultado]
+            # Paginación por cursor: pila con el id de inicio de cada página visitada
+            filtros = (filtro_estudiante, filtro_resultado)
+            if st.session_state.get('filtros_respuestas') != filtros:
+                st.session_state['filtros_respuestas'] = filtros
+                st.session_state['cursores_respuestas'] = [None]
+            cursores = st.session_state['cursores_respuestas']
+            
+            pagina, siguiente = db.get_submissions_page(
+                before_id=cursores[-1],
+                student_name=None if filtro_estudiante == "Todos" else filtro_estudiante,
+                resultado=None if filtro_resultado == "Todos" else filtro_resultado,
+            )
+            columnas = ['timestamp', 'student_name', 'pregunta', 'respuesta', 'resultado', 'score']
             
             # Mostrar tabla
             st.dataframe(
-                df_filtered[['timestamp', 'student_name', 'pregunta', 'respuesta', 'resultado', 'score']],
+                pd.DataFrame(pagina, columns=columnas),
                 use_container_width=True,
                 column_config={
                     "timestamp": "Fecha",
@@ -302,18 +324,87 @@ if st.session_state['role'] == "teacher":
                 }
             )
             
+            col_ant, col_pag, col_sig = st.columns([1, 2, 1])
+            if col_ant.button("⬅️ Anterior", disabled=len(cursores) == 1):
+                cursores.pop()
+                st.rerun()
+            col_pag.caption(f"Página {len(cursores)} · {db.DEFAULT_PAGE_SIZE} respuestas por página")
+            if col_sig.button("Siguiente ➡️", disabled=siguiente is None):
+                cursores.append(siguiente)
+                st.rerun()
+            
+            # Casos que el modelo no pudo decidir: la etiqueta del docente también sirve para reentrenar
+            st.divider()
+            st.subheader("🔎 Casos por revisar")
+            pendientes, _ = db.get_submissions_page(
+                limit=CASOS_POR_REVISAR,
+                resultado="Revisar",
+                columns=['student_name', 'pregunta', 'respuesta', 'resultado', 'score'],
+            )
+            if pendientes:
+                st.caption(f"Mostrando los {len(pendientes)} más recientes. Tu decisión reemplaza el resultado «Revisar».")
+                for caso in pendientes:
+                    with st.expander(f"{caso['student_name']} · {caso['pregunta']} (puntaje {caso['score']:.2f})"):
+                        st.write(caso['respuesta'])
+                        col_ok, col_mal = st.columns(2)
+                        if col_ok.button("✅ Correcta", key=f"revisar_ok_{caso['id']}"):
+                            if db.resolve_submission(caso, "Correcta"):
+                                st.rerun()
+                        if col_mal.button("❌ Incorrecta", key=f"revisar_mal_{caso['id']}"):
+                            if db.resolve_submission(caso, "Incorrecta"):
+                                st.rerun()
+            else:
+                st.success("No hay respuestas pendientes de revisión.")
+            
+            # Respuestas casi idénticas de estudiantes distintos en una misma pregunta
+            st.divider()
+            st.subheader("🧬 Posibles copias")
+            detector = near_duplicates.get_duplicate_detector()
+            if not detector.synced:
+                st.caption("Compara las respuestas de cada pregunta y agrupa las casi idénticas de estudiantes distintos.")
+                if st.button("🔍 Buscar respuestas casi idénticas"):
+                    with st.spinner("Comparando respuestas..."):
+                        try:
+                            detector.sync()
+                        except Exception as e:
+                            st.error(f"Error al buscar copias: {e}")
+                        else:
+                            st.rerun()
+            else:
+                try:
+                    # Sólo se comparan las respuestas nuevas desde la última revisión
+                    detector.sync()
+                except Exception as e:
+                    st.error(f"Error al buscar copias: {e}")
+                grupos = detector.clusters()
+                st.caption(f"{detector.indexed} respuestas analizadas · similitud ≥ {detector.threshold:.2f}")
+                if grupos:
+                    for grupo in grupos:
+                        with st.expander(f"{grupo['pregunta_id']} · {grupo['students']} estudiantes · similitud {grupo['similarity']:.2f}"):
+                            st.dataframe(
+                                pd.DataFrame(grupo['rows'], columns=['timestamp', 'student_name', 'respuesta']),
+                                use_container_width=True,
+                                hide_index=True,
+                                column_config={
+                                    "timestamp": "Fecha",
+                                    "student_name": "Estudiante",
+                                    "respuesta": "Respuesta",
+                                }
+                            )
+                else:
+                    st.success("No se encontraron respuestas casi idénticas.")
+            
             # Estadísticas generales
             st.divider()
             st.subheader("Resumen por Estudiante")
             
-            for estudiante in estudiantes:
-                student_data = [s for s in all_submissions if s['student_name'] == estudiante]
-                total = len(student_data)
-                correctas = len([s for s in student_data if s['resultado'] == 'Correcta'])
-                incorrectas = len([s for s in student_data if s['resultado'] == 'Incorrecta'])
-                revisar = len([s for s in student_data if s['resultado'] == 'Revisar'])
+            for resumen in resumen_estudiantes:
+                total = resumen['total']
+                correctas = resumen['correctas']
+                incorrectas = resumen['incorrectas']
+                revisar = resumen['revisar']
                 
-                with st.expander(f"📚 {estudiante} - {total} respuestas"):
+                with st.expander(f"📚 {resumen['group_key']} - {total} respuestas"):
                     col1, col2, col3, col4 = st.columns(4)
                     col1.metric("Total", total)
                     col2.metric("Correctas", correctas, delta=f"{(correctas/total*100):.0f}%")
@@ -324,17 +415,110 @@ if st.session_state['role'] == "teacher":
     
     with tab3:
         st.subheader("⚙️ Gestión de Preguntas")
-        if 'df_preguntas' in st.session_state and not st.session_state['df_preguntas'].empty:
-            st.dataframe(st.session_state['df_preguntas'])
+        df_preguntas = logica.cargar_dataset()
+        if not df_preguntas.empty:
+            st.dataframe(df_preguntas)
             st.download_button(
                 label="📥 Descargar Dataset",
-                data=st.session_state['df_preguntas'].to_csv(index=False).encode('utf-8'),
+                data=df_preguntas.to_csv(index=False).encode('utf-8'),
                 file_name='preguntas.csv',
                 mime='text/csv',
             )
         else:
             st.warning("No hay preguntas cargadas.")
 
+        cache_feedback = logica.obtener_cache_feedback()
+        if cache_feedback is not None:
+            st.divider()
+            st.subheader("🗃️ Caché de Feedback")
+            stats_cache = cache_feedback.stats()
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Aciertos", stats_cache["hits"])
+            col2.metric("Fallos", stats_cache["misses"])
+            col3.metric("Tasa de acierto", f"{stats_cache['hit_rate']*100:.0f}%")
+            col4.metric("Entradas", stats_cache["entries"])
+
+        st.divider()
+        st.subheader("🧠 Caché de Embeddings")
+        stats_emb = logica.obtener_cache_embeddings().stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Tasa de acierto", f"{stats_emb['hit_rate']*100:.0f}%")
+        col2.metric("Aciertos (memoria / disco)", f"{stats_emb['hits']} / {stats_emb['disk_hits']}")
+        col3.metric("Entradas", stats_emb["entries"])
+        col4.metric("Memoria en uso", f"{stats_emb['bytes_used']/1024/1024:.1f} / {stats_emb['max_bytes']/1024/1024:.0f} MB")
+
+        st.divider()
+        st.subheader("🎯 Modelo de calificación")
+        umbral_bajo, umbral_alto = logica.umbrales
+        params_modelo = logica.params or {}
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Umbral Incorrecta (t_low)", f"{umbral_bajo:.3f}")
+        col2.metric("Umbral Correcta (t_high)", f"{umbral_alto:.3f}")
+        col3.metric("Casos del docente usados", params_modelo.get("n_teacher_labels", 0))
+        st.caption(f"Último reentrenamiento: {params_modelo.get('trained_at', 'nunca')}. "
+                   "Se reajusta con las features guardadas de cada respuesta y los casos que resolviste.")
+        if st.button("🔁 Reentrenar y aplicar"):
+            with st.spinner("Reentrenando con las respuestas guardadas..."):
+                try:
+                    reporte = retrain.retrain_from_database(apply=True)
+                except retrain.NotEnoughLabels as e:
+                    st.warning(f"Todavía no se puede reentrenar: {e}")
+                except Exception as e:
+                    st.error(f"Error al reentrenar: {e}")
+                else:
+                    # Se recarga la página para que los umbrales de arriba muestren el modelo nuevo
+                    st.session_state['reporte_reentrenamiento'] = reporte
+                    st.rerun()
+        if 'reporte_reentrenamiento' in st.session_state:
+            reporte = st.session_state['reporte_reentrenamiento']
+            st.success(f"Modelo actualizado con {reporte['training_rows']} respuestas "
+                       f"({reporte['teacher_labels']} revisadas por el docente).")
+            st.json(reporte, expanded=False)
+
+        if submission_spool.spool_enabled():
+            st.divider()
+            st.subheader("📮 Cola de envíos")
+            stats_spool = submission_spool.get_submission_spool().stats()
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Pendientes", stats_spool["pending"])
+            col2.metric("Antigüedad máx.", f"{stats_spool['oldest_age_s']:.0f} s")
+            col3.metric("Escritas (este proceso)", stats_spool["flushed"])
+            col4.metric("Rechazadas", stats_spool["dead"])
+            if stats_spool["last_error"]:
+                st.caption(f"Último error: {stats_spool['last_error']}")
+            if stats_spool["dead"] and st.button("🔁 Reintentar rechazadas"):
+                # Tras corregir la causa (p. ej. aplicar una migración pendiente)
+                submission_spool.get_submission_spool().requeue_dead()
+                st.rerun()
+
+        st.divider()
+        st.subheader("⏱️ Tiempos por etapa")
+        etapas = metrics.registry.snapshot()
+        if etapas:
+            st.dataframe(pd.DataFrame([
+                {
+                    "Etapa": etapa,
+                    "Llamadas": datos["count"],
+                    "p50 (ms)": round(datos["p50_s"] * 1000, 1),
+                    "p95 (ms)": round(datos["p95_s"] * 1000, 1),
+                    "p99 (ms)": round(datos["p99_s"] * 1000, 1),
+                    "Resultados": ", ".join(f"{k}: {v}" for k, v in sorted(datos["outcomes"].items())),
+                }
+                for etapa, datos in etapas.items()
+            ]), hide_index=True, use_container_width=True)
+            st.caption(f"Percentiles sobre las últimas {metrics.registry.window} llamadas de cada etapa en este proceso.")
+        else:
+            st.info("Todavía no hay tiempos registrados en este proceso.")
+
+        col1, col2, col3 = st.columns(3)
+        col1.download_button("📥 Métricas (JSON)", data=metrics.registry.to_json(),
+                             file_name="metricas.json", mime="application/json")
+        col2.download_button("📥 Métricas (Prometheus)", data=metrics.registry.to_prometheus(),
+                             file_name="metricas.prom", mime="text/plain")
+        if col3.button("🧹 Reiniciar métricas"):
+            metrics.registry.reset()
+            st.rerun()
+
 else:
     # ========== PERFIL ESTUDIANTE ==========
     st.markdown("## 👨‍🎓 Mi trayectoria de Aprendizaje")
@@ -344,21 +528,17 @@ else:
     with tab1:
         st.info("💡 Responde las preguntas para recibir feedback automático de la IA.")
         
-        if 'df_preguntas' in st.session_state and not st.session_state['df_preguntas'].empty:
-            df = st.session_state['df_preguntas']
-            preguntas_disponibles = df['QUESTION'].tolist()
+        if len(banco) > 0:
+            preguntas_disponibles = banco.texts
             
             pregunta_elegida_texto = st.selectbox(
                 "Selecciona una pregunta:",
                 preguntas_disponibles,
-                index=preguntas_disponibles.index(st.session_state.get('current_question_text', preguntas_disponibles[0]))
-                if 'current_question_text' in st.session_state and st.session_state['current_question_text'] in preguntas_disponibles
-                else 0
+                index=banco.position(st.session_state.get('current_question_text')) or 0
             )
 
             if pregunta_elegida_texto:
-                selected_row = df[df['QUESTION'] == pregunta_elegida_texto].iloc[0]
-                selected_qid = selected_row['QUESTION_ID']
+                selected_qid = banco.by_text(pregunta_elegida_texto).question_id
                 
                 st.session_state['current_question_text'] = pregunta_elegida_texto
                 
@@ -370,18 +550,17 @@ else:
         st.divider()
         
         if st.session_state['current_qid']:
-            df = st.session_state['df_preguntas']
-            fila = df[df['QUESTION_ID'] == st.session_state['current_qid']].iloc[0]
+            pregunta = banco[st.session_state['current_qid']]
             
-            st.subheader(f"Pregunta {fila['QUESTION_ID']}")
-            st.markdown(f"### {fila['QUESTION']}")
+            st.subheader(f"Pregunta {pregunta.question_id}")
+            st.markdown(f"### {pregunta.question}")
             
             # Mostrar pista ANTES del formulario
             with st.expander("💡 Ver pista"):
-                st.write(fila["HINT"])
+                st.write(pregunta.hint)
             
             with st.form("eval_form_student"):
-                respuesta_usuario = st.text_area("Validación del pensamiento crítico:", height=150, placeholder="Escribe aquí tu explicación...", key=f"student_answer_{fila['QUESTION_ID']}")
+                respuesta_usuario = st.text_area("Validación del pensamiento crítico:", height=150, placeholder="Escribe aquí tu explicación...", key=f"student_answer_{pregunta.question_id}")
                 submitted = st.form_submit_button("📤 Enviar Respuesta")
                 
             if submitted:
@@ -389,48 +568,100 @@ else:
                     st.warning("Por favor, escribe algo antes de enviar.")
                 else:
                     with st.spinner("Evaluando tu respuesta..."):
+                        inicio_envio = time.perf_counter()
                         resultado_metricas = logica.get_semantic_similarity(
-                            model_correct=fila["ANSWER_CORRECT"],
-                            model_wrong=fila["WRONG_EXAMPLES"],
+                            model_correct=pregunta.correct_answers,
+                            model_wrong=pregunta.wrong_answers,
                             student_answer=respuesta_usuario,
-                            keywords=logica.parse_list(fila.get("KEYWORDS", []))
+                            keywords=pregunta.keywords,
+                            question_id=pregunta.question_id
                         )
                         
                         score = logica.scorer_logreg_kw(resultado_metricas)
                         interpretacion = logica.interpretar_3clases(score)
                         
-                        feedback_ia, modelo = logica.generar_feedback_genai(
-                            pregunta=fila["QUESTION"],
+                        args_feedback = dict(
+                            pregunta=pregunta.question,
                             student_answer=respuesta_usuario,
                             interpretacion=interpretacion,
-                            referencia=fila["ANSWER_CORRECT"],
-                            hint=fila["HINT"]
+                            referencia=pregunta.answer_correct,
+                            hint=pregunta.hint,
+                            question_id=pregunta.question_id
                         )
                         
-                        st.session_state['last_result'] = {
-                            "interpretacion": interpretacion,
-                            "feedback": feedback_ia,
-                            "score": score,
-                            "metrics": resultado_metricas,
-                            "referencia": fila["ANSWER_CORRECT"],
-                            "hint": fila["HINT"],
-                            "pregunta": fila["QUESTION"],
-                            "respuesta": respuesta_usuario
-                        }
-                        
                         # Guardar en archivo persistente
                         submission = {
                             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                             "username": st.session_state['username'],
                             "student_name": st.session_state['name'],
-                            "pregunta_id": fila["QUESTION_ID"],
-                            "pregunta": fila["QUESTION"][:100] + "..." if len(fila["QUESTION"]) > 100 else fila["QUESTION"],
+                            "pregunta_id": pregunta.question_id,
+                            "pregunta": pregunta.question[:100] + "..." if len(pregunta.question) > 100 else pregunta.question,
                             "respuesta": respuesta_usuario[:200] + "..." if len(respuesta_usuario) > 200 else respuesta_usuario,
+                            # Texto completo sólo si se recortó: near_duplicates.py compara la respuesta entera
+                            "respuesta_completa": respuesta_usuario if len(respuesta_usuario) > 200 else None,
                             "resultado": interpretacion,
                             "score": float(score),
-                            "feedback": feedback_ia[:200] + "..." if len(feedback_ia) > 200 else feedback_ia
+                            # Vector de features: permite reentrenar sin volver a codificar (retrain.py)
+                            "features": {f: float(resultado_metricas[f]) for f in logica.features}
+                        }
+                        
+                        diferido = feedback_worker.deferred_feedback_enabled()
+                        feedback_ia, submission_id = None, None
+                        if submission_spool.spool_enabled():
+                            # Cola local: la escritura en Supabase la hace el flusher en segundo plano
+                            spool = submission_spool.get_submission_spool()
+                            if not diferido:
+                                feedback_ia, modelo = logica.generar_feedback_genai(**args_feedback)
+                            submission["feedback"] = feedback_worker.truncate_feedback(feedback_ia) if feedback_ia else None
+                            clave = spool.enqueue(submission)
+                            if diferido:
+                                feedback_worker.get_worker_pool().submit(
+                                    clave, args_feedback,
+                                    store=lambda fb, clave=clave: submission_spool.save_feedback(clave, fb)
+                                )
+                                submission_id = clave
+                        else:
+                            guardada = None
+                            if diferido:
+                                # Modo diferido: se guarda ya con nota y etiqueta; el feedback llega después.
+                                # La clave de idempotencia localiza la fila aunque el insert no devuelva su id
+                                submission["feedback"] = None
+                                submission["idempotency_key"] = submission_spool.new_idempotency_key()
+                                guardada = db.insert_submission(submission)
+                            
+                            if guardada is not None and guardada.get("id") is not None:
+                                feedback_worker.get_worker_pool().submit(guardada["id"], args_feedback)
+                                submission_id = guardada["id"]
+                            elif guardada is not None:
+                                # Guardada sin representación (sin id): el feedback se escribe por clave
+                                clave = submission["idempotency_key"]
+                                feedback_worker.get_worker_pool().submit(
+                                    clave, args_feedback,
+                                    store=lambda fb, clave=clave: db.update_submission_feedback(clave, fb, key_column='idempotency_key')
+                                )
+                                submission_id = clave
+                            else:
+                                feedback_ia, modelo = logica.generar_feedback_genai(**args_feedback)
+                                submission["feedback"] = feedback_worker.truncate_feedback(feedback_ia)
+                                # Sin la columna idempotency_key (migración pendiente) el insert diferido falla
+                                submission.pop("idempotency_key", None)
+                                db.save_submission(submission)
+                        
+                        # Tiempo de espera del estudiante, de extremo a extremo
+                        metrics.record("app.enviar_respuesta", time.perf_counter() - inicio_envio,
+                                       "diferido" if submission_id is not None else "sincrono")
+                        
+                        st.session_state['last_result'] = {
+                            "interpretacion": interpretacion,
+                            "feedback": feedback_ia,
+                            "submission_id": submission_id,
+                            "score": score,
+                            "metrics": resultado_metricas,
+                            "referencia": pregunta.answer_correct,
+                            "hint": pregunta.hint,
+                            "pregunta": pregunta.question,
+                            "respuesta": respuesta_usuario
                         }
-                        db.save_submission(submission)
                         
                         st.rerun()
 
@@ -447,7 +678,16 @@ else:
                 st.warning(f"🤔 Tu respuesta será **REVISADA** por el docente")
             
             st.markdown("### 🤖 Guía Personalizada de Aprendizaje")
-            st.info(res['feedback'])
+            if res['feedback'] is None and res.get('submission_id') is not None:
+                # Feedback diferido: se recoge en cuanto el worker lo haya escrito
+                res['feedback'] = feedback_worker.get_worker_pool().poll(res['submission_id'])
+            
+            if res['feedback'] is None:
+                st.info("⏳ Estamos preparando tu feedback personalizado...")
+                if st.button("🔄 Actualizar feedback"):
+                    st.rerun()
+            else:
+                st.info(res['feedback'])
             
             # Mostrar la respuesta del profesor después del feedback
             st.markdown("### 📚 Respuesta del Docente")
@@ -461,16 +701,20 @@ else:
     with tab2:
         st.subheader("📊 Tu Historial de Respuestas")
         
-        my_submissions = db.get_student_submissions(st.session_state['username'])
+        # Totales (contados en la base de datos) y una página del historial, consultados en paralelo
+        cursores = st.session_state.setdefault('cursores_historial', [None])
+        historial = db_async.load_student_history(st.session_state['username'], before_id=cursores[-1])
+        stats_propias = historial["stats"]
+        my_submissions, siguiente = historial["rows"], historial["next_cursor"]
         
-        if my_submissions:
-            df_history = pd.DataFrame(my_submissions)
+        if stats_propias["total"] > 0:
+            df_history = pd.DataFrame(my_submissions, columns=list(db_async.STUDENT_HISTORY_COLUMNS))
             
             # Estadísticas del estudiante
             col1, col2, col3 = st.columns(3)
-            total = len(my_submissions)
-            correctas = len([s for s in my_submissions if s['resultado'] == 'Correcta'])
-            incorrectas = len([s for s in my_submissions if s['resultado'] == 'Incorrecta'])
+            total = stats_propias["total"]
+            correctas = stats_propias["correctas"]
+            incorrectas = stats_propias["incorrectas"]
             
             col1.metric("Total de respuestas", total)
             col2.metric("Correctas", correctas, delta=f"{(correctas/total*100):.0f}%" if total > 0 else "0%")
@@ -480,7 +724,7 @@ else:
             
             # Mostrar historial
             st.dataframe(
-                df_history[['timestamp', 'pregunta', 'respuesta', 'resultado', 'score']],
+                df_history,
                 use_container_width=True,
                 column_config={
                     "timestamp": "Fecha",
@@ -490,5 +734,14 @@ else:
                     "score": st.column_config.NumberColumn("Puntaje", format="%.2f")
                 }
             )
+            
+            col_ant, col_pag, col_sig = st.columns([1, 2, 1])
+            if col_ant.button("⬅️ Anterior", key="historial_anterior", disabled=len(cursores) == 1):
+                cursores.pop()
+                st.rerun()
+            col_pag.caption(f"Página {len(cursores)} · {db.DEFAULT_PAGE_SIZE} respuestas por página")
+            if col_sig.button("Siguiente ➡️", key="historial_siguiente", disabled=siguiente is None):
+                cursores.append(siguiente)
+                st.rerun()
         else:
             st.info("Aún no has respondido ninguna pregunta. ¡Comienza ahora!")
@@ -0,0 +1,267 @@
+"""
+Compiled question-bank artifact
+One versioned file with the pre-parsed question metadata, keyword sets and the
+float16 embeddings of every reference answer. Worker processes open it with
+np.memmap, so the embedding pages are shared through the OS page cache instead
+of each worker parsing the CSV and encoding the references itself.
+
+File layout:
+    8 bytes   magic b"EVBANK\\0\\0"
+    uint32    format version
+    uint32    reserved (0)
+    uint64    header length in bytes
+    header    UTF-8 JSON (questions, reference spans, encoder id, checksums)
+    padding   up to a 64-byte boundary
+    data      float16 array, shape (rows, dim), C order
+
+Usage:
+    python bank_artifact.py compile [--csv Dataset_preguntas_v1.csv] [--output question_bank.evbank]
+                                    [--model <SBERT model id>] [--backend torch|onnx-int8]
+    python bank_artifact.py info [question_bank.evbank]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from question_bank import Question, QuestionBank
+
+MAGIC = b"EVBANK\x00\x00"
+FORMAT_VERSION = 1
+DEFAULT_PATH = "question_bank.evbank"
+DEFAULT_CSV = "Dataset_preguntas_v1.csv"
+_PREAMBLE = struct.Struct("<8sIIQ")
+_ALIGNMENT = 64
+
+# Question fields stored in the header (everything a Question is built from)
+_QUESTION_FIELDS = (
+    'question_id', 'module', 'topic', 'question', 'hint', 'answer_correct', 'wrong_examples',
+    'correct_answers', 'wrong_answers', 'keywords',
+)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _question_record(q: Question) -> Dict:
+    record = {}
+    for field in _QUESTION_FIELDS:
+        value = getattr(q, field)
+        record[field] = list(value) if isinstance(value, tuple) else value
+    return record
+
+
+def write_artifact(path: str, bank: QuestionBank, embeddings: np.ndarray,
+                   spans: Dict[str, Tuple[int, int, int]], encoder_id: str,
+                   source_sha256: Optional[str] = None, extra: Optional[Dict] = None) -> Dict:
+    """
+    Write the artifact atomically (temporary file + rename)
+    spans: {question_id: (start, mid, end)} rows of the correct [start, mid) and wrong [mid, end) references
+    Returns: the header
+    """
+    data = np.ascontiguousarray(embeddings, dtype=np.float16)
+    if data.ndim != 2:
+        raise ValueError("embeddings must be a 2-D array")
+    content = hashlib.sha256(data.tobytes())
+    header = {
+        "format_version": FORMAT_VERSION,
+        "encoder_id": encoder_id,
+        "source_sha256": source_sha256,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dtype": "float16",
+        "shape": list(data.shape),
+        "questions": [{**_question_record(q), "span": list(spans[q.question_id])} for q in bank],
+        **(extra or {}),
+    }
+    content.update(json.dumps(header["questions"], sort_keys=True).encode("utf-8"))
+    content.update(f"{encoder_id}\x1f{FORMAT_VERSION}".encode("utf-8"))
+    # Identifies the compiled content: same CSV + same encoder -> same version
+    header["version"] = content.hexdigest()[:16]
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_offset = _PREAMBLE.size + len(header_bytes)
+    padding = -data_offset % _ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\x00" * padding)
+        f.write(data.tobytes())
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_header(path: str) -> Tuple[Dict, int]:
+    """(header, byte offset of the embeddings); raises ValueError for foreign or incompatible files"""
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise ValueError(f"{path}: truncated artifact")
+        magic, version, _, header_len = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a question-bank artifact")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: format version {version}, expected {FORMAT_VERSION} (recompile it)")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    data_offset = _PREAMBLE.size + header_len
+    return header, data_offset + (-data_offset % _ALIGNMENT)
+
+
+class BankArtifact:
+    """An opened artifact: the QuestionBank plus read-only, memory-mapped reference embeddings"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header, offset = read_header(path)
+        rows, dim = self.header["shape"]
+        if rows:
+            mapped = np.memmap(path, dtype=np.float16, mode="r", offset=offset, shape=(rows, dim))
+            # Plain ndarray view over the shared mapping: slices and matmuls never copy the file
+            self.embeddings = mapped.view(np.ndarray)
+        else:
+            self.embeddings = np.zeros((0, dim), dtype=np.float16)
+        self.bank = QuestionBank(
+            Question(**{field: q[field] for field in _QUESTION_FIELDS}) for q in self.header["questions"]
+        )
+        self.spans = {q["question_id"]: tuple(q["span"]) for q in self.header["questions"]}
+
+    @property
+    def version(self) -> str:
+        return self.header["version"]
+
+    @property
+    def encoder_id(self) -> str:
+        return self.header["encoder_id"]
+
+    @property
+    def source_sha256(self) -> Optional[str]:
+        return self.header.get("source_sha256")
+
+    def reference_index(self, factory=tuple) -> Dict:
+        """{question_id: factory(correct_rows, wrong_rows)} as views into the mapping"""
+        emb = self.embeddings
+        return {
+            qid: factory(emb[start:mid], emb[mid:end])
+            for qid, (start, mid, end) in self.spans.items()
+        }
+
+
+def reference_spans(bank: QuestionBank, clean) -> Tuple[List[str], Dict[str, Tuple[int, int, int]]]:
+    """All cleaned reference texts in artifact row order, with each question's (start, mid, end)"""
+    texts, spans = [], {}
+    for q in bank:
+        correct = [clean(ref) for ref in q.correct_answers]
+        wrong = [clean(ref) for ref in q.wrong_answers]
+        start = len(texts)
+        texts.extend(correct)
+        texts.extend(wrong)
+        spans[q.question_id] = (start, start + len(correct), len(texts))
+    return texts, spans
+
+
+def float16_error(embeddings: np.ndarray, spans: Dict[str, Tuple[int, int, int]]) -> float:
+    """Largest change of a reference-reference cosine similarity caused by storing float16"""
+    low = embeddings.astype(np.float16).astype(np.float32)
+    error = 0.0
+    for start, _, end in spans.values():
+        if end > start:
+            block, block16 = embeddings[start:end], low[start:end]
+            error = max(error, float(np.abs(block @ block.T - block16 @ block16.T).max()))
+    return error
+
+
+def compile_artifact(output: str = DEFAULT_PATH, csv_path: str = DEFAULT_CSV, encoder=None,
+                     encoder_id: Optional[str] = None, batch_size: int = 64) -> Dict:
+    """
+    Parse the CSV, encode every reference answer once and write the artifact
+    encoder / encoder_id default to the app's SBERT model and backend (SBERT_BACKEND)
+    Returns: the header
+    """
+    import pandas as pd
+    import logica
+
+    if encoder is None:
+        encoder = logica.cargar_modelo_sbert()
+        encoder_id = logica.identificador_encoder()
+    elif encoder_id is None:
+        raise ValueError("encoder_id is required with a custom encoder")
+
+    bank = QuestionBank.from_dataframe(pd.read_csv(csv_path))
+    texts, spans = reference_spans(bank, logica.preprocess_text)
+    start = time.perf_counter()
+    if texts:
+        embeddings = np.asarray(
+            encoder.encode(texts, normalize_embeddings=True, convert_to_numpy=True, batch_size=batch_size),
+            dtype=np.float32,
+        )
+    else:
+        embeddings = np.zeros((0, encoder.get_sentence_embedding_dimension()), dtype=np.float32)
+    encode_s = time.perf_counter() - start
+
+    return write_artifact(
+        output, bank, embeddings, spans, encoder_id,
+        source_sha256=file_sha256(csv_path),
+        extra={"encode_s": round(encode_s, 3), "float16_max_abs_error": float16_error(embeddings, spans)},
+    )
+
+
+def _summary(header: Dict, path: str) -> str:
+    rows, dim = header["shape"]
+    return "\n".join([
+        f"{path}",
+        f"  version:      {header['version']} (format {header['format_version']})",
+        f"  encoder:      {header['encoder_id']}",
+        f"  questions:    {len(header['questions'])}",
+        f"  references:   {rows} x {dim} float16 ({rows * dim * 2 / 1024:.1f} KiB)",
+        f"  source csv:   {header.get('source_sha256')}",
+        f"  fp16 error:   {header.get('float16_max_abs_error', 'n/a')}",
+        f"  created at:   {header['created_at']}",
+    ])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_cmd = commands.add_parser("compile", help="build the artifact from the CSV and the SBERT model")
+    compile_cmd.add_argument("--csv", default=DEFAULT_CSV)
+    compile_cmd.add_argument("--output", default=DEFAULT_PATH)
+    compile_cmd.add_argument("--model", help="SBERT model id (default: the app's model)")
+    compile_cmd.add_argument("--backend", choices=("torch", "onnx-int8"), help="default: SBERT_BACKEND or torch")
+    info_cmd = commands.add_parser("info", help="print an artifact's header")
+    info_cmd.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        header, _ = read_header(args.path)
+        print(_summary(header, args.path))
+        return 0
+
+    if args.backend:
+        os.environ["SBERT_BACKEND"] = args.backend
+    encoder = encoder_id = None
+    if args.model:
+        import logica
+        if args.model != logica.SBERT_MODEL_ID:
+            # Only the app's model can be served by logica; other ids are compiled with torch
+            from sentence_transformers import SentenceTransformer
+            encoder, encoder_id = SentenceTransformer(args.model), f"{args.model}:torch"
+    header = compile_artifact(args.output, args.csv, encoder, encoder_id)
+    print(_summary(header, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
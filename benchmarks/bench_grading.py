@@ -0,0 +1,217 @@
+"""
+Micro-benchmarks for the grading hot path and the database calls
+Runs offline: a deterministic stub encoder (and the real SBERT model when it
+can be loaded), an in-memory fake Supabase client and a temporary SQLite
+database for the local storage backend. Fixtures come from
+Dataset_preguntas_v1.csv at 1x, 10x and 100x scale.
+
+Reports per-stage latency percentiles and allocations and compares p50
+against benchmarks/baseline.json; exits 1 on a regression.
+
+Usage:
+    python benchmarks/bench_grading.py [--encoders stub real] [--scales 1 10 100]
+                                       [--tolerance 0.5] [--update-baseline [STAGE ...]] [--output results.json]
+
+--update-baseline with stage names (e.g. db.get_submissions_page) records only
+those stages; the other baseline entries keep their numbers.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+os.chdir(REPO_ROOT)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+# Measure the encoder itself, not the embedding / feedback caches
+os.environ.setdefault("EMBEDDING_CACHE_MB", "0")
+os.environ.setdefault("FEEDBACK_CACHE_PATH", "")
+
+import fixtures  # noqa: E402
+from fakes import FakeSupabase, HashingEncoder  # noqa: E402
+from storage_sqlite import SQLiteBackend  # noqa: E402
+from storage_supabase import SupabaseBackend  # noqa: E402
+
+# Differences below this many ms are noise, never a regression
+NOISE_FLOOR_MS = 0.05
+ALLOC_SAMPLES = 200
+
+
+def measure(fn, calls):
+    """Time fn(*args) for every args tuple; track allocations on a sample of calls"""
+    latencies = np.empty(len(calls))
+    for i, args in enumerate(calls):
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies[i] = (time.perf_counter() - t0) * 1000
+
+    peaks = []
+    tracemalloc.start()
+    for args in calls[:ALLOC_SAMPLES]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        "calls": len(calls),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "alloc_kib": round(float(np.mean(peaks)) / 1024, 2) if peaks else 0.0,
+    }
+
+
+def load_encoder(name):
+    if name == "stub":
+        return HashingEncoder()
+    import logica
+    try:
+        return logica.cargar_modelo_sbert()
+    except Exception as e:
+        print(f"[skip] real encoder not available: {e}")
+        return None
+
+
+def run_scale(logica, db, bank, scale, max_calls, rng):
+    answers = fixtures.make_answers(bank, scale)
+    sample = answers if len(answers) <= max_calls else rng.sample(answers, max_calls)
+    keywords = {qid: logica.parse_list(kw) for qid, kw in zip(bank["QUESTION_ID"], bank["KEYWORDS"])}
+    refs = {qid: (c, w) for qid, c, w in zip(bank["QUESTION_ID"], bank["ANSWER_CORRECT"], bank["WRONG_EXAMPLES"])}
+
+    results = {}
+    results["preprocess_text"] = measure(logica.preprocess_text, [(a,) for _, a in sample])
+    results["get_keyword_coverage"] = measure(
+        logica.get_keyword_coverage, [(a, keywords[q]) for q, a in sample]
+    )
+    results["get_semantic_similarity"] = measure(
+        lambda q, a: logica.get_semantic_similarity(refs[q][0], refs[q][1], a, keywords[q], question_id=q),
+        [(q, a) for q, a in sample],
+    )
+    features = [logica.get_semantic_similarity(refs[q][0], refs[q][1], a, keywords[q], question_id=q)
+                for q, a in sample[:500]]
+    results["scorer_logreg_kw"] = measure(logica.scorer_logreg_kw, [(f,) for f in features])
+
+    qids = [q for q, _ in answers]
+    texts = [a for _, a in answers]
+    batch = measure(logica.grade_batch, [(qids, texts)] * 3)
+    batch["answers"] = len(answers)
+    batch["us_per_answer"] = round(batch["p50_ms"] * 1000 / len(answers), 2)
+    results["grade_batch"] = batch
+
+    # --- database.py against the in-memory fake ---
+    submissions = fixtures.make_submissions(answers)
+    fake = FakeSupabase()
+    db.backend = SupabaseBackend(fake)
+    new_rows = [{k: v for k, v in s.items() if k != "id"} for s in submissions[:min(len(submissions), max_calls)]]
+    results["db.save_submission"] = measure(db.save_submission, [(dict(r),) for r in new_rows])
+    fake.tables["submissions"] = [dict(s) for s in submissions]
+    results["db.get_submissions_page"] = measure(db.get_submissions_page, [()] * 20)
+    results["db.get_submission_stats"] = measure(db.get_submission_stats, [()] * 20)
+
+    # --- the same calls on the local SQLite backend ---
+    with tempfile.TemporaryDirectory() as tmp:
+        db.backend = SQLiteBackend(os.path.join(tmp, "bench.sqlite3"))
+        results["sqlite.save_submission"] = measure(db.save_submission, [(dict(r),) for r in new_rows])
+        db.backend.upsert_submissions([
+            {**{k: v for k, v in s.items() if k != "id"}, "idempotency_key": f"bench-{s['id']}"}
+            for s in submissions
+        ])
+        results["sqlite.get_submissions_page"] = measure(db.get_submissions_page, [()] * 20)
+        results["sqlite.get_submission_stats"] = measure(db.get_submission_stats, [()] * 20)
+        db.backend.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, stats in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        limit = base["p50_ms"] * (1 + tolerance)
+        if stats["p50_ms"] > limit and stats["p50_ms"] - base["p50_ms"] > NOISE_FLOOR_MS:
+            regressions.append((key, base["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--encoders", nargs="+", default=["stub", "real"], choices=["stub", "real"])
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument("--max-calls", type=int, default=2000, help="per-call stages sample at most this many answers")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative p50 slowdown vs baseline")
+    parser.add_argument("--update-baseline", nargs="*", metavar="STAGE",
+                        help="record the results in baseline.json (only these stages when given)")
+    parser.add_argument("--output", help="write the raw results as JSON")
+    args = parser.parse_args()
+
+    import database as db
+    import logica
+
+    bank = fixtures.load_bank()
+    rng = random.Random(0)
+    flat = {}
+    for encoder_name in args.encoders:
+        encoder = load_encoder(encoder_name)
+        if encoder is None:
+            continue
+        logica.configurar_encoder(encoder)
+        for scale in args.scales:
+            # database.py prints on every call; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = run_scale(logica, db, bank, scale, args.max_calls, rng)
+            for stage, stats in results.items():
+                flat[f"{encoder_name}/{scale}x/{stage}"] = stats
+
+    print(f"{'stage':<44} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc KiB':>10}")
+    for key, s in flat.items():
+        print(f"{key:<44} {s['calls']:>6} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} {s['p99_ms']:>9.3f} {s['alloc_kib']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(flat, f, indent=2)
+
+    if args.update_baseline is not None:
+        baseline = {}
+        if os.path.exists(BASELINE):
+            with open(BASELINE) as f:
+                baseline = json.load(f)
+        stages = set(args.update_baseline)
+        baseline.update({key: s for key, s in flat.items() if not stages or key.rsplit("/", 1)[1] in stages})
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline updated: {BASELINE}")
+        return 0
+
+    if not os.path.exists(BASELINE):
+        print("\nNo baseline yet; run with --update-baseline to record one")
+        return 0
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    regressions = compare(flat, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS (p50 more than {args.tolerance:.0%} slower than baseline):")
+        for key, base, now in regressions:
+            print(f"  {key}: {base:.3f} ms -> {now:.3f} ms")
+        return 1
+    print("\nOK: no p50 regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Compare SBERT encoder backends (fp32 torch vs int8 ONNX)
+Reports load time, per-answer encode latency and peak RSS of each backend,
+plus a parity check of cosine similarities on Dataset_preguntas_v1.csv
+
+Usage:
+    python benchmarks/encoder_backends.py [--backends torch onnx-int8] [--tolerance 0.02]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup_repo_path():
+    os.chdir(REPO_ROOT)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+
+def _sample_texts(logica):
+    """Reference answers of the whole bank, used as stand-in student answers"""
+    df = logica.cargar_dataset()
+    texts = []
+    for correct, wrong in zip(df['ANSWER_CORRECT'], df['WRONG_EXAMPLES']):
+        texts.extend(logica._limpiar_referencias(correct))
+        texts.extend(logica._limpiar_referencias(wrong))
+    return texts
+
+
+def run_child(backend: str) -> dict:
+    """Measure one backend in a fresh process so RSS numbers don't mix"""
+    _setup_repo_path()
+    os.environ["SBERT_BACKEND"] = backend
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    import logica
+    encoder = logica.cargar_modelo_sbert(backend)
+    load_s = time.perf_counter() - start
+
+    texts = _sample_texts(logica)
+    encoder.encode(texts[:8], normalize_embeddings=True)  # warm-up
+
+    latencies = []
+    for text in texts:
+        t0 = time.perf_counter()
+        encoder.encode([text], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    encoder.encode(texts, normalize_embeddings=True, batch_size=64)
+    batch_s = time.perf_counter() - t0
+
+    # ru_maxrss is in KiB on Linux
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "encode_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "encode_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "batch_texts_per_s": round(len(texts) / batch_s, 1),
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "rss_delta_mb": round((rss_after - rss_before) / 1024, 1),
+        "n_texts": len(texts),
+    }
+
+
+def run_parity(base: str, candidate: str, tolerance: float) -> dict:
+    _setup_repo_path()
+    import logica
+
+    return logica.verificar_paridad_encoder(
+        logica.cargar_modelo_sbert(base), logica.cargar_modelo_sbert(candidate), tolerancia=tolerance
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-int8"])
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child)))
+        return 0
+
+    results = []
+    for backend in args.backends:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", backend],
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'backend':<12} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'texts/s':>9} {'peak RSS MB':>12}")
+    for r in results:
+        print(f"{r['backend']:<12} {r['load_s']:>8} {r['encode_ms_p50']:>8} {r['encode_ms_p95']:>8} "
+              f"{r['batch_texts_per_s']:>9} {r['peak_rss_mb']:>12}")
+
+    base = results[0]
+    for r in results[1:]:
+        print(f"\n{r['backend']} vs {base['backend']}: "
+              f"p50 {r['encode_ms_p50'] - base['encode_ms_p50']:+.2f} ms, "
+              f"RSS {r['peak_rss_mb'] - base['peak_rss_mb']:+.1f} MB")
+        parity = run_parity(base['backend'], r['backend'], args.tolerance)
+        status = "OK" if parity["ok"] else "FAIL"
+        print(f"parity: max |Δcos| = {parity['max_abs_diff']:.4f}, "
+              f"mean = {parity['mean_abs_diff']:.4f} (tolerance {args.tolerance}) -> {status}")
+        if not parity["ok"]:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""
+Offline stand-ins for the benchmark suite
+- HashingEncoder: deterministic bag-of-words encoder with the SentenceTransformer interface
+- FakeSupabase: in-memory client implementing the query-builder calls database.py uses
+- PostgrestStub: a FakeSupabase served over HTTP, for the real (sync and async) supabase clients
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+
+class HashingEncoder:
+    """Hashes words into a fixed-size vector; fast, deterministic, no model download"""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _word_index(self, word: str) -> int:
+        return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") % self.dim
+
+    def encode(self, texts, normalize_embeddings: bool = False, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                out[row, self._word_index(word)] += 1.0
+            out[row, 0] += 1e-3  # never an all-zero vector
+        if normalize_embeddings:
+            out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out[0] if single else out
+
+
+class FakeResponse:
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeAPIError(Exception):
+    """Mimics postgrest.exceptions.APIError (message + code)"""
+
+    def __init__(self, message: str, code: str):
+        super().__init__({"message": message, "code": code})
+        self.message = message
+        self.code = code
+
+
+class FakeQuery:
+    """Subset of the postgrest query builder: filters, order, limit and writes"""
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self._client = client
+        self._table = table
+        self._filters: List[Callable[[Dict], bool]] = []
+        self._columns: Optional[List[str]] = None
+        self._order = None
+        self._limit: Optional[int] = None
+        self._write = None
+
+    # --- reads ---
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self._filters.append(lambda r: r.get(column) != value)
+        return self
+
+    def lt(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r.get(column) < value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r.get(column) > value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def is_(self, column, value):
+        target = None if value in (None, "null") else value
+        self._filters.append(lambda r: r.get(column) is target)
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    # --- writes ---
+    def insert(self, data, **kwargs):
+        self._write = ("insert", data, kwargs)
+        return self
+
+    def upsert(self, data, **kwargs):
+        self._write = ("upsert", data, kwargs)
+        return self
+
+    def update(self, data):
+        self._write = ("update", data, {})
+        return self
+
+    def delete(self):
+        self._write = ("delete", None, {})
+        return self
+
+    def _matches(self, row: Dict) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def execute(self) -> FakeResponse:
+        rows = self._client.tables[self._table]
+        if self._write is not None:
+            return self._client._apply_write(self._table, self, *self._write)
+
+        selected = [r for r in rows if self._matches(r)]
+        if self._order is not None:
+            column, desc = self._order
+            selected.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        if self._limit is not None:
+            selected = selected[:self._limit]
+        if self._columns is None:
+            data = [dict(r) for r in selected]
+        else:
+            data = [{c: r.get(c) for c in self._columns} for r in selected]
+        return FakeResponse(data, count=len(data))
+
+
+class FakeSupabase:
+    """
+    In-memory replacement for the supabase Client
+    Unique columns raise FakeAPIError code 23505 like Postgres; rpc() functions can be registered
+    """
+
+    def __init__(self, unique: Optional[Dict[str, List[str]]] = None):
+        self.tables: Dict[str, List[Dict]] = defaultdict(list)
+        self.unique = unique if unique is not None else {"users": ["username"]}
+        self.functions: Dict[str, Callable] = {}
+        self.requests = 0
+        self._next_id: Dict[str, int] = defaultdict(lambda: 1)
+
+    def table(self, name: str) -> FakeQuery:
+        self.requests += 1
+        return FakeQuery(self, name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None):
+        self.requests += 1
+        if fn not in self.functions:
+            raise FakeAPIError(f"Could not find the function public.{fn}", "PGRST202")
+        result = self.functions[fn](self, **(params or {}))
+        return type("FakeRPC", (), {"execute": lambda _self: FakeResponse(result)})()
+
+    def _conflict(self, table: str, row: Dict, columns: List[str]) -> Optional[Dict]:
+        for existing in self.tables[table]:
+            if all(existing.get(c) == row.get(c) for c in columns):
+                return existing
+        return None
+
+    def _apply_write(self, table: str, query: FakeQuery, kind: str, data, kwargs) -> FakeResponse:
+        rows = self.tables[table]
+        if kind == "update":
+            changed = [r for r in rows if query._matches(r)]
+            for r in changed:
+                r.update(data)
+            return FakeResponse([dict(r) for r in changed])
+        if kind == "delete":
+            removed = [r for r in rows if query._matches(r)]
+            self.tables[table] = [r for r in rows if not query._matches(r)]
+            return FakeResponse(removed)
+
+        records = data if isinstance(data, list) else [data]
+        written = []
+        for record in records:
+            record = dict(record)
+            conflict_cols = [c.strip() for c in kwargs.get("on_conflict", "").split(",") if c.strip()]
+            for columns in [conflict_cols] + [[c] for c in self.unique.get(table, [])]:
+                if not columns or any(record.get(c) is None for c in columns):
+                    continue
+                existing = self._conflict(table, record, columns)
+                if existing is None:
+                    continue
+                if kind == "upsert" and columns == conflict_cols:
+                    if not kwargs.get("ignore_duplicates"):
+                        existing.update(record)
+                        written.append(dict(existing))
+                    break
+                raise FakeAPIError(f"duplicate key value violates unique constraint on {columns}", "23505")
+            else:
+                record.setdefault("id", self._next_id[table])
+                self._next_id[table] = max(self._next_id[table], record["id"]) + 1
+                rows.append(record)
+                written.append(dict(record))
+        return FakeResponse(written)
+
+
+# --- PostgREST over HTTP ---
+
+# Key accepted by supabase.create_client (it only checks the JWT shape)
+STUB_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c3R1Yg"
+
+_ERROR_STATUS = {"PGRST202": 404, "23505": 409}
+
+
+def _coerce(raw: str, like):
+    """PostgREST sends every filter value as text; compare it as the stored value's type"""
+    if isinstance(like, bool):
+        return raw == "true"
+    if isinstance(like, (int, float)):
+        return type(like)(raw)
+    return raw
+
+
+def _postgrest_filter(column: str, expr: str) -> Callable[[Dict], bool]:
+    """Row predicate for a `column=op.value` query parameter (eq, neq, lt, gt, in, is)"""
+    op, _, raw = expr.partition(".")
+    if op == "is":
+        return lambda r: r.get(column) is None if raw == "null" else r.get(column) is (raw == "true")
+    if op == "in":
+        values = [v.strip().strip('"') for v in raw.strip("()").split(",")]
+        return lambda r: r.get(column) is not None and str(r.get(column)) in values
+    compare = {
+        "eq": lambda a, b: a == b,
+        "neq": lambda a, b: a != b,
+        "lt": lambda a, b: a < b,
+        "gt": lambda a, b: a > b,
+    }[op]
+
+    def matches(row: Dict) -> bool:
+        value = row.get(column)
+        if value is None:
+            return False
+        try:
+            return compare(value, _coerce(raw, value))
+        except (TypeError, ValueError):
+            return False
+    return matches
+
+
+class _PostgrestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub: "PostgrestStub"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body=None):
+        payload = b"" if body is None else json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null") if length else None
+        url = urlsplit(self.path)
+        name = url.path.rstrip("/").rsplit("/", 1)[-1]
+        params = parse_qsl(url.query, keep_blank_values=True)
+        prefer = self.headers.get("Prefer", "")
+        try:
+            status, data = self.stub.dispatch(method, "/rpc/" in url.path, name, params, body, prefer)
+        except FakeAPIError as e:
+            self._send(_ERROR_STATUS.get(e.code, 400), {"message": e.message, "code": e.code, "details": None, "hint": None})
+            return
+        self._send(status, None if "return=minimal" in prefer else data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_HEAD(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class PostgrestStub:
+    """
+    Serves a FakeSupabase on 127.0.0.1 with the PostgREST URL grammar (/rest/v1/<table>, /rest/v1/rpc/<fn>),
+    so SUPABASE_URL can point at it. `delay` is added to every request outside the data lock,
+    and `max_in_flight` records how many requests overlapped
+    """
+
+    def __init__(self, client: Optional[FakeSupabase] = None, delay: float = 0.0):
+        self.client = client if client is not None else FakeSupabase()
+        self.delay = delay
+        self.requests: List[tuple] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        handler = type("Handler", (_PostgrestHandler,), {"stub": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "PostgrestStub":
+        threading.Thread(target=self._server.serve_forever, name="postgrest-stub", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "PostgrestStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def dispatch(self, method: str, is_rpc: bool, name: str, params: List[tuple], body, prefer: str):
+        with self._lock:
+            self.requests.append((method, "rpc/" + name if is_rpc else name))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            with self._lock:
+                return self._execute(method, is_rpc, name, params, body, prefer)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _execute(self, method: str, is_rpc: bool, name: str, params: List[tuple], body, prefer: str):
+        if is_rpc:
+            return 200, self.client.rpc(name, body or {}).execute().data
+
+        query = self.client.table(name)
+        options = {}
+        for key, value in params:
+            if key in ("select", "columns"):
+                if key == "select":
+                    query.select(value)
+            elif key == "order":
+                column, _, direction = value.partition(".")
+                query.order(column, desc=direction.startswith("desc"))
+            elif key in ("limit", "on_conflict"):
+                options[key] = value
+            else:
+                query._filters.append(_postgrest_filter(key, value))
+        if "limit" in options:
+            query.limit(int(options["limit"]))
+
+        if method == "GET":
+            return 200, query.execute().data
+        if method == "POST":
+            if "resolution=" in prefer:
+                query.upsert(body, on_conflict=options.get("on_conflict", ""),
+                             ignore_duplicates="ignore-duplicates" in prefer)
+            else:
+                query.insert(body)
+            return 201, query.execute().data
+        if method == "PATCH":
+            return 200, query.update(body).execute().data
+        return 200, query.delete().execute().data
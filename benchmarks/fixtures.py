@@ -0,0 +1,68 @@
+"""
+Deterministic benchmark fixtures generated from Dataset_preguntas_v1.csv
+Scale 1 = every reference answer of the bank once; scale N = N perturbed variants of each
+"""
+
+import os
+import random
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(REPO_ROOT, "Dataset_preguntas_v1.csv")
+
+RESULTS = ("Correcta", "Incorrecta", "Revisar")
+
+
+def load_bank() -> pd.DataFrame:
+    return pd.read_csv(DATASET)
+
+
+def _perturb(text: str, keywords: List[str], rng: random.Random) -> str:
+    """Drop/swap a few words and sometimes add a keyword, like a paraphrased student answer"""
+    words = text.split()
+    if len(words) > 3:
+        words = [w for w in words if rng.random() > 0.2] or words
+        i, j = rng.randrange(len(words)), rng.randrange(len(words))
+        words[i], words[j] = words[j], words[i]
+    if keywords and rng.random() < 0.5:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+    return " ".join(words)
+
+
+def make_answers(bank: pd.DataFrame, scale: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """(QUESTION_ID, answer) pairs; scale 1 is the unmodified reference answers"""
+    from logica import parse_list
+
+    rng = random.Random(seed)
+    answers = []
+    for row in bank.itertuples(index=False):
+        keywords = [str(k) for k in (parse_list(row.KEYWORDS) or [])]
+        references = list(parse_list(row.ANSWER_CORRECT)) + list(parse_list(row.WRONG_EXAMPLES))
+        for ref in references:
+            answers.append((row.QUESTION_ID, str(ref)))
+            for _ in range(scale - 1):
+                answers.append((row.QUESTION_ID, _perturb(str(ref), keywords, rng)))
+    return answers
+
+
+def make_submissions(answers: List[Tuple[str, str]], n_students: int = 30, seed: int = 0) -> List[Dict]:
+    """Submission rows shaped like the `submissions` table"""
+    rng = random.Random(seed)
+    rows = []
+    for i, (qid, answer) in enumerate(answers, start=1):
+        student = rng.randrange(n_students)
+        rows.append({
+            "id": i,
+            "timestamp": f"2025-01-{1 + i % 28:02d} 10:00:00",
+            "username": f"student{student}",
+            "student_name": f"Estudiante {student}",
+            "pregunta_id": qid,
+            "pregunta": f"Pregunta {qid}",
+            "respuesta": answer[:200],
+            "resultado": rng.choice(RESULTS),
+            "score": round(rng.random(), 4),
+            "feedback": "Feedback de prueba",
+        })
+    return rows
@@ -0,0 +1,65 @@
+"""
+Import-time report for the app modules
+Runs `python -X importtime` in a clean interpreter, prints the slowest imports
+and fails if importing the login-path modules pulls in the ML stack
+
+Usage:
+    python benchmarks/import_time.py [--modules logica database] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported before the first grading request
+HEAVY_MODULES = ("torch", "sentence_transformers", "sklearn", "nltk", "google.genai", "joblib")
+
+
+def parse_importtime(stderr: str):
+    """Parse `-X importtime` lines into (cumulative_us, self_us, module) tuples"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["logica"])
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    code = "; ".join(f"import {m}" for m in args.modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        return proc.returncode
+
+    rows = parse_importtime(proc.stderr)
+    loaded = {name.strip() for _, _, name in rows}
+    total_us = sum(self_us for _, self_us, _ in rows)
+
+    print(f"import {' '.join(args.modules)}: {total_us / 1e6:.3f} s total, {len(rows)} modules")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    heavy = [m for m in HEAVY_MODULES if m in loaded]
+    if heavy:
+        print(f"\nFAIL: heavy modules imported eagerly: {', '.join(heavy)}")
+        return 1
+    print("\nOK: no ML stack imported at module load")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,482 @@
+"""
+Offline bulk grading of exported answers
+Reads a CSV or JSONL of (question_id, student, answer) rows in chunks, grades
+the chunks in a process pool (each worker loads the encoder, reference index
+and scorer once, then calls logica.grade_batch) and writes features, score and
+label incrementally to CSV or Parquet. A checkpoint file records the finished
+chunks, so an interrupted run resumes where it stopped. Optional AI feedback
+runs in a separate thread with its own requests-per-minute limit.
+
+Usage:
+    python bulk_grade.py answers.csv --output graded.csv
+    python bulk_grade.py answers.jsonl --output graded_parquet --format parquet --workers 4
+    python bulk_grade.py answers.csv --output graded.csv --feedback --feedback-rpm 15
+    python bulk_grade.py answers.csv --output graded.csv --stemmed-keywords   # adds kw_stem_* columns
+
+Re-running the same command resumes; --restart discards previous results.
+"""
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+CHECKPOINT_VERSION = 1
+INPUT_COLUMNS = ("question_id", "student", "answer")
+FEEDBACK_LABELS = ("Correcta", "Incorrecta", "Revisar")
+# Native thread pools sized by environment; set for the workers before they import anything
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+# ==================== INPUT ====================
+
+def detect_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def output_format(args) -> str:
+    return args.format or ("parquet" if args.output.lower().endswith(".parquet") else "csv")
+
+
+def read_chunks(path: str, chunk_size: int, columns: Dict[str, str]) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    (chunk id, DataFrame with question_id / student / answer) for consecutive chunks of the input
+    columns maps those names to the input's column names
+    """
+    if detect_format(path) == "jsonl":
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False)
+    else:
+        reader = pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    with reader:
+        for chunk_id, chunk in enumerate(reader):
+            missing = [c for c in columns.values() if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"{path}: missing columns {missing}")
+            frame = pd.DataFrame({name: chunk[source] for name, source in columns.items()})
+            yield chunk_id, frame.fillna("").astype(str)
+
+
+# ==================== WORKERS ====================
+
+def _init_worker(threads: int) -> None:
+    """Load everything grade_batch needs once per worker process"""
+    import logica
+    logica.obtener_encoder()
+    # torch sizes its intra-op pool from the core count: N workers would each start N threads
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    logica.cargar_indice_referencias()
+    logica.cargar_matchers_keywords()
+    logica.obtener_modelo_lineal()
+
+
+def grade_chunk(chunk_id: int, first_row: int, frame: pd.DataFrame,
+                stemmed_keywords: bool = False) -> Tuple[int, pd.DataFrame, float]:
+    """
+    Grade one chunk; rows whose question_id is not in the bank get an error instead of a label
+    stemmed_keywords adds the kw_stem_* coverage columns (reporting only, not part of the score)
+    """
+    import logica
+    from keyword_matcher import STEMMED_FEATURES
+
+    start = time.perf_counter()
+    banco = logica.cargar_banco_preguntas()
+    result = frame.reset_index(drop=True)
+    result.insert(0, "row", range(first_row, first_row + len(result)))
+    known = result["question_id"].map(lambda qid: qid in banco).to_numpy()
+
+    output_columns = logica.features + ["score"] + (list(STEMMED_FEATURES) if stemmed_keywords else [])
+    for column in output_columns:
+        result[column] = float("nan")
+    result["label"] = None
+    if known.any():
+        graded = logica.grade_batch(result.loc[known, "question_id"].tolist(), result.loc[known, "answer"].tolist(),
+                                    stemmed_keywords=stemmed_keywords)
+        for column in output_columns:
+            result.loc[known, column] = graded[column].to_numpy()
+        result.loc[known, "label"] = graded["interpretacion"].to_numpy()
+    result["error"] = None
+    result.loc[~known, "error"] = "QUESTION_ID desconocido"
+    return chunk_id, result, time.perf_counter() - start
+
+
+# ==================== OUTPUT AND CHECKPOINT ====================
+
+class Checkpoint:
+    """JSON file with the finished chunks, written atomically after every committed chunk"""
+
+    def __init__(self, path: str, identity: Dict):
+        self.path = path
+        self.identity = identity
+        self.done: Set[int] = set()
+        self.csv_bytes = 0
+        self.rows = 0
+        self.labels: Counter = Counter()
+        self.errors = 0
+
+    @classmethod
+    def load(cls, path: str, identity: Dict) -> "Checkpoint":
+        checkpoint = cls(path, identity)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != CHECKPOINT_VERSION or data.get("identity") != identity:
+            raise SystemExit(
+                f"{path} belongs to a different run (input, chunk size or output changed); "
+                "use --restart to start over"
+            )
+        checkpoint.done = set(data["done"])
+        checkpoint.csv_bytes = data.get("csv_bytes", 0)
+        checkpoint.rows = data.get("rows", 0)
+        checkpoint.labels = Counter(data.get("labels", {}))
+        checkpoint.errors = data.get("errors", 0)
+        return checkpoint
+
+    def commit(self, chunk_id: int, result: pd.DataFrame, csv_bytes: int = 0) -> None:
+        self.done.add(chunk_id)
+        self.csv_bytes = csv_bytes
+        self.rows += len(result)
+        self.labels.update(result["label"].dropna())
+        self.errors += int(result["error"].notna().sum())
+        self.save()
+
+    def save(self, **extra) -> None:
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "identity": self.identity,
+            "done": sorted(self.done),
+            "csv_bytes": self.csv_bytes,
+            "rows": self.rows,
+            "labels": dict(self.labels),
+            "errors": self.errors,
+            **extra,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class CsvWriter:
+    """Appends chunks to one CSV; a resumed run first cuts off anything written after the last commit"""
+
+    def __init__(self, path: str, committed_bytes: int):
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self._file = open(path, mode)
+        self._file.truncate(committed_bytes)
+        self._file.seek(committed_bytes)
+
+    def write(self, result: pd.DataFrame) -> int:
+        """Write and fsync a chunk; returns the committed file size"""
+        header = self._file.tell() == 0
+        self._file.write(result.to_csv(index=False, header=header).encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter:
+    """One part file per chunk in the output directory (rewritten atomically if a chunk is redone)"""
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, result: pd.DataFrame) -> int:
+        part = os.path.join(self.path, f"part-{int(result['row'].iloc[0]):09d}.parquet")
+        result.to_parquet(f"{part}.tmp", index=False)
+        os.replace(f"{part}.tmp", part)
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+def read_output(path: str, output_format: str) -> Iterator[pd.DataFrame]:
+    """Graded rows already written (used to resume feedback)"""
+    if not os.path.exists(path):
+        return
+    if output_format == "parquet":
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet"):
+                yield pd.read_parquet(os.path.join(path, name))
+    elif os.path.getsize(path):
+        with pd.read_csv(path, chunksize=10_000, dtype={"question_id": str, "student": str, "answer": str},
+                         keep_default_na=False, na_values={"score": [""]}) as reader:
+            yield from reader
+
+
+# ==================== FEEDBACK ====================
+
+class FeedbackWriter:
+    """
+    AI feedback for graded rows, generated by a few threads under a shared
+    requests-per-minute limit and appended to a JSONL file (one line per row).
+    Rows whose feedback failed (model "ERROR") are retried on the next run.
+    """
+
+    def __init__(self, path: str, rpm: float, labels, concurrency: int = 2):
+        from model_scheduler import TokenBucket
+
+        self.path = path
+        self.labels = set(labels)
+        self.done = self._load_done(path)
+        self.generated = 0
+        self.failed = 0
+        self._bucket = TokenBucket(rate=rpm / 60.0, capacity=1.0)
+        self._bucket_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=10_000)
+        self._file = open(path, "a", encoding="utf-8")
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"bulk-feedback-{i}", daemon=True) for i in range(concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @staticmethod
+    def _load_done(path: str) -> Set[int]:
+        done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # line cut by an interruption
+                    if record.get("model") != "ERROR":
+                        done.add(record["row"])
+        return done
+
+    def enqueue(self, result: pd.DataFrame) -> None:
+        """Queue the rows of a graded chunk that still need feedback (blocks when the queue is full)"""
+        for row in result.itertuples(index=False):
+            if row.label in self.labels and row.row not in self.done:
+                self._queue.put(row)
+
+    def _throttle(self) -> None:
+        while True:
+            with self._bucket_lock:
+                now = time.monotonic()
+                delay = self._bucket.wait_time(now)
+                if delay <= 0:
+                    self._bucket.take(now)
+                    return
+            time.sleep(delay)
+
+    def _loop(self) -> None:
+        import logica
+
+        banco = logica.cargar_banco_preguntas()
+        while True:
+            row = self._queue.get()
+            try:
+                if row is None:
+                    return
+                self._throttle()
+                pregunta = banco[row.question_id]
+                try:
+                    feedback, model = logica.generar_feedback_genai(
+                        pregunta=pregunta.question,
+                        student_answer=row.answer,
+                        interpretacion=row.label,
+                        referencia=pregunta.answer_correct,
+                        hint=pregunta.hint,
+                        question_id=pregunta.question_id,
+                    )
+                except Exception as e:
+                    print(f"❌ Feedback failed for row {row.row}: {e}")
+                    feedback, model = logica.FEEDBACK_FALLBACK, "ERROR"
+                self._write({"row": int(row.row), "question_id": row.question_id, "student": row.student,
+                             "feedback": feedback, "model": model})
+            finally:
+                self._queue.task_done()
+
+    def _write(self, record: Dict) -> None:
+        with self._file_lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if record["model"] == "ERROR":
+                self.failed += 1
+            else:
+                self.generated += 1
+                self.done.add(record["row"])
+
+    def close(self, wait_for_pending: bool = True) -> None:
+        if wait_for_pending:
+            self._queue.join()
+        else:
+            # Drop the rows still queued; they are enqueued again when the run resumes
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    break
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._file.close()
+
+
+# ==================== RUN ====================
+
+def run(args) -> int:
+    import metrics
+
+    columns = dict(zip(INPUT_COLUMNS, (args.question_column, args.student_column, args.answer_column)))
+    out_format = output_format(args)
+    checkpoint_path = args.checkpoint or f"{args.output.rstrip(os.sep)}.checkpoint.json"
+    feedback_path = f"{args.output.rstrip(os.sep)}.feedback.jsonl"
+
+    if args.restart:
+        for path in (checkpoint_path, feedback_path):
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.isdir(args.output):
+            for name in os.listdir(args.output):
+                if name.startswith("part-"):
+                    os.remove(os.path.join(args.output, name))
+        elif os.path.exists(args.output):
+            os.remove(args.output)
+
+    stat = os.stat(args.input)
+    identity = {
+        "input": os.path.abspath(args.input),
+        "input_size": stat.st_size,
+        "input_mtime": int(stat.st_mtime),
+        "chunk_size": args.chunk_size,
+        "columns": columns,
+        "output": os.path.abspath(args.output),
+        "format": out_format,
+    }
+    if args.stemmed_keywords:
+        # Different output columns: not resumable from a run without them
+        identity["stemmed_keywords"] = True
+    checkpoint = Checkpoint.load(checkpoint_path, identity)
+    writer = ParquetWriter(args.output) if out_format == "parquet" else CsvWriter(args.output, checkpoint.csv_bytes)
+    if checkpoint.done:
+        print(f"Resuming: {len(checkpoint.done)} chunks ({checkpoint.rows} rows) already graded")
+
+    feedback = None
+    if args.feedback:
+        feedback = FeedbackWriter(feedback_path, args.feedback_rpm, args.feedback_labels, args.feedback_concurrency)
+        # Rows graded by an interrupted run that never got their feedback
+        for result in read_output(args.output, out_format):
+            feedback.enqueue(result)
+
+    started = time.perf_counter()
+    rows_before = checkpoint.rows
+    context = multiprocessing.get_context("spawn")
+    max_inflight = max(1, args.workers) * 2
+    pending = {}
+    interrupted = False
+
+    def collect(futures) -> None:
+        for future in futures:
+            pending.pop(future)
+            chunk_id, result, seconds = future.result()
+            metrics.record("bulk.grade_chunk", seconds)
+            checkpoint.commit(chunk_id, result, writer.write(result))
+            if feedback is not None:
+                feedback.enqueue(result)
+            rate = (checkpoint.rows - rows_before) / max(time.perf_counter() - started, 1e-9)
+            print(f"chunk {chunk_id}: {len(result)} rows in {seconds:.2f}s · {checkpoint.rows} rows total · {rate:.0f} rows/s")
+
+    # Spawned workers inherit the environment, so the limits apply before numpy/torch load
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(args.threads_per_worker)
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                               initializer=_init_worker, initargs=(args.threads_per_worker,))
+    try:
+        for chunk_id, frame in read_chunks(args.input, args.chunk_size, columns):
+            if chunk_id in checkpoint.done:
+                continue
+            if args.limit_chunks is not None and len(pending) + len(checkpoint.done) >= args.limit_chunks:
+                break
+            if len(pending) >= max_inflight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(grade_chunk, chunk_id, chunk_id * args.chunk_size, frame, args.stemmed_keywords)] = chunk_id
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted: finished chunks are saved, run the same command again to resume")
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+        writer.close()
+        if feedback is not None:
+            try:
+                if not interrupted:
+                    print("Waiting for pending feedback...")
+                feedback.close(wait_for_pending=not interrupted)
+            except KeyboardInterrupt:
+                interrupted = True
+                print("\nInterrupted: rows without feedback are retried on the next run")
+                feedback.close(wait_for_pending=False)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "rows": checkpoint.rows,
+        "rows_this_run": checkpoint.rows - rows_before,
+        "rows_per_s": round((checkpoint.rows - rows_before) / max(elapsed, 1e-9), 1),
+        "labels": dict(checkpoint.labels),
+        "unknown_question_rows": checkpoint.errors,
+        "stages": metrics.registry.snapshot(),
+    }
+    if feedback is not None:
+        summary["feedback"] = {"generated": feedback.generated, "failed": feedback.failed, "file": feedback_path}
+    checkpoint.save(summary=summary, complete=not interrupted)
+    print(json.dumps({k: v for k, v in summary.items() if k != "stages"}, indent=2, ensure_ascii=False))
+    return 130 if interrupted else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSONL (.jsonl / .ndjson) file")
+    parser.add_argument("--output", required=True, help="CSV file, or a directory of part files with --format parquet")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="default: from the output name (csv)")
+    parser.add_argument("--checkpoint", help="default: <output>.checkpoint.json")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="torch/BLAS threads in each worker")
+    parser.add_argument("--question-column", default="question_id")
+    parser.add_argument("--student-column", default="student")
+    parser.add_argument("--answer-column", default="answer")
+    parser.add_argument("--limit-chunks", type=int, help="stop after this many chunks in total (for trial runs)")
+    parser.add_argument("--restart", action="store_true", help="discard previous output, checkpoint and feedback")
+    parser.add_argument("--stemmed-keywords", action="store_true",
+                        help="also write kw_stem_* keyword coverage (folding, stemming, phrases; not used in the score)")
+    parser.add_argument("--feedback", action="store_true", help="also generate AI feedback (<output>.feedback.jsonl)")
+    parser.add_argument("--feedback-rpm", type=float, default=15.0, help="feedback requests per minute")
+    parser.add_argument("--feedback-concurrency", type=int, default=2)
+    parser.add_argument("--feedback-labels", nargs="+", choices=FEEDBACK_LABELS, default=list(FEEDBACK_LABELS))
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+    if args.threads_per_worker < 1:
+        parser.error("--threads-per-worker must be positive")
+    if output_format(args) == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("--format parquet needs pyarrow (pip install pyarrow)")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,51 +1,76 @@
 """
-Database operations using Supabase
+Database operations (Supabase or a local SQLite file, see storage.py)
 Handles user authentication and student submissions
 """
 
-from supabase import create_client, Client
+import os
 import streamlit as st
+import threading
+import time
 from datetime import datetime
 from typing import Optional, Dict, List, Tuple
 
-# Initialize Supabase client
+import metrics
+from storage import (
+    EMPTY_STATS,
+    STATS_GROUP_COLUMNS,
+    TEACHER_LABELS,
+    USER_COLUMNS,
+    DuplicateKeyError,
+    StorageBackend,
+)
+from storage_sqlite import SQLiteBackend
+from storage_supabase import (
+    HTTP_TIMEOUT_SECONDS,
+    SupabaseBackend,
+    create_supabase_client,
+)
+
+STORAGE_BACKENDS = ('supabase', 'sqlite')
+
+def _read_setting(name: str, default=None):
+    """st.secrets inside the app; environment variables for scripts and local runs"""
+    try:
+        return st.secrets[name]
+    except Exception:
+        return os.environ.get(name, default)
+
+# Initialize the storage backend
 @st.cache_resource
-def init_supabase() -> Client:
-    """Initialize and cache Supabase client"""
+def init_backend() -> Optional[StorageBackend]:
+    """
+    Initialize and cache the storage backend selected by STORAGE_BACKEND:
+    'supabase' (default) or 'sqlite' (local file at SQLITE_DB_PATH, default evalia.sqlite3)
+    """
+    kind = str(_read_setting("STORAGE_BACKEND", "supabase")).strip().lower()
     try:
-        url = st.secrets["SUPABASE_URL"]
-        key = st.secrets["SUPABASE_KEY"]
-        
-        # Create client with minimal options to avoid compatibility issues
-        options = {
-            "schema": "public",
-            "auto_refresh_token": True,
-            "persist_session": True,
-        }
+        if kind not in STORAGE_BACKENDS:
+            raise ValueError(f"STORAGE_BACKEND must be one of {STORAGE_BACKENDS}, got '{kind}'")
+        if kind == 'sqlite':
+            return SQLiteBackend(_read_setting("SQLITE_DB_PATH", "evalia.sqlite3"))
         
-        return create_client(supabase_url=url, supabase_key=key)
+        client = create_supabase_client(
+            st.secrets["SUPABASE_URL"],
+            st.secrets["SUPABASE_KEY"],
+            float(_read_setting("SUPABASE_TIMEOUT", HTTP_TIMEOUT_SECONDS)),
+        )
+        return SupabaseBackend(client)
     except Exception as e:
-        st.error(f"Error connecting to Supabase: {e}")
+        st.error(f"Error connecting to the {kind} database: {e}")
         return None
 
-# Get Supabase client
-supabase: Client = init_supabase()
+# Get storage backend
+backend: StorageBackend = init_backend()
 
 # ==================== USER MANAGEMENT ====================
 
 def register_user(username: str, password: str, name: str) -> Tuple[bool, str]:
     """
-    Register a new student user
+    Register a new student user with a single insert
+    (the unique constraint on username detects existing users)
     Returns: (success: bool, message: str)
     """
     try:
-        # Check if username already exists
-        response = supabase.table('users').select('username').eq('username', username).execute()
-        
-        if response.data and len(response.data) > 0:
-            return False, "El usuario ya existe"
-        
-        # Insert new user
         data = {
             "username": username,
             "password": password,  # In production, hash this!
@@ -54,23 +79,21 @@ def register_user(username: str, password: str, name: str) -> Tuple[bool, str]:
             "created_at": datetime.now().isoformat()
         }
         
-        supabase.table('users').insert(data).execute()
+        backend.insert_user(data)
         return True, "Registro exitoso"
     
+    except DuplicateKeyError:
+        return False, "El usuario ya existe"
     except Exception as e:
         return False, f"Error al registrar: {str(e)}"
 
 def authenticate_user(username: str, password: str) -> Optional[Dict]:
     """
-    Authenticate user and return user data
+    Authenticate user and return user data (username, name and role)
     Returns: user dict if successful, None otherwise
     """
     try:
-        response = supabase.table('users').select('*').eq('username', username).eq('password', password).execute()
-        
-        if response.data and len(response.data) > 0:
-            return response.data[0]
-        return None
+        return backend.find_user(username, password, ('username', 'name', 'role'))
     
     except Exception as e:
         st.error(f"Error al autenticar: {e}")
@@ -79,99 +102,304 @@ def authenticate_user(username: str, password: str) -> Optional[Dict]:
 def get_all_users() -> List[Dict]:
     """Get all users (for admin purposes)"""
     try:
-        response = supabase.table('users').select('*').execute()
-        return response.data if response.data else []
+        return backend.list_users(USER_COLUMNS)
     except Exception as e:
         st.error(f"Error al obtener usuarios: {e}")
         return []
 
 # ==================== SUBMISSIONS MANAGEMENT ====================
 
+def insert_submission(submission: Dict) -> Optional[Dict]:
+    """
+    Insert a student submission and return the stored row (including its id)
+    Returns: row dict if successful, None otherwise
+    """
+    with metrics.timer("db.insert_submission") as span:
+        try:
+            # Add created_at timestamp if not present
+            if 'created_at' not in submission:
+                submission['created_at'] = datetime.now().isoformat()
+            
+            saved = backend.insert_submission(submission)
+            print(f"✅ Submission saved successfully: {saved}")
+            student_summary.apply_insert(saved)
+            return saved
+        
+        except Exception as e:
+            span.outcome = "error"
+            print(f"❌ Error saving submission: {e}")
+            st.error(f"Error al guardar respuesta: {e}")
+            return None
+
 def save_submission(submission: Dict) -> bool:
     """
     Save a student submission to database
     Returns: True if successful, False otherwise
     """
+    return insert_submission(submission) is not None
+
+def bulk_insert_submissions(submissions: List[Dict]) -> List[Dict]:
+    """
+    Write a batch of submissions in one request (used by the submission spool)
+    Rows are upserted on idempotency_key, so a retried batch never creates duplicates
+    and a re-sent row only refreshes its values (e.g. feedback added later)
+    Raises on failure so the caller can retry
+    """
+    now = datetime.now().isoformat()
+    rows = [{**s, 'created_at': s.get('created_at') or now} for s in submissions]
+    with metrics.timer("db.bulk_insert_submissions"):
+        saved = backend.upsert_submissions(rows)
+    print(f"✅ Bulk-saved {len(rows)} submissions")
+    return saved
+
+def update_submission_feedback(submission_id, feedback: str, key_column: str = 'id') -> bool:
+    """
+    Write the AI feedback of an already saved submission
+    key_column: 'id', or 'idempotency_key' for submissions written through the spool
+    Returns: True if a row was updated, False otherwise
+    """
+    with metrics.timer("db.update_submission_feedback") as span:
+        try:
+            if backend.update_submissions(key_column, submission_id, {"feedback": feedback}):
+                return True
+            # Supabase reports no error when RLS filters the UPDATE out
+            span.outcome = "no_rows"
+            print(f"⚠️ No submission updated with the feedback for {submission_id} "
+                  f"(row not visible yet, or missing UPDATE policy: run FIX_SUBMISSION_FEEDBACK_UPDATE.sql)")
+            return False
+        except Exception as e:
+            span.outcome = "error"
+            print(f"❌ Error updating feedback for submission {submission_id}: {e}")
+            return False
+
+def get_submission_feedback(submission_id, key_column: str = 'id') -> Optional[str]:
+    """Get the stored feedback of a submission (None while it is still pending)"""
     try:
-        # Add created_at timestamp if not present
-        if 'created_at' not in submission:
-            submission['created_at'] = datetime.now().isoformat()
-        
-        result = supabase.table('submissions').insert(submission).execute()
-        print(f"✅ Submission saved successfully: {result}")
-        return True
-    
+        rows = backend.list_submissions(('feedback',), {key_column: submission_id}, limit=1)
+        return rows[0].get('feedback') if rows else None
     except Exception as e:
-        print(f"❌ Error saving submission: {e}")
-        st.error(f"Error al guardar respuesta: {e}")
-        return False
+        print(f"❌ Error getting feedback for submission {submission_id}: {e}")
+        return None
+
+# Columns shown in the submission tables (the listings never need feedback or created_at)
+SUBMISSION_LIST_COLUMNS = ('id', 'timestamp', 'username', 'student_name', 'pregunta_id', 'pregunta', 'respuesta', 'resultado', 'score')
+DEFAULT_PAGE_SIZE = 50
 
-def get_student_submissions(username: str) -> List[Dict]:
+def _filters(**values) -> Dict:
+    """Equality filters, leaving out the ones that are not set"""
+    return {column: value for column, value in values.items() if value is not None}
+
+def split_page(rows: List[Dict], limit: int) -> Tuple[List[Dict], Optional[int]]:
+    """(first limit rows, next cursor or None) from a read of limit + 1 rows"""
+    return rows[:limit], (rows[limit - 1]['id'] if len(rows) > limit else None)
+
+def get_submissions_page(
+    limit: int = DEFAULT_PAGE_SIZE,
+    before_id: Optional[int] = None,
+    username: Optional[str] = None,
+    student_name: Optional[str] = None,
+    resultado: Optional[str] = None,
+    columns=SUBMISSION_LIST_COLUMNS,
+) -> Tuple[List[Dict], Optional[int]]:
+    """
+    One page of submissions, newest first, using keyset pagination on id
+    Pass the returned cursor as before_id to get the next page; filters are applied in the database
+    Returns: (rows, next cursor or None on the last page)
     """
-    Get all submissions for a specific student
-    Returns: List of submission dictionaries
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(',')]
+    columns = list(dict.fromkeys(['id', *columns]))
+    with metrics.timer("db.get_submissions_page") as span:
+        try:
+            # One extra row tells whether there is a next page without a count query
+            rows = backend.list_submissions(
+                columns,
+                _filters(username=username, student_name=student_name, resultado=resultado),
+                before_id=before_id,
+                limit=limit + 1,
+            )
+            return split_page(rows, limit)
+        
+        except Exception as e:
+            span.outcome = "error"
+            print(f"❌ Error getting submissions page: {e}")
+            st.error(f"Error al obtener respuestas: {e}")
+            return [], None
+
+def get_submission_stats(username: Optional[str] = None, pregunta_id: Optional[str] = None) -> Dict:
+    """
+    Get aggregated statistics for all submissions, or for one student / one question
+    Counted in the database (the submission_stats function on Supabase, SQL on SQLite)
     """
     try:
-        response = supabase.table('submissions').select('*').eq('username', username).order('id', desc=True).execute()
-        print(f"📊 Retrieved {len(response.data) if response.data else 0} submissions for {username}")
-        return response.data if response.data else []
+        return backend.submission_stats(username, pregunta_id)
     
     except Exception as e:
-        print(f"❌ Error getting submissions: {e}")
-        st.error(f"Error al obtener respuestas: {e}")
-        return []
+        st.error(f"Error al calcular estadísticas: {e}")
+        return dict(EMPTY_STATS)
 
-def get_all_submissions() -> List[Dict]:
+def get_submission_stats_grouped(group_by: str = 'student_name') -> List[Dict]:
     """
-    Get all submissions from all students (for teacher)
-    Returns: List of submission dictionaries
+    Statistics per student or per question (group_by: student_name, username or pregunta_id)
+    Returns: list of dicts with 'group_key' plus the get_submission_stats counts
     """
+    if group_by not in STATS_GROUP_COLUMNS:
+        raise ValueError(f"group_by must be one of {STATS_GROUP_COLUMNS}")
     try:
-        response = supabase.table('submissions').select('*').order('id', desc=True).execute()
-        print(f"📊 Retrieved {len(response.data) if response.data else 0} total submissions")
-        return response.data if response.data else []
+        return backend.submission_stats_grouped(group_by)
     
     except Exception as e:
-        print(f"❌ Error getting all submissions: {e}")
-        st.error(f"Error al obtener todas las respuestas: {e}")
+        st.error(f"Error al calcular estadísticas: {e}")
         return []
 
-def get_submissions_by_student_name(student_name: str) -> List[Dict]:
-    """Get all submissions for a student by their name"""
-    try:
-        response = supabase.table('submissions').select('*').eq('student_name', student_name).order('id', desc=True).execute()
-        return response.data if response.data else []
-    except Exception as e:
-        st.error(f"Error al filtrar por estudiante: {e}")
-        return []
+# ==================== TEACHER REVIEW AND TRAINING DATA ====================
 
-def get_submissions_by_result(resultado: str) -> List[Dict]:
-    """Get all submissions filtered by result (Correcta/Incorrecta/Revisar)"""
-    try:
-        response = supabase.table('submissions').select('*').eq('resultado', resultado).order('id', desc=True).execute()
-        return response.data if response.data else []
-    except Exception as e:
-        st.error(f"Error al filtrar por resultado: {e}")
-        return []
+TRAINING_COLUMNS = ('id', 'pregunta_id', 'features', 'resultado', 'resultado_docente', 'score')
+TRAINING_PAGE_SIZE = 1000
 
-def get_submission_stats() -> Dict:
-    """Get aggregated statistics for all submissions"""
-    try:
-        all_subs = get_all_submissions()
-        
-        stats = {
-            "total": len(all_subs),
-            "correctas": len([s for s in all_subs if s.get('resultado') == 'Correcta']),
-            "incorrectas": len([s for s in all_subs if s.get('resultado') == 'Incorrecta']),
-            "revisar": len([s for s in all_subs if s.get('resultado') == 'Revisar']),
-            "students": len(set([s.get('student_name') for s in all_subs]))
-        }
-        
-        return stats
-    
-    except Exception as e:
-        st.error(f"Error al calcular estadísticas: {e}")
-        return {"total": 0, "correctas": 0, "incorrectas": 0, "revisar": 0, "students": 0}
+def resolve_submission(submission: Dict, resultado: str) -> bool:
+    """
+    Record the teacher's label for a submission (normally one the model marked 'Revisar')
+    submission: a row with id, student_name and resultado (e.g. from get_submissions_page)
+    The label replaces resultado, so stats count it, and is kept in resultado_docente for retraining
+    Returns: True if successful, False otherwise
+    """
+    if resultado not in TEACHER_LABELS:
+        raise ValueError(f"resultado must be one of {TEACHER_LABELS}")
+    with metrics.timer("db.resolve_submission") as span:
+        try:
+            backend.update_submissions('id', submission['id'], {
+                'resultado': resultado,
+                'resultado_docente': resultado,
+                'revisado_at': datetime.now().isoformat(),
+            })
+            student_summary.apply_relabel(submission.get('student_name'), submission.get('resultado'), resultado)
+            return True
+        except Exception as e:
+            span.outcome = "error"
+            print(f"❌ Error resolving submission {submission.get('id')}: {e}")
+            st.error(f"Error al guardar la revisión: {e}")
+            return False
+
+def get_training_rows(page_size: int = TRAINING_PAGE_SIZE) -> List[Dict]:
+    """
+    Every submission saved with its feature vector (id, pregunta_id, features, resultado,
+    resultado_docente, score), read in keyset pages so no server row limit truncates it
+    Raises on failure (used by retrain.py)
+    """
+    rows, before_id = [], None
+    with metrics.timer("db.get_training_rows"):
+        while True:
+            page = backend.list_submissions(TRAINING_COLUMNS, before_id=before_id, limit=page_size)
+            rows.extend(row for row in page if row.get('features'))
+            if len(page) < page_size:
+                return rows
+            before_id = page[-1]['id']
+
+def get_submissions_after(after_id: Optional[int], columns, page_size: int = TRAINING_PAGE_SIZE) -> List[Dict]:
+    """
+    Submissions with id > after_id (all of them when after_id is None), newest first
+    Read in keyset pages from the newest row down to after_id; raises on failure
+    (used by near_duplicates.py to follow the table)
+    """
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(',')]
+    columns = list(dict.fromkeys(['id', *columns]))
+    rows, before_id = [], None
+    with metrics.timer("db.get_submissions_after"):
+        while True:
+            page = backend.list_submissions(columns, before_id=before_id, limit=page_size)
+            fresh = [row for row in page if after_id is None or row['id'] > after_id]
+            rows.extend(fresh)
+            if len(page) < page_size or len(fresh) < len(page):
+                return rows
+            before_id = page[-1]['id']
+
+# ==================== STUDENT SUMMARY CACHE ====================
+
+SUMMARY_TTL_SECONDS = 300
+
+# resultado -> counter in a summary row
+_RESULT_COUNTS = {'Correcta': 'correctas', 'Incorrecta': 'incorrectas', 'Revisar': 'revisar'}
+
+class StudentSummaryCache:
+    """
+    Materialized per-student statistics for the teacher dashboard
+    Loaded with one grouped aggregation and updated in place by insert_submission;
+    the TTL picks up rows written by other app processes
+    """
+
+    def __init__(self, ttl_seconds: float = SUMMARY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._rows: Optional[Dict[str, Dict]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[List[Dict]]:
+        """Cached summary rows sorted by student, or None when missing or expired"""
+        with self._lock:
+            if self._rows is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+                return None
+            return [dict(self._rows[key]) for key in sorted(self._rows, key=str)]
+
+    def store(self, rows: List[Dict]) -> None:
+        """Replace the summary with fresh get_submission_stats_grouped('student_name') rows"""
+        with self._lock:
+            self._rows = {row['group_key']: dict(row) for row in rows}
+            self._loaded_at = time.monotonic()
+
+    def apply_insert(self, submission: Dict) -> None:
+        """Count a newly inserted submission without reloading the summary"""
+        with self._lock:
+            if self._rows is None:
+                return
+            key = submission.get('student_name')
+            row = self._rows.setdefault(key, {"group_key": key, **EMPTY_STATS, "students": 1})
+            row['total'] += 1
+            column = _RESULT_COUNTS.get(submission.get('resultado'))
+            if column:
+                row[column] += 1
+
+    def apply_relabel(self, student_name: Optional[str], old: Optional[str], new: str) -> None:
+        """Move one submission of a student from the old result's count to the new one"""
+        with self._lock:
+            if self._rows is None or old == new:
+                return
+            row = self._rows.get(student_name)
+            if row is None or old not in _RESULT_COUNTS:
+                # Not in the cached summary: reload it on the next read
+                self._rows = None
+                return
+            row[_RESULT_COUNTS[old]] -= 1
+            row[_RESULT_COUNTS[new]] += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._rows = None
+
+student_summary = StudentSummaryCache()
+
+def summary_totals(rows: List[Dict]) -> Dict:
+    """Overall stats from the per-student summary (same numbers as get_submission_stats)"""
+    totals = dict(EMPTY_STATS)
+    for row in rows:
+        for key in ("total", "correctas", "incorrectas", "revisar"):
+            totals[key] += row[key]
+    totals["students"] = len(rows)
+    return totals
+
+def get_student_summary() -> List[Dict]:
+    """Per-student statistics, served from the cache when it is fresh"""
+    rows = student_summary.get()
+    if rows is None:
+        try:
+            rows = backend.submission_stats_grouped('student_name')
+        except Exception as e:
+            # Not cached: an empty fallback would hide every student until the TTL expires
+            st.error(f"Error al calcular estadísticas: {e}")
+            return []
+        student_summary.store(rows)
+    return rows
 
 # ==================== INITIALIZATION ====================
 
@@ -188,17 +416,17 @@ def initialize_default_users():
     ]
     
     try:
-        for user in default_users:
-            # Check if user exists
-            response = supabase.table('users').select('username').eq('username', user['username']).execute()
-            
-            if not response.data or len(response.data) == 0:
-                # User doesn't exist, create it
-                user['created_at'] = datetime.now().isoformat()
-                supabase.table('users').insert(user).execute()
-                print(f"Created user: {user['username']}")
+        # One bulk upsert; existing usernames are left untouched
+        now = datetime.now().isoformat()
+        created = backend.insert_users_ignore_existing([{**user, 'created_at': now} for user in default_users])
+        for user in created:
+            print(f"Created user: {user['username']}")
         
         return True
     except Exception as e:
         print(f"Error initializing users: {e}")
         return False
+
+# A new local database has no teacher account (registration only creates students)
+if backend is not None and backend.name == 'sqlite':
+    initialize_default_users()
@@ -0,0 +1,204 @@
+"""
+Async database operations using the async Supabase client (Supabase backend only)
+Independent dashboard queries are issued concurrently and awaited together,
+so page load time tracks the slowest query instead of the sum of all of them
+"""
+
+import asyncio
+import os
+import threading
+from typing import Dict, List, Optional
+
+import streamlit as st
+import httpx
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+
+import database as db
+import metrics
+from database import DEFAULT_PAGE_SIZE, split_page, student_summary, summary_totals
+from storage import EMPTY_STATS, STATS_GROUP_COLUMNS, SUBMISSION_COLUMNS, USER_COLUMNS, parse_columns, stats_from_row
+from storage_supabase import (
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_TIMEOUT_SECONDS,
+    SupabaseBackend,
+    is_missing_function,
+)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[AsyncClient] = None
+_loop_lock = threading.Lock()
+_client_lock: Optional[asyncio.Lock] = None
+
+# Columns of the student Historial table
+STUDENT_HISTORY_COLUMNS = ('timestamp', 'pregunta', 'respuesta', 'resultado', 'score')
+
+
+def _read_secret(name: str) -> Optional[str]:
+    """st.secrets inside the app; environment variables for scripts and local stubs"""
+    try:
+        return st.secrets[name]
+    except Exception:
+        return os.environ.get(name)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Dedicated event loop thread, so the async client and its connections are reused across reruns"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="supabase-async", daemon=True).start()
+    return _loop
+
+
+async def get_client() -> AsyncClient:
+    """Create (once) the async Supabase client; SUPABASE_URL may point to a local PostgREST stub"""
+    global _client, _client_lock
+    if _client_lock is None:
+        _client_lock = asyncio.Lock()
+    async with _client_lock:
+        if _client is None:
+            timeout = httpx.Timeout(
+                float(_read_secret("SUPABASE_TIMEOUT") or HTTP_TIMEOUT_SECONDS), connect=HTTP_CONNECT_TIMEOUT_SECONDS
+            )
+            options = AsyncClientOptions(auto_refresh_token=False, persist_session=False, postgrest_client_timeout=timeout)
+            _client = await acreate_client(_read_secret("SUPABASE_URL"), _read_secret("SUPABASE_KEY"), options=options)
+    return _client
+
+
+def run(coro):
+    """Run a coroutine on the shared loop from synchronous (Streamlit) code"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+# ==================== QUERIES ====================
+
+async def get_all_users() -> List[Dict]:
+    """Get all users (for admin purposes)"""
+    client = await get_client()
+    response = await client.table('users').select(', '.join(USER_COLUMNS)).execute()
+    return response.data if response.data else []
+
+
+async def get_submission_stats(username: Optional[str] = None) -> Dict:
+    """Aggregated statistics, optionally for one student (see database.get_submission_stats)"""
+    backend = db.backend
+    if backend.stats_rpc_available:
+        client = await get_client()
+        try:
+            response = await client.rpc('submission_stats', {'p_username': username, 'p_pregunta_id': None}).execute()
+            return stats_from_row(response.data[0]) if response.data else dict(EMPTY_STATS)
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+    return await asyncio.to_thread(backend.submission_stats, username)
+
+
+async def get_submissions_page(limit: int = DEFAULT_PAGE_SIZE, before_id: Optional[int] = None,
+                               username: Optional[str] = None, columns=STUDENT_HISTORY_COLUMNS):
+    """One keyset page of submissions, newest first (see database.get_submissions_page)"""
+    client = await get_client()
+    query = client.table('submissions').select(', '.join(parse_columns(['id', *columns], SUBMISSION_COLUMNS)))
+    if username is not None:
+        query = query.eq('username', username)
+    if before_id is not None:
+        query = query.lt('id', before_id)
+    response = await query.order('id', desc=True).limit(limit + 1).execute()
+    return split_page(response.data or [], limit)
+
+
+async def get_submission_stats_grouped(group_by: str = 'student_name') -> List[Dict]:
+    """Statistics per student or per question (see database.get_submission_stats_grouped)"""
+    if group_by not in STATS_GROUP_COLUMNS:
+        raise ValueError(f"group_by must be one of {STATS_GROUP_COLUMNS}")
+    backend = db.backend
+    if backend.stats_rpc_available:
+        client = await get_client()
+        try:
+            response = await client.rpc('submission_stats_grouped', {'p_group_by': group_by}).execute()
+            return [{"group_key": row.get('group_key'), **stats_from_row(row)} for row in response.data or []]
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+    # The storage backend owns the RPC availability flag and the fallback counting
+    return await asyncio.to_thread(backend.submission_stats_grouped, group_by)
+
+
+# ==================== DASHBOARDS ====================
+
+async def _gather_dashboard(queries: Dict) -> Dict:
+    names = list(queries)
+    results = await asyncio.gather(*(queries[n] for n in names), return_exceptions=True)
+    return dict(zip(names, results))
+
+
+def load_student_history(username: str, before_id: Optional[int] = None) -> Dict:
+    """
+    Totals and one page of a student's own submissions for the Historial tab, fetched concurrently
+    Returns: dict with 'stats', 'rows' and 'next_cursor' (defaults on error)
+    """
+    if not isinstance(db.backend, SupabaseBackend):
+        with metrics.timer("db.load_student_history", outcome=db.backend.name if db.backend else "error"):
+            rows, next_cursor = db.get_submissions_page(before_id=before_id, username=username,
+                                                        columns=STUDENT_HISTORY_COLUMNS)
+            return {"stats": db.get_submission_stats(username=username), "rows": rows, "next_cursor": next_cursor}
+
+    defaults = {"stats": dict(EMPTY_STATS), "page": ([], None)}
+    queries = {
+        "stats": get_submission_stats(username),
+        "page": get_submissions_page(before_id=before_id, username=username),
+    }
+    try:
+        with metrics.timer("db.load_student_history"):
+            results = run(_gather_dashboard(queries))
+    except Exception as e:
+        st.error(f"Error al cargar el historial: {e}")
+        results = defaults
+
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"❌ Error loading history '{name}': {result}")
+            st.error(f"Error al obtener {name}: {result}")
+            results[name] = defaults[name]
+    rows, next_cursor = results["page"]
+    return {"stats": results["stats"], "rows": rows, "next_cursor": next_cursor}
+
+
+def load_teacher_dashboard() -> Dict:
+    """
+    Stats, per-student stats and user list for the teacher Estadísticas tab, fetched concurrently
+    (the submissions table itself is paged with database.get_submissions_page)
+    The per-student summary comes from database.student_summary while it is fresh,
+    and the overall stats are derived from it
+    Returns: dict with 'stats', 'students' and 'users' (defaults on error)
+    """
+    if not isinstance(db.backend, SupabaseBackend):
+        # Local backends answer in-process: nothing to overlap
+        with metrics.timer("db.load_teacher_dashboard", outcome=db.backend.name if db.backend else "error"):
+            students = db.get_student_summary()
+            return {"stats": summary_totals(students), "students": students, "users": db.get_all_users()}
+
+    defaults = {"stats": dict(EMPTY_STATS), "students": [], "users": []}
+    queries = {"users": get_all_users()}
+    cached = student_summary.get()
+    if cached is None:
+        queries["students"] = get_submission_stats_grouped('student_name')
+    try:
+        with metrics.timer("db.load_teacher_dashboard", outcome="cache" if cached is not None else "ok"):
+            results = run(_gather_dashboard(queries))
+    except Exception as e:
+        st.error(f"Error al cargar el panel: {e}")
+        return defaults
+
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"❌ Error loading dashboard '{name}': {result}")
+            st.error(f"Error al obtener {name}: {result}")
+            results[name] = defaults[name]
+        elif name == "students":
+            student_summary.store(result)
+
+    if cached is not None:
+        results["students"] = cached
+    results["stats"] = summary_totals(results["students"])
+    return results
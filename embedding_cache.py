@@ -0,0 +1,121 @@
+"""
+Content-addressed cache for student answer embeddings
+In-memory LRU bounded by a byte budget, with an optional SQLite tier on disk
+"""
+
+import hashlib
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Maps preprocessed answer text -> embedding vector.
+
+    Entries are evicted least recently used first once the memory tier
+    exceeds `max_bytes`. When `disk_path` is set, every embedding is also
+    written to SQLite and memory misses fall back to it, so the cache
+    survives restarts and can be shared by worker processes.
+    `namespace` identifies the encoder so embeddings of different models never mix.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_path: Optional[str] = None,
+                 namespace: str = ""):
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.bytes_used = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if disk_path:
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.namespace}\x1f{text}".encode("utf-8")).digest()
+
+    @staticmethod
+    def _entry_size(key: bytes, vector: np.ndarray) -> int:
+        return sys.getsizeof(key) + vector.nbytes
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        """Insert into the memory tier and evict down to the byte budget (lock held)"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = vector
+        self.bytes_used += self._entry_size(key, vector)
+        while self.bytes_used > self.max_bytes and self._entries:
+            old_key, old_vector = self._entries.popitem(last=False)
+            self.bytes_used -= self._entry_size(old_key, old_vector)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up several texts; missing ones come back as None"""
+        keys = [self._key(t) for t in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[i] = vector
+                    continue
+
+                if self._conn is not None:
+                    row = self._conn.execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        vector = np.frombuffer(row[0], dtype=np.float32)
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+                        found[i] = vector
+                        continue
+                self.misses += 1
+        return found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """Store one embedding per text (rows of `vectors`)"""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+            if self._conn is not None and rows:
+                self._conn.executemany("INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)", rows)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Drop the memory tier (disk entries are namespaced, so they stay valid)"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+            self.hits = self.disk_hits = self.misses = 0
+            if namespace is not None:
+                self.namespace = namespace
+
+    def stats(self) -> Dict:
+        """Hit rate and memory in use, for sizing the cache to a cohort"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "disk_tier": self._conn is not None,
+            }
@@ -0,0 +1,105 @@
+"""
+Persistent cache for AI-generated feedback
+Stores feedback in a local SQLite file keyed by question, normalized answer and label
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class FeedbackCache:
+    """
+    Content-addressed feedback cache with LRU and TTL eviction.
+    Survives process restarts because entries live in a SQLite file.
+    """
+
+    def __init__(self, path: str = "feedback_cache.sqlite3", max_entries: int = 5000,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS feedback_cache (
+                key TEXT PRIMARY KEY,
+                feedback TEXT NOT NULL,
+                model TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_cache_last_used ON feedback_cache(last_used)")
+
+    @staticmethod
+    def make_key(question_id: str, normalized_answer: str, label: str) -> str:
+        """Build the cache key from QUESTION_ID, preprocessed answer and 3-class label"""
+        raw = "\x1f".join([str(question_id), normalized_answer, str(label)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up a cached feedback
+        Returns: (feedback, model) on a hit, None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT feedback, model, created_at FROM feedback_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and self.ttl_seconds is not None and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM feedback_cache WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE feedback_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key: str, feedback: str, model: str) -> None:
+        """Store a feedback and evict expired / least recently used entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO feedback_cache (key, feedback, model, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, feedback, model, now, now),
+            )
+            if self.ttl_seconds is not None:
+                self._conn.execute("DELETE FROM feedback_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM feedback_cache WHERE key IN ("
+                "SELECT key FROM feedback_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        """Remove every cached entry and reset the counters"""
+        with self._lock:
+            self._conn.execute("DELETE FROM feedback_cache")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process and number of stored entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM feedback_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
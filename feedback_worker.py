@@ -0,0 +1,106 @@
+"""
+Deferred feedback generation
+Submissions are saved with their score and label right away; the AI feedback
+is generated by a background worker pool and written back to the row
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Union
+
+import streamlit as st
+
+import database as db
+import logica
+
+
+def deferred_feedback_enabled() -> bool:
+    """DEFERRED_FEEDBACK = true in secrets/env turns the deferred mode on"""
+    return str(logica.leer_secreto("DEFERRED_FEEDBACK", "false")).strip().lower() in ("1", "true", "yes")
+
+
+# Storing the feedback is retried while no row was updated (e.g. the row is not visible yet)
+STORE_ATTEMPTS = 3
+STORE_RETRY_DELAY = 1.0
+
+
+def truncate_feedback(feedback: str) -> str:
+    """Same 200-char limit the app uses when storing feedback"""
+    return feedback[:200] + "..." if len(feedback) > 200 else feedback
+
+
+class FeedbackWorkerPool:
+    """Thread pool plus a registry of in-flight jobs keyed by submission id"""
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feedback")
+        # Keyed by submission id, or by idempotency key for spooled submissions
+        self._jobs: Dict[Union[int, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, submission_id, feedback_args: Dict, store: Optional[Callable[[str], bool]]):
+        try:
+            feedback, modelo = logica.generar_feedback_genai(**feedback_args)
+        except Exception as e:
+            print(f"❌ Error generating deferred feedback for submission {submission_id}: {e}")
+            feedback, modelo = logica.FEEDBACK_FALLBACK, "ERROR"
+        self._store(submission_id, truncate_feedback(feedback), store)
+        return feedback, modelo
+
+    def _store(self, submission_id, feedback: str, store: Optional[Callable[[str], bool]]) -> bool:
+        """Persist the feedback, retrying with backoff while nothing was stored"""
+        delay = STORE_RETRY_DELAY
+        for attempt in range(1, STORE_ATTEMPTS + 1):
+            if store is not None:
+                stored = store(feedback)
+            else:
+                stored = db.update_submission_feedback(submission_id, feedback)
+            if stored:
+                return True
+            if attempt < STORE_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+        print(f"❌ Deferred feedback for submission {submission_id} was not stored after {STORE_ATTEMPTS} attempts")
+        return False
+
+    def submit(self, submission_id, feedback_args: Dict,
+               store: Optional[Callable[[str], bool]] = None) -> Future:
+        """
+        Queue feedback generation for a saved submission
+        store(feedback) persists the result and returns True once stored; by default the row with this id is updated
+        """
+        future = self._executor.submit(self._run, submission_id, feedback_args, store)
+        with self._lock:
+            self._jobs[submission_id] = future
+        return future
+
+    def poll(self, submission_id) -> Optional[str]:
+        """
+        Non-blocking check for a submission's feedback
+        Returns: feedback text when ready, None while still pending
+        """
+        with self._lock:
+            future = self._jobs.get(submission_id)
+
+        if future is None:
+            # Job from another process or a previous run: read what was stored
+            if isinstance(submission_id, str):
+                return db.get_submission_feedback(submission_id, key_column='idempotency_key')
+            return db.get_submission_feedback(submission_id)
+        if not future.done():
+            return None
+
+        with self._lock:
+            self._jobs.pop(submission_id, None)
+        return future.result()[0]
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for f in self._jobs.values() if not f.done())
+
+
+@st.cache_resource
+def get_worker_pool() -> FeedbackWorkerPool:
+    """Process-wide worker pool (FEEDBACK_WORKERS threads, default 4)"""
+    return FeedbackWorkerPool(max_workers=int(logica.leer_secreto("FEEDBACK_WORKERS", 4)))
@@ -0,0 +1,181 @@
+"""
+Compiled keyword matcher for the keyword coverage features
+- kw_recall / kw_precision / kw_f1: exact-token overlap between the answer's
+  words and the keyword set, the inputs model_kw.joblib and its thresholds
+  were fit on
+- kw_stem_recall / kw_stem_precision / kw_stem_f1: the same measures after
+  accent and case folding, light Spanish stemming and multi-word keyword
+  matching with a token-level Aho-Corasick automaton. Computed only on
+  request (stemmed=True, for reports): the model is not fit on them
+"""
+
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+EXACT_FEATURES = ("kw_recall", "kw_precision", "kw_f1")
+STEMMED_FEATURES = ("kw_stem_recall", "kw_stem_precision", "kw_stem_f1")
+# Column order of coverage_batch(..., stemmed=True)
+COVERAGE_FEATURES = EXACT_FEATURES + STEMMED_FEATURES
+
+# Longest suffixes first; only stripped when at least 3 characters remain
+_DERIVATIONAL_SUFFIXES = (
+    "amientos", "imientos", "amiento", "imiento",
+    "aciones", "iciones", "acion", "icion", "mente",
+)
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents (numéricos -> numericos)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    """
+    Light Spanish stemmer: drops a few derivational suffixes, the plural
+    and the final gender vowel (numericos / numerica -> numeric)
+    """
+    if len(token) <= 3:
+        return token
+    for suffix in _DERIVATIONAL_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+
+    if token.endswith("ces") and len(token) > 4:
+        token = token[:-3] + "z"
+    elif token.endswith("es") and len(token) > 4 and token[-3] not in "aeiou":
+        token = token[:-2]
+    elif token.endswith("s") and len(token) > 3:
+        token = token[:-1]
+
+    if len(token) > 4 and token[-1] in "aeo":
+        token = token[:-1]
+    return token
+
+
+class KeywordMatcher:
+    """
+    Matcher for one question's keyword list, compiled once.
+
+    Exact features: the keywords are compared as-is with the answer's
+    lowercased words (no stopwords, more than 2 characters).
+
+    Stemmed features: keywords may be single words or phrases ("función de
+    pérdida"). Both the keywords and the student answer go through the same
+    pipeline (fold -> tokenize -> drop stopwords / short tokens -> stem), then
+    all keyword phrases are found in a single pass over the answer tokens.
+    """
+
+    def __init__(self, keywords: Iterable[str], stopwords: Iterable[str] = ()):
+        self.keyword_set: FrozenSet[str] = frozenset(str(k) for k in keywords or [])
+        self._exact_stopwords: FrozenSet[str] = frozenset(stopwords)
+        self.stopwords: FrozenSet[str] = frozenset(fold(w) for w in stopwords)
+
+        phrases: List[Tuple[str, ...]] = []
+        for keyword in keywords or []:
+            phrase = tuple(self._terms(str(keyword)))
+            if phrase and phrase not in phrases:
+                phrases.append(phrase)
+        self.phrases = phrases
+        self._build_automaton()
+
+    def _terms(self, text: str) -> List[str]:
+        # Same filter as the original word matcher: no stopwords, more than 2 characters
+        tokens = _TOKEN_RE.findall(fold(text))
+        return [stem(t) for t in tokens if t not in self.stopwords and len(t) > 2]
+
+    def _build_automaton(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for phrase_id, phrase in enumerate(self.phrases):
+            node = 0
+            for term in phrase:
+                if term not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][term] = len(self._goto) - 1
+                node = self._goto[node][term]
+            self._out[node].append(phrase_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for term, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and term not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(term, 0) if node else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def exact_counts(self, answer: str) -> Tuple[int, int, int]:
+        """
+        Exact-token overlap, as match_counts rows
+        Returns: (keywords found, keywords found, distinct answer words)
+        """
+        if not isinstance(answer, str) or not self.keyword_set:
+            return 0, 0, 0
+        words = {w for w in _TOKEN_RE.findall(answer.lower()) if w not in self._exact_stopwords and len(w) > 2}
+        hits = len(words & self.keyword_set)
+        return hits, hits, len(words)
+
+    def match_counts(self, answer: str) -> Tuple[int, int, int]:
+        """
+        Stemmed phrase matching
+        Returns: (keywords matched, content terms covered by a match, distinct content terms)
+        """
+        if not isinstance(answer, str) or not self.phrases:
+            return 0, 0, 0
+        terms = self._terms(answer)
+        if not terms:
+            return 0, 0, 0
+
+        matched = set()
+        covered = set()
+        node = 0
+        for i, term in enumerate(terms):
+            while node and term not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(term, 0)
+            for phrase_id in self._out[node]:
+                matched.add(phrase_id)
+                covered.update(terms[i - len(self.phrases[phrase_id]) + 1:i + 1])
+        return len(matched), len(covered), len(set(terms))
+
+    def coverage(self, answer: str, stemmed: bool = False) -> Dict[str, float]:
+        """The EXACT_FEATURES of one answer (COVERAGE_FEATURES with stemmed=True)"""
+        names = COVERAGE_FEATURES if stemmed else EXACT_FEATURES
+        return dict(zip(names, map(float, self.coverage_batch([answer], stemmed)[0])))
+
+    def coverage_batch(self, answers: Sequence[str], stemmed: bool = False) -> np.ndarray:
+        """Array (N, 3) with the EXACT_FEATURES of many answers; (N, 6) COVERAGE_FEATURES with stemmed=True"""
+        exact = np.array([self.exact_counts(a) for a in answers], dtype=np.float64).reshape(-1, 3)
+        coverage = coverage_from_counts(exact, len(self.keyword_set))
+        if not stemmed:
+            return coverage
+        counts = np.array([self.match_counts(a) for a in answers], dtype=np.float64).reshape(-1, 3)
+        return np.hstack([coverage, coverage_from_counts(counts, len(self.phrases))])
+
+
+def coverage_from_counts(counts: np.ndarray, n_keywords) -> np.ndarray:
+    """
+    Vectorized recall/precision/F1 from match_counts rows
+    n_keywords may be a scalar or one value per row
+    """
+    hits, covered, distinct = counts[:, 0], counts[:, 1], counts[:, 2]
+    n_keywords = np.broadcast_to(np.asarray(n_keywords, dtype=np.float64), hits.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = np.where(n_keywords > 0, hits / n_keywords, 0.0)
+        precision = np.where(distinct > 0, covered / distinct, 0.0)
+        total = precision + recall
+        f1 = np.where(total > 0, 2 * precision * recall / total, 0.0)
+    return np.column_stack([recall, precision, f1])
@@ -1,38 +1,110 @@
 import pandas as pd
 import numpy as np
+import os
 import re
 import ast
+import sys
 import json
-import joblib
-import nltk
-from nltk.corpus import stopwords
-from sentence_transformers import SentenceTransformer, util
-from sklearn.metrics.pairwise import cosine_similarity
-from google import genai
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from collections import namedtuple
 import streamlit as st
+from feedback_cache import FeedbackCache
+from embedding_cache import EmbeddingCache
+from keyword_matcher import COVERAGE_FEATURES, EXACT_FEATURES, STEMMED_FEATURES, KeywordMatcher
+from question_bank import QuestionBank
+from bank_artifact import BankArtifact, file_sha256
+from model_scheduler import ModelScheduler
+import metrics
+
+# Las dependencias pesadas (sentence_transformers, sklearn/joblib, nltk, google.genai)
+# se importan dentro de las funciones que las usan: la página de login no las carga.
 
 # --- CONFIGURACIÓN INICIAL ---
 
-# Descargar stopwords si no existen
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+# Tiempos de las importaciones y cargas diferidas (ver reporte_carga)
+_TIEMPOS_CARGA = {}
+
+@contextmanager
+def _cronometrar(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _TIEMPOS_CARGA[nombre] = time.perf_counter() - inicio
+
+@lru_cache(maxsize=None)
+def obtener_stopwords():
+    with _cronometrar('nltk.stopwords'):
+        import nltk
+        from nltk.corpus import stopwords
+
+        # Descargar stopwords si no existen
+        try:
+            nltk.data.find('corpora/stopwords')
+        except LookupError:
+            nltk.download('stopwords')
+
+        return frozenset(stopwords.words('spanish'))
 
-spanish_stopwords = set(stopwords.words('spanish'))
+def leer_secreto(nombre, defecto=None):
+    # st.secrets dentro de la app; variables de entorno para scripts y pruebas
+    try:
+        return st.secrets[nombre]
+    except Exception:
+        return os.environ.get(nombre, defecto)
 
 # --- CARGA DE MODELOS (Con Caché para velocidad) ---
 
+SBERT_MODEL_ID = 'paraphrase-multilingual-MiniLM-L12-v2'
+# Backends del encoder: 'torch' (fp32, por defecto) y 'onnx-int8' (ONNX cuantizado para CPU)
+BACKENDS_SBERT = ('torch', 'onnx-int8')
+ONNX_INT8_FILE = 'onnx/model_int8_dynamic.onnx'
+
+def _cargar_sbert_onnx_int8(directorio):
+    """
+    Carga el grafo ONNX cuantizado dinámicamente a int8.
+    La primera vez lo exporta desde el modelo fp32 y lo guarda en `directorio`.
+    Requiere sentence-transformers[onnx] (optimum + onnxruntime).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if not os.path.exists(os.path.join(directorio, ONNX_INT8_FILE)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        modelo_onnx = SentenceTransformer(SBERT_MODEL_ID, backend='onnx')
+        modelo_onnx.save(directorio)
+        export_dynamic_quantized_onnx_model(modelo_onnx, 'avx2', directorio, file_suffix='int8_dynamic')
+    return SentenceTransformer(directorio, backend='onnx', model_kwargs={'file_name': ONNX_INT8_FILE})
+
+def cargar_modelo_sbert(backend=None):
+    # SBERT_BACKEND en secrets/entorno elige el backend del proceso
+    return _cargar_modelo_sbert(backend or leer_secreto("SBERT_BACKEND", "torch"))
+
 @st.cache_resource
-def cargar_modelo_sbert():
-    return SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+def _cargar_modelo_sbert(backend):
+    with _cronometrar(f'sbert[{backend}]'):
+        if backend == 'torch':
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(SBERT_MODEL_ID)
+        if backend == 'onnx-int8':
+            return _cargar_sbert_onnx_int8(leer_secreto("SBERT_ONNX_DIR", "sbert_onnx_int8"))
+    raise ValueError(f"Backend de SBERT desconocido: {backend!r} (opciones: {BACKENDS_SBERT})")
+
+# Modelo de calificación y sus parámetros (retrain.py los reescribe; ver recargar_modelo)
+RUTA_MODELO_KW = "model_kw.joblib"
+RUTA_PARAMS_KW = "params_kw.json"
 
 @st.cache_resource
 def cargar_recursos_ml():
     # Archivos están en la misma carpeta
     try:
-        model_kw = joblib.load("model_kw.joblib")
-        with open("params_kw.json") as f:
+        with _cronometrar('model_kw'):
+            import joblib
+            model_kw = joblib.load(RUTA_MODELO_KW)
+        with open(RUTA_PARAMS_KW) as f:
             params = json.load(f)
         return model_kw, params
     except FileNotFoundError:
@@ -47,9 +119,49 @@ def cargar_dataset():
     except FileNotFoundError:
         return pd.DataFrame() # Retorna vacío si falla
 
-# Inicializamos modelos globales
-model_sbert = cargar_modelo_sbert()
-model_kw, params = cargar_recursos_ml()
+@st.cache_resource
+def cargar_artefacto_banco():
+    """
+    Artefacto compilado del banco (python bank_artifact.py compile) en BANK_ARTIFACT_PATH
+    (question_bank.evbank por defecto). Sus embeddings se abren con np.memmap y las
+    páginas se comparten entre procesos. None si no existe o no corresponde al CSV actual.
+    """
+    ruta = leer_secreto("BANK_ARTIFACT_PATH", "question_bank.evbank")
+    if not ruta or not os.path.exists(ruta):
+        return None
+    try:
+        with _cronometrar('artefacto_banco'):
+            artefacto = BankArtifact(ruta)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Artefacto del banco no válido ({e}); se usa el CSV")
+        return None
+    if os.path.exists("Dataset_preguntas_v1.csv") and artefacto.source_sha256 != file_sha256("Dataset_preguntas_v1.csv"):
+        print(f"⚠️ {ruta} se compiló con otro Dataset_preguntas_v1.csv; recompílalo. Se usa el CSV")
+        return None
+    return artefacto
+
+@st.cache_resource
+def cargar_banco_preguntas():
+    # Banco inmutable compartido por todas las sesiones: búsquedas por id/texto
+    # en O(1) y columnas de listas ya parseadas (ver question_bank.py)
+    artefacto = cargar_artefacto_banco()
+    if artefacto is not None:
+        return artefacto.bank
+    return QuestionBank.from_dataframe(cargar_dataset())
+
+def cargar_params():
+    # Sólo JSON: barato, se lee al importar para tener umbrales y orden de features
+    try:
+        with open(RUTA_PARAMS_KW) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# El encoder se carga en el primer uso (o con configurar_encoder / iniciar_precarga)
+_encoder = None
+# Identificador del encoder inyectado con configurar_encoder (None = SBERT del proceso)
+_id_encoder_personalizado = None
+params = cargar_params()
 
 # Extraer parámetros si cargaron bien
 if params:
@@ -59,6 +171,142 @@ if params:
 else:
     # Valores por defecto por si falla la carga
     t_low, t_high, features = 0.3509, 0.6018, ['avg_correct', 'max_correct', 'avg_wrong', 'max_wrong', 'kw_recall', 'kw_precision', 'kw_f1']
+# Los dos umbrales juntos: una recarga los cambia a la vez para todos los hilos
+umbrales = (t_low, t_high)
+
+def alinear_coeficientes(modelo, feature_cols):
+    """
+    Devuelve (coef, intercept) con los coeficientes en el orden de feature_cols.
+    Se valida una sola vez al cargar, no en cada evaluación.
+    """
+    coef = np.asarray(modelo.coef_[0], dtype=np.float64)
+    nombres = getattr(modelo, 'feature_names_in_', None)
+    if nombres is None:
+        if len(coef) != len(feature_cols):
+            raise ValueError(f"El modelo espera {len(coef)} features y params_kw.json define {len(feature_cols)}")
+        return coef, float(modelo.intercept_[0])
+
+    nombres = list(nombres)
+    if sorted(nombres) != sorted(feature_cols):
+        raise ValueError(f"feature_cols {feature_cols} no coincide con las features del modelo {nombres}")
+    orden = [nombres.index(f) for f in feature_cols]
+    return coef[orden], float(modelo.intercept_[0])
+
+@st.cache_resource
+def obtener_modelo_lineal():
+    """(coef, intercept) alineados con feature_cols, o None si no hay modelo."""
+    model_kw, _ = cargar_recursos_ml()
+    if model_kw is None:
+        return None
+    return alinear_coeficientes(model_kw, features)
+
+# --- RECARGA DEL MODELO EN CALIENTE ---
+
+# Cada cuántos segundos se mira si el modelo cambió en disco (retrain.py en este u otro proceso)
+INTERVALO_COMPROBACION_MODELO = 5.0
+_lock_modelo = threading.Lock()
+_proxima_comprobacion_modelo = 0.0
+
+def _firma_archivos_modelo():
+    firma = []
+    for ruta in (RUTA_MODELO_KW, RUTA_PARAMS_KW):
+        try:
+            info = os.stat(ruta)
+            firma.append((info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            firma.append(None)
+    return tuple(firma)
+
+_firma_modelo = _firma_archivos_modelo()
+
+def recargar_modelo():
+    """
+    Vuelve a leer model_kw.joblib y params_kw.json sin reiniciar la app: los
+    coeficientes y los umbrales nuevos se usan desde la siguiente evaluación.
+    Si params_kw.json trae model_sha256 y no coincide con el modelo en disco
+    (retrain.py a medio escribir), se mantiene el modelo actual.
+    Devuelve True si se cambió el modelo.
+    """
+    global params, t_low, t_high, umbrales, _firma_modelo
+    with _lock_modelo:
+        firma = _firma_archivos_modelo()
+        nuevos = cargar_params()
+        esperado = (nuevos or {}).get('model_sha256')
+        if esperado and os.path.exists(RUTA_MODELO_KW) and file_sha256(RUTA_MODELO_KW) != esperado:
+            return False
+        cargar_recursos_ml.clear()
+        obtener_modelo_lineal.clear()
+        # Carga y valida los coeficientes antes de publicar los umbrales
+        obtener_modelo_lineal()
+        if nuevos:
+            params = nuevos
+            umbrales = (params.get("t_low", t_low), params.get("t_high", t_high))
+            t_low, t_high = umbrales
+        _firma_modelo = firma
+    print(f"🔁 Modelo de calificación recargado (t_low={t_low:.3f}, t_high={t_high:.3f})")
+    return True
+
+def comprobar_modelo():
+    """Recarga el modelo si sus archivos cambiaron (como mucho una vez cada INTERVALO_COMPROBACION_MODELO)."""
+    global _proxima_comprobacion_modelo
+    ahora = time.monotonic()
+    if ahora < _proxima_comprobacion_modelo:
+        return
+    _proxima_comprobacion_modelo = ahora + INTERVALO_COMPROBACION_MODELO
+    if _firma_archivos_modelo() != _firma_modelo:
+        recargar_modelo()
+
+def obtener_encoder():
+    global _encoder
+    if _encoder is None:
+        _encoder = cargar_modelo_sbert()
+    return _encoder
+
+def __getattr__(nombre):
+    # Compatibilidad con los antiguos globales de módulo, ahora diferidos
+    if nombre == 'model_sbert':
+        return obtener_encoder()
+    if nombre == 'model_kw':
+        return cargar_recursos_ml()[0]
+    if nombre == 'spanish_stopwords':
+        return obtener_stopwords()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+# --- PRECARGA Y TIEMPOS DE ARRANQUE ---
+
+MODULOS_PESADOS = ('torch', 'sentence_transformers', 'sklearn', 'nltk', 'google.genai')
+_precarga = None
+_precarga_lock = threading.Lock()
+
+def iniciar_precarga():
+    """
+    Carga en segundo plano encoder, índice de referencias, modelo lineal y
+    stopwords. Idempotente: sólo arranca un hilo por proceso.
+    """
+    global _precarga
+    with _precarga_lock:
+        if _precarga is None:
+            def _precargar():
+                with _cronometrar('precarga'):
+                    obtener_encoder()
+                    cargar_indice_referencias()
+                    cargar_matchers_keywords()
+                    obtener_modelo_lineal()
+                    obtener_stopwords()
+            _precarga = threading.Thread(target=_precargar, name="logica-precarga", daemon=True)
+            _precarga.start()
+    return _precarga
+
+def reporte_carga():
+    """
+    Informe al estilo de -X importtime para las cargas diferidas:
+    segundos de cada importación/carga realizada y módulos pesados presentes.
+    """
+    return {
+        'tiempos_s': dict(sorted(_TIEMPOS_CARGA.items(), key=lambda kv: -kv[1])),
+        'modulos_pesados_cargados': [m for m in MODULOS_PESADOS if m in sys.modules],
+        'precarga_activa': _precarga is not None and _precarga.is_alive(),
+    }
 
 # --- FUNCIONES DE LÓGICA ---
 
@@ -76,75 +324,372 @@ def parse_list(x):
     except Exception:
         return [x]
 
-def get_keyword_coverage(student_answer, keywords):
-    kw_set = set(keywords or [])
-    if not isinstance(student_answer, str) or not student_answer.strip() or not kw_set:
-        return {"kw_recall": 0.0, "kw_precision": 0.0, "kw_f1": 0.0}
+def _normalizar_keywords(keywords):
+    if isinstance(keywords, str):
+        keywords = parse_list(keywords)
+    if not isinstance(keywords, (list, tuple, set)):
+        return ()
+    return tuple(str(kw) for kw in keywords)
+
+@lru_cache(maxsize=1024)
+def _compilar_matcher(keywords):
+    return KeywordMatcher(keywords, obtener_stopwords())
+
+def compilar_matcher(keywords):
+    """KeywordMatcher (plegado de acentos, stemming y frases) para una lista de keywords."""
+    return _compilar_matcher(_normalizar_keywords(keywords))
+
+def get_keyword_coverage(student_answer, keywords, matcher=None, stemmed=False):
+    # kw_recall/kw_precision/kw_f1 (tokens exactos, entradas del modelo);
+    # las kw_stem_* con stemming sólo si se piden (informes, no entran en el score)
+    if not isinstance(student_answer, str) or not student_answer.strip():
+        return dict.fromkeys(COVERAGE_FEATURES if stemmed else EXACT_FEATURES, 0.0)
+    with metrics.timer("keywords.coverage"):
+        matcher = matcher or compilar_matcher(keywords)
+        return matcher.coverage(student_answer, stemmed)
+
+# --- ENCODER INTERCAMBIABLE ---
+
+def configurar_encoder(encoder):
+    """
+    Sustituye el encoder del proceso por cualquier objeto con la interfaz de
+    SentenceTransformer (encode + get_sentence_embedding_dimension).
+    Invalida el índice de referencias calculado con el encoder anterior.
+    """
+    global _encoder, _id_encoder_personalizado
+    _encoder = encoder
+    tipo = type(encoder)
+    _id_encoder_personalizado = f"custom:{tipo.__module__}.{tipo.__qualname__}"
+    cargar_indice_referencias.clear()
+    obtener_cache_embeddings().clear(namespace=_id_encoder_personalizado)
+
+def identificador_encoder():
+    """Modelo y backend que producen los embeddings ('<modelo SBERT>:<backend>' o 'custom:<clase>')"""
+    return _id_encoder_personalizado or f"{SBERT_MODEL_ID}:{leer_secreto('SBERT_BACKEND', 'torch')}"
+
+def verificar_paridad_encoder(encoder_base, encoder_candidato, df=None, tolerancia=0.02):
+    """
+    Compara las similitudes coseno de dos encoders sobre el banco de preguntas.
+    Para cada pregunta se calcula la matriz de similitudes entre todas sus
+    respuestas de referencia (correctas e incorrectas) con ambos encoders.
+    Devuelve un dict con la diferencia absoluta máxima/media y si cumple la tolerancia.
+    """
+    df = cargar_dataset() if df is None else df
+    diferencias = []
+    for correctas, incorrectas in zip(df['ANSWER_CORRECT'], df['WRONG_EXAMPLES']):
+        textos = _limpiar_referencias(correctas) + _limpiar_referencias(incorrectas)
+        if not textos:
+            continue
+        emb_base = np.asarray(encoder_base.encode(textos, normalize_embeddings=True), dtype=np.float32)
+        emb_cand = np.asarray(encoder_candidato.encode(textos, normalize_embeddings=True), dtype=np.float32)
+        diferencias.append(np.abs(emb_base @ emb_base.T - emb_cand @ emb_cand.T).ravel())
+
+    diferencias = np.concatenate(diferencias) if diferencias else np.zeros(1)
+    return {
+        'max_abs_diff': float(diferencias.max()),
+        'mean_abs_diff': float(diferencias.mean()),
+        'tolerancia': tolerancia,
+        'ok': bool(diferencias.max() <= tolerancia)
+    }
+
+# --- ÍNDICE DE EMBEDDINGS DE REFERENCIA ---
+
+# Embeddings normalizados (norma 1) de las respuestas de referencia de una pregunta.
+# Con vectores normalizados la similitud coseno es un simple producto escalar.
+ReferenciasPregunta = namedtuple('ReferenciasPregunta', ['correctas', 'incorrectas'])
+
+def _codificar_normalizado(textos):
+    # Un único forward de SBERT para todos los textos
+    if not textos:
+        dim = obtener_encoder().get_sentence_embedding_dimension()
+        return np.zeros((0, dim), dtype=np.float32)
+    emb = obtener_encoder().encode(list(textos), normalize_embeddings=True, convert_to_numpy=True)
+    return np.asarray(emb, dtype=np.float32)
+
+@st.cache_resource
+def obtener_cache_embeddings():
+    """
+    Caché LRU de embeddings de respuestas de estudiantes, acotada por memoria
+    (EMBEDDING_CACHE_MB, 64 por defecto). EMBEDDING_CACHE_PATH activa la capa en disco.
+    """
+    max_mb = float(leer_secreto("EMBEDDING_CACHE_MB", 64))
+    ruta = leer_secreto("EMBEDDING_CACHE_PATH", "") or None
+    espacio = f"{SBERT_MODEL_ID}:{leer_secreto('SBERT_BACKEND', 'torch')}"
+    return EmbeddingCache(int(max_mb * 1024 * 1024), ruta, namespace=espacio)
 
-    clean = preprocess_text(student_answer)
-    words = clean.split()
-    student_words = {w for w in words if w not in spanish_stopwords and len(w) > 2}
+def codificar_respuestas(limpias):
+    """
+    Embeddings normalizados de respuestas ya pasadas por preprocess_text.
+    Sólo se codifican (en un único batch) los textos que no están en caché.
+    """
+    cache = obtener_cache_embeddings()
+    # outcome "cache" = ningún texto pasó por SBERT
+    with metrics.timer("sbert.encode", outcome="cache") as tramo:
+        encontrados = cache.get_many(limpias)
+        faltan = [i for i, emb in enumerate(encontrados) if emb is None]
+        if faltan:
+            tramo.outcome = "encoded"
+            unicos = list(dict.fromkeys(limpias[i] for i in faltan))
+            emb_nuevos = _codificar_normalizado(unicos)
+            cache.put_many(unicos, emb_nuevos)
+            por_texto = dict(zip(unicos, emb_nuevos))
+            for i in faltan:
+                encontrados[i] = por_texto[limpias[i]]
 
-    if not student_words:
-        return {"kw_recall": 0.0, "kw_precision": 0.0, "kw_f1": 0.0}
+    if not encontrados:
+        return _codificar_normalizado([])
+    return np.vstack(encontrados)
 
-    overlap = student_words & kw_set
-    hits = len(overlap)
-    kw_recall = hits / len(kw_set) if kw_set else 0.0
-    kw_precision = hits / len(student_words) if student_words else 0.0
-    kw_f1 = (2 * kw_precision * kw_recall / (kw_precision + kw_recall)) if (kw_precision + kw_recall) > 0 else 0.0
+def _limpiar_referencias(valor):
+    lista = parse_list(valor)
+    if not isinstance(lista, (list, tuple)):
+        lista = [] if pd.isna(lista) else [lista]
+    return [preprocess_text(str(ref)) for ref in lista]
 
-    return {"kw_recall": kw_recall, "kw_precision": kw_precision, "kw_f1": kw_f1}
+def construir_indice_referencias(df):
+    """
+    Codifica todas las respuestas de referencia del banco en un solo batch.
+    Devuelve {QUESTION_ID: ReferenciasPregunta(correctas, incorrectas)}.
+    """
+    if df is None or df.empty:
+        return {}
 
-def get_semantic_similarity(model_correct, model_wrong, student_answer, keywords=None):
-    correct_list = parse_list(model_correct)
-    wrong_list = parse_list(model_wrong)
-    
+    textos, tramos = [], []
+    for qid, correctas, incorrectas in zip(df['QUESTION_ID'], df['ANSWER_CORRECT'], df['WRONG_EXAMPLES']):
+        refs_ok = _limpiar_referencias(correctas)
+        refs_mal = _limpiar_referencias(incorrectas)
+        inicio = len(textos)
+        textos.extend(refs_ok)
+        textos.extend(refs_mal)
+        tramos.append((qid, inicio, inicio + len(refs_ok), len(textos)))
+
+    emb = _codificar_normalizado(textos)
+    return {
+        qid: ReferenciasPregunta(emb[ini:mitad], emb[mitad:fin])
+        for qid, ini, mitad, fin in tramos
+    }
+
+@st.cache_resource
+def cargar_indice_referencias():
+    # Con el artefacto compilado para este encoder no se codifica nada: vistas float16
+    # sobre el memmap. Si no, se construye una vez por proceso desde cargar_dataset()
+    artefacto = cargar_artefacto_banco()
+    if artefacto is not None and artefacto.encoder_id == identificador_encoder():
+        return artefacto.reference_index(ReferenciasPregunta)
+    return construir_indice_referencias(cargar_dataset())
+
+def _resumen_similitudes(sims):
+    if sims.size == 0:
+        return 0.0, 0.0
+    return float(sims.mean()), float(sims.max())
+
+def get_semantic_similarity(model_correct, model_wrong, student_answer, keywords=None, question_id=None):
+    # Tiempo total de la evaluación (incluye sbert.encode y keywords.coverage)
+    with metrics.timer("similarity"):
+        return _similitud_semantica(model_correct, model_wrong, student_answer, keywords, question_id)
+
+def _similitud_semantica(model_correct, model_wrong, student_answer, keywords, question_id):
     clean_student = preprocess_text(student_answer)
     if not clean_student:
-        return {'avg_correct': 0.0, 'avg_wrong': 0.0, 'max_correct': 0.0, 'max_wrong': 0.0}
+        # Sólo signos de puntuación ("???"): todas las features a cero, también las de keywords
+        base = {'avg_correct': 0.0, 'avg_wrong': 0.0, 'max_correct': 0.0, 'max_wrong': 0.0}
+        base.update(get_keyword_coverage("", keywords))
+        return base
 
-    embedding_student = model_sbert.encode([clean_student])
+    # Si la pregunta está en el índice no se vuelve a codificar ninguna referencia
+    refs = cargar_indice_referencias().get(question_id) if question_id is not None else None
+    if refs is None:
+        refs_ok = _limpiar_referencias(model_correct)
+        refs_mal = _limpiar_referencias(model_wrong)
+        emb = _codificar_normalizado(refs_ok + refs_mal)
+        refs = ReferenciasPregunta(emb[:len(refs_ok)], emb[len(refs_ok):])
 
-    def sim_to_list(list_ref):
-        sims = []
-        for ref in list_ref:
-            clean_ref = preprocess_text(str(ref))
-            emb_ref = model_sbert.encode([clean_ref])
-            sims.append(float(cosine_similarity(emb_ref, embedding_student)[0][0]))
-        return sims
+    embedding_student = codificar_respuestas([clean_student])[0]
+    avg_correct, max_correct = _resumen_similitudes(refs.correctas @ embedding_student)
+    avg_wrong, max_wrong = _resumen_similitudes(refs.incorrectas @ embedding_student)
 
-    correct_scores = sim_to_list(correct_list)
-    wrong_scores = sim_to_list(wrong_list)
-    
     base = {
-        'avg_correct': sum(correct_scores)/len(correct_scores) if correct_scores else 0.0,
-        'avg_wrong': sum(wrong_scores)/len(wrong_scores) if wrong_scores else 0.0,
-        'max_correct': max(correct_scores) if correct_scores else 0.0,
-        'max_wrong': max(wrong_scores) if wrong_scores else 0.0
+        'avg_correct': avg_correct,
+        'avg_wrong': avg_wrong,
+        'max_correct': max_correct,
+        'max_wrong': max_wrong
     }
-    base.update(get_keyword_coverage(student_answer, keywords or []))
+    matcher = cargar_matchers_keywords().get(question_id) if question_id is not None else None
+    base.update(get_keyword_coverage(student_answer, keywords or [], matcher=matcher))
     return base
 
-def scorer_logreg_kw(row):
-    if model_kw is None: return 0.0 # Fallback si no hay modelo
-    linear = model_kw.intercept_[0]
-    for coef, feat in zip(model_kw.coef_[0], features):
-        linear += coef * row.get(feat, 0)
+def scorer_logreg_matriz(X):
+    """
+    Score de la regresión logística para N filas a la vez.
+    X: array (N, 7) en el orden de feature_cols, o DataFrame con esas columnas.
+    """
+    if isinstance(X, pd.DataFrame):
+        X = X[features].to_numpy(dtype=np.float64)
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    comprobar_modelo()
+    modelo_lineal = obtener_modelo_lineal()
+    if modelo_lineal is None:
+        return np.zeros(len(X)) # Fallback si no hay modelo
+    coef, intercept = modelo_lineal
+    linear = X @ coef + intercept
     return 1 / (1 + np.exp(-linear))
 
+def interpretar_3clases_matriz(scores, umbral_bajo=None, umbral_alto=None):
+    # Umbrales opcionales para barridos sobre históricos
+    actual_bajo, actual_alto = umbrales
+    umbral_bajo = actual_bajo if umbral_bajo is None else umbral_bajo
+    umbral_alto = actual_alto if umbral_alto is None else umbral_alto
+    scores = np.asarray(scores, dtype=np.float64)
+    return np.select([scores >= umbral_alto, scores <= umbral_bajo], ['Correcta', 'Incorrecta'], default='Revisar')
+
+def evaluar_matriz(X, umbral_bajo=None, umbral_alto=None):
+    """Devuelve (scores, etiquetas) para una matriz de features."""
+    scores = scorer_logreg_matriz(X)
+    return scores, interpretar_3clases_matriz(scores, umbral_bajo, umbral_alto)
+
+def scorer_logreg_kw(row):
+    with metrics.timer("scoring"):
+        fila = [[row.get(feat, 0) for feat in features]]
+        return float(scorer_logreg_matriz(fila)[0])
+
 def interpretar_3clases(score):
-    if score >= t_high: return 'Correcta'
-    elif score <= t_low: return 'Incorrecta'
-    else: return 'Revisar'
-
-def generar_feedback_genai(pregunta, student_answer, interpretacion, referencia, hint):
-    # Intentamos obtener la API KEY de los secretos de Streamlit
-    
-    api_key = st.secrets["GEMINI_API_KEY"]
-    client = genai.Client(api_key=api_key)
-    
-    prompt = f"""
+    return str(interpretar_3clases_matriz([score])[0])
+
+# --- EVALUACIÓN POR LOTES ---
+
+@st.cache_resource
+def cargar_matchers_keywords():
+    # Un KeywordMatcher compilado por pregunta, con las keywords ya parseadas del banco
+    return {p.question_id: compilar_matcher(p.keywords) for p in cargar_banco_preguntas()}
+
+def grade_batch(question_ids, answers, stemmed_keywords=False):
+    """
+    Evalúa un lote de respuestas (una por cada QUESTION_ID de question_ids).
+    Todas las respuestas se codifican en una sola llamada a encode y las
+    similitudes se calculan por pregunta como productos de matrices.
+    Devuelve un DataFrame con QUESTION_ID, las 7 features, score e interpretacion;
+    con stemmed_keywords=True añade la cobertura de keywords con stemming
+    (kw_stem_*, para informes: no entra en el score).
+    """
+    question_ids = list(question_ids)
+    answers = list(answers)
+    if len(question_ids) != len(answers):
+        raise ValueError("question_ids y answers deben tener la misma longitud")
+    with metrics.timer("grade_batch"):
+        return _evaluar_lote(question_ids, answers, stemmed_keywords)
+
+def _evaluar_lote(question_ids, answers, stemmed_keywords=False):
+
+    indice = cargar_indice_referencias()
+    desconocidas = set(question_ids) - indice.keys()
+    if desconocidas:
+        raise KeyError(f"QUESTION_ID no encontrados en el banco: {sorted(desconocidas)}")
+    matchers = cargar_matchers_keywords()
+
+    n = len(answers)
+    col = {f: i for i, f in enumerate(features)}
+    X = np.zeros((n, len(features)), dtype=np.float64)
+    cobertura_stem = np.zeros((n, len(STEMMED_FEATURES)), dtype=np.float64)
+
+    limpias = [preprocess_text(a) for a in answers]
+    con_texto = np.array([bool(c) for c in limpias], dtype=bool)
+    qids = np.asarray(question_ids, dtype=object)
+
+    if con_texto.any():
+        # Un único forward de SBERT para todo el lote
+        emb = codificar_respuestas([c for c in limpias if c])
+        filas_emb = np.full(n, -1)
+        filas_emb[con_texto] = np.arange(len(emb))
+
+        for qid in pd.unique(qids[con_texto]):
+            filas = np.flatnonzero(con_texto & (qids == qid))
+            emb_q = emb[filas_emb[filas]]
+            refs = indice[qid]
+            for nombre, matriz in (('correct', refs.correctas), ('wrong', refs.incorrectas)):
+                if len(matriz) == 0:
+                    continue
+                sims = emb_q @ matriz.T
+                X[filas, col[f'avg_{nombre}']] = sims.mean(axis=1)
+                X[filas, col[f'max_{nombre}']] = sims.max(axis=1)
+
+            matcher = matchers.get(qid) or compilar_matcher([])
+            cobertura = matcher.coverage_batch([answers[fila] for fila in filas], stemmed_keywords)
+            X[np.ix_(filas, [col[f] for f in EXACT_FEATURES])] = cobertura[:, :len(EXACT_FEATURES)]
+            if stemmed_keywords:
+                cobertura_stem[filas] = cobertura[:, len(EXACT_FEATURES):]
+
+    resultado = pd.DataFrame(X, columns=features)
+    resultado.insert(0, 'QUESTION_ID', question_ids)
+    resultado['score'], resultado['interpretacion'] = evaluar_matriz(X)
+    if stemmed_keywords:
+        resultado[list(STEMMED_FEATURES)] = cobertura_stem
+    return resultado
+
+# --- FEEDBACK CON GENAI ---
+
+MODELOS_GENAI = ["gemini-2.0-flash", "gemini-2.0-flash-lite"]
+# Peticiones por minuto de cada modelo (cuota gratuita de la API)
+LIMITES_GENAI = {"gemini-2.0-flash": 15, "gemini-2.0-flash-lite": 30}
+
+# Feedback "humano" neutro en lugar del traceback de ERROR
+FEEDBACK_FALLBACK = (
+    "Por ahora no pude generar feedback automático. "
+    "Revisa tu respuesta comparando los conceptos clave vistos en clase "
+    "y las pistas proporcionadas."
+)
+
+@st.cache_resource
+def obtener_cliente_genai():
+    """
+    Cliente GenAI único por proceso (reutiliza su sesión HTTP).
+    GEMINI_BASE_URL permite apuntar a un servidor local que simule la API.
+    """
+    with _cronometrar('google.genai'):
+        from google import genai
+
+    http_options = {}
+    base_url = leer_secreto("GEMINI_BASE_URL")
+    if base_url:
+        http_options["base_url"] = base_url
+    return genai.Client(api_key=leer_secreto("GEMINI_API_KEY"), http_options=http_options or None)
+
+@st.cache_resource
+def obtener_bucle_genai():
+    # Bucle asyncio propio en un hilo demonio: las llamadas concurrentes no
+    # bloquean el hilo de Streamlit y el cliente async vive siempre en el mismo bucle
+    bucle = asyncio.new_event_loop()
+    threading.Thread(target=bucle.run_forever, name="genai-loop", daemon=True).start()
+    return bucle
+
+@st.cache_resource
+def obtener_programador_genai():
+    """
+    Programador compartido por todas las sesiones del proceso: recuerda los
+    429 de cada modelo y envía cada petición directamente al que tiene cuota.
+    """
+    presupuesto = float(leer_secreto("GENAI_LATENCY_BUDGET", 3.0))
+    return ModelScheduler([(m, LIMITES_GENAI[m]) for m in MODELOS_GENAI], latency_budget=presupuesto)
+
+@st.cache_resource
+def obtener_cache_feedback():
+    # Caché persistente de feedback; FEEDBACK_CACHE_PATH vacío la desactiva
+    ruta = leer_secreto("FEEDBACK_CACHE_PATH", "feedback_cache.sqlite3")
+    if not ruta:
+        return None
+    return FeedbackCache(ruta)
+
+def _clave_feedback(question_id, student_answer, interpretacion):
+    if question_id is None or obtener_cache_feedback() is None:
+        return None
+    return FeedbackCache.make_key(question_id, preprocess_text(student_answer), interpretacion)
+
+def _guardar_feedback(clave, feedback, modelo):
+    # El texto de fallback no se guarda para reintentar en el próximo envío
+    if clave is not None and modelo != "ERROR":
+        obtener_cache_feedback().set(clave, feedback, modelo)
+
+def _construir_prompt(pregunta, student_answer, interpretacion, referencia, hint):
+    return f"""
             Eres profesor de un máster en Deep Learning y corriges preguntas abiertas de teoría.
             
             Tu tarea:
@@ -192,25 +737,95 @@ def generar_feedback_genai(pregunta, student_answer, interpretacion, referencia,
             Devuelve solo el texto del feedback, en un único párrafo de máximo 3–4 líneas, sin listas, encabezados ni emojis.
             """
 
-    MODELOS = ["gemini-2.0-flash", "gemini-2.0-flash-lite"]
-    for modelo in MODELOS:
-        try:
-            resp = client.models.generate_content(model=modelo,contents=prompt,)
-            feedback = resp.text.strip()
-            return feedback, modelo
-        except Exception as e:
-            msg = str(e).lower()
-            # Por si hay error de rate limit
-            if ("rate" in msg and "limit" in msg) or "429" in msg or "resourceexhausted" in msg:
-                ultimo_error = e
-                continue  # intenta con el siguiente modelo
-            ultimo_error = e
-            break
-    # Feedback "humano" neutro en lugar del traceback de ERROR
-    feedback_fallback = (
-        "Por ahora no pude generar feedback automático. "
-        "Revisa tu respuesta comparando los conceptos clave vistos en clase "
-        "y las pistas proporcionadas."
-    )
+def _es_rate_limit(error):
+    msg = str(error).lower()
+    return ("rate" in msg and "limit" in msg) or "429" in msg or "resourceexhausted" in msg
+
+def generar_feedback_genai(pregunta, student_answer, interpretacion, referencia, hint, question_id=None):
+    # outcome de la métrica genai.feedback: modelo usado, "cache" o "fallback"
+    with metrics.timer("genai.feedback", outcome="fallback") as tramo:
+        # Con question_id se consulta primero la caché de feedback (sin llamada de red)
+        clave = _clave_feedback(question_id, student_answer, interpretacion)
+        if clave is not None:
+            cacheado = obtener_cache_feedback().get(clave)
+            if cacheado is not None:
+                tramo.outcome = "cache"
+                return cacheado
+
+        client = obtener_cliente_genai()
+        programador = obtener_programador_genai()
+        prompt = _construir_prompt(pregunta, student_answer, interpretacion, referencia, hint)
+
+        intentados = set()
+        # None = ningún modelo con cuota dentro del presupuesto de latencia
+        while (modelo := programador.acquire(exclude=intentados)) is not None:
+            try:
+                resp = client.models.generate_content(model=modelo, contents=prompt)
+                feedback = resp.text.strip()
+                programador.report_success(modelo)
+                _guardar_feedback(clave, feedback, modelo)
+                tramo.outcome = modelo
+                return feedback, modelo
+            except Exception as e:
+                # Por si hay error de rate limit: intenta con el siguiente modelo
+                if _es_rate_limit(e):
+                    programador.report_rate_limited(modelo)
+                    intentados.add(modelo)
+                    continue
+                break
+
+        return FEEDBACK_FALLBACK, "ERROR"
+
+async def generar_feedback_genai_async(pregunta, student_answer, interpretacion, referencia, hint, question_id=None):
+    """Versión asíncrona de generar_feedback_genai (misma caché, cadena de modelos y métrica)."""
+    with metrics.timer("genai.feedback", outcome="fallback") as tramo:
+        clave = _clave_feedback(question_id, student_answer, interpretacion)
+        if clave is not None:
+            cacheado = obtener_cache_feedback().get(clave)
+            if cacheado is not None:
+                tramo.outcome = "cache"
+                return cacheado
+
+        client = obtener_cliente_genai()
+        programador = obtener_programador_genai()
+        prompt = _construir_prompt(pregunta, student_answer, interpretacion, referencia, hint)
 
-    return feedback_fallback, "ERROR"
+        intentados = set()
+        while (modelo := await programador.acquire_async(exclude=intentados)) is not None:
+            try:
+                resp = await client.aio.models.generate_content(model=modelo, contents=prompt)
+                feedback = resp.text.strip()
+                programador.report_success(modelo)
+                _guardar_feedback(clave, feedback, modelo)
+                tramo.outcome = modelo
+                return feedback, modelo
+            except Exception as e:
+                if _es_rate_limit(e):
+                    programador.report_rate_limited(modelo)
+                    intentados.add(modelo)
+                    continue
+                break
+
+        return FEEDBACK_FALLBACK, "ERROR"
+
+async def generar_feedback_lote_async(items, max_concurrencia=8):
+    """
+    Genera feedback para muchas respuestas a la vez.
+    items: lista de dicts con los argumentos de generar_feedback_genai
+    (pregunta, student_answer, interpretacion, referencia, hint y opcionalmente question_id).
+    Devuelve [(feedback, modelo), ...] en el mismo orden que items.
+    """
+    semaforo = asyncio.Semaphore(max_concurrencia)
+
+    async def _uno(item):
+        async with semaforo:
+            return await generar_feedback_genai_async(**item)
+
+    return await asyncio.gather(*(_uno(item) for item in items))
+
+def generar_feedback_lote(items, max_concurrencia=8):
+    # Entrada síncrona (Streamlit, scripts): el lote corre en el bucle compartido
+    futuro = asyncio.run_coroutine_threadsafe(
+        generar_feedback_lote_async(list(items), max_concurrencia), obtener_bucle_genai()
+    )
+    return futuro.result()
@@ -0,0 +1,175 @@
+"""
+Lightweight per-stage instrumentation
+Durations and outcomes of each grading stage (SBERT encoding, keyword coverage,
+scoring, Gemini feedback, database writes...) go into process-wide rolling
+histograms that can be exported as JSON or Prometheus text
+"""
+
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Sequence
+
+import numpy as np
+
+# Cumulative Prometheus buckets, in seconds (Gemini calls can take several seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PERCENTILES = (50, 95, 99)
+
+
+class RollingHistogram:
+    """
+    Percentiles over the last `window` samples plus cumulative bucket counts
+    The window keeps the panel focused on recent traffic; the buckets never reset
+    """
+
+    def __init__(self, window: int = 1024, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._recent = deque(maxlen=window)
+        self._bucket_counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.outcomes: Counter = Counter()
+
+    def observe(self, seconds: float, outcome: str = "ok") -> None:
+        self._recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.outcomes[outcome] += 1
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self._bucket_counts[i] += 1
+                break
+        else:
+            self._bucket_counts[-1] += 1
+
+    def percentiles(self, qs: Sequence[float] = PERCENTILES) -> Dict[str, float]:
+        if not self._recent:
+            return {f"p{q}": 0.0 for q in qs}
+        values = np.percentile(np.fromiter(self._recent, dtype=np.float64), qs)
+        return {f"p{q}": float(v) for q, v in zip(qs, values)}
+
+    def cumulative_buckets(self):
+        """(upper bound, cumulative count) pairs, ending with +Inf"""
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self._bucket_counts):
+            running += n
+            yield bound, running
+
+    def snapshot(self) -> Dict:
+        data = {
+            "count": self.count,
+            "window": len(self._recent),
+            "mean_s": self.total / self.count if self.count else 0.0,
+        }
+        data.update({f"{k}_s": v for k, v in self.percentiles().items()})
+        data["outcomes"] = dict(self.outcomes)
+        return data
+
+
+class _Span:
+    """Handle yielded by Metrics.timer; set .outcome to label the recorded sample"""
+
+    __slots__ = ("outcome",)
+
+    def __init__(self, outcome: str):
+        self.outcome = outcome
+
+
+class Metrics:
+    """Thread-safe registry of RollingHistogram per stage"""
+
+    def __init__(self, window: int = 1024, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.window = window
+        self.buckets = tuple(buckets)
+        self._stages: Dict[str, RollingHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, outcome: str = "ok") -> None:
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = RollingHistogram(self.window, self.buckets)
+            histogram.observe(seconds, outcome)
+
+    @contextmanager
+    def timer(self, stage: str, outcome: str = "ok") -> Iterator[_Span]:
+        """
+        Time a block:  with metrics.timer("genai.feedback") as span: ...; span.outcome = modelo
+        An exception leaving the block is recorded with outcome "error" and re-raised
+        """
+        span = _Span(outcome)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.outcome = "error"
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, span.outcome)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {stage: h.snapshot() for stage, h in sorted(self._stages.items())}
+
+    def to_json(self) -> str:
+        return json.dumps({"generated_at": time.time(), "stages": self.snapshot()}, indent=2)
+
+    def to_prometheus(self, prefix: str = "evalia") -> str:
+        """Prometheus text exposition format (histogram, window quantiles and outcome counters)"""
+        duration = f"{prefix}_stage_duration_seconds"
+        window = f"{prefix}_stage_duration_window_seconds"
+        outcomes = f"{prefix}_stage_outcomes_total"
+        lines = [
+            f"# HELP {duration} Duration of each grading stage",
+            f"# TYPE {duration} histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for stage, h in stages:
+                for bound, n in h.cumulative_buckets():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{duration}_bucket{{stage="{stage}",le="{le}"}} {n}')
+                lines.append(f'{duration}_sum{{stage="{stage}"}} {h.total}')
+                lines.append(f'{duration}_count{{stage="{stage}"}} {h.count}')
+
+            lines += [
+                f"# HELP {window} Percentiles over the most recent samples of each stage",
+                f"# TYPE {window} gauge",
+            ]
+            for stage, h in stages:
+                for name, value in h.percentiles().items():
+                    q = int(name[1:]) / 100
+                    lines.append(f'{window}{{stage="{stage}",quantile="{q}"}} {value}')
+
+            lines += [
+                f"# HELP {outcomes} Samples per stage and outcome (model used, cache, fallback, error...)",
+                f"# TYPE {outcomes} counter",
+            ]
+            for stage, h in stages:
+                for outcome, n in sorted(h.outcomes.items()):
+                    lines.append(f'{outcomes}{{stage="{stage}",outcome="{_escape(outcome)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry shared by logica, database and the app
+registry = Metrics()
+
+
+def timer(stage: str, outcome: str = "ok"):
+    return registry.timer(stage, outcome)
+
+
+def record(stage: str, seconds: float, outcome: str = "ok") -> None:
+    registry.record(stage, seconds, outcome)
+
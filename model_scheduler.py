@@ -0,0 +1,144 @@
+"""
+Quota-aware scheduler for the Gemini model fallback chain
+Per-model token buckets plus a circuit breaker that remembers rate limits
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class ModelScheduler:
+    """
+    Picks the first model in preference order that has capacity right now.
+
+    - Each model has a token bucket sized to its requests-per-minute quota.
+    - A 429 / ResourceExhausted opens the model's circuit with exponential
+      backoff, so later requests skip it instead of rediscovering the limit.
+    - If no model frees up within the latency budget the request is shed
+      (acquire returns None) and the caller uses its fallback text.
+    """
+
+    def __init__(self, limits: Iterable[Tuple[str, float]], latency_budget: float = 3.0,
+                 base_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.models: List[str] = []
+        self._buckets: Dict[str, TokenBucket] = {}
+        for model, rpm in limits:
+            self.models.append(model)
+            # Burst of up to a few requests, then the steady per-minute rate
+            self._buckets[model] = TokenBucket(rate=rpm / 60.0, capacity=max(1.0, min(rpm, 5)))
+        self.latency_budget = latency_budget
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._open_until: Dict[str, float] = {m: 0.0 for m in self.models}
+        self._failures: Dict[str, int] = {m: 0 for m in self.models}
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, exclude) -> Tuple[Optional[str], float]:
+        """Returns (model, 0) if one was reserved, else (None, seconds until the earliest one frees up)"""
+        now = time.monotonic()
+        earliest = float("inf")
+        with self._lock:
+            for model in self.models:
+                if model in exclude:
+                    continue
+                wait = max(self._open_until[model] - now, self._buckets[model].wait_time(now))
+                if wait <= 0:
+                    self._buckets[model].take(now)
+                    return model, 0.0
+                earliest = min(earliest, wait)
+        return None, earliest
+
+    def acquire(self, exclude: Iterable[str] = (), latency_budget: Optional[float] = None) -> Optional[str]:
+        """
+        Reserve a request slot, waiting at most the latency budget
+        Returns: model name, or None if the request should be shed
+        """
+        exclude = set(exclude)
+        deadline = time.monotonic() + (self.latency_budget if latency_budget is None else latency_budget)
+        while True:
+            model, wait = self._try_acquire(exclude)
+            if model is not None:
+                return model
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                with self._lock:
+                    self.shed += 1
+                return None
+            time.sleep(wait)
+
+    async def acquire_async(self, exclude: Iterable[str] = (), latency_budget: Optional[float] = None) -> Optional[str]:
+        """Same as acquire() but waits with asyncio.sleep"""
+        exclude = set(exclude)
+        deadline = time.monotonic() + (self.latency_budget if latency_budget is None else latency_budget)
+        while True:
+            model, wait = self._try_acquire(exclude)
+            if model is not None:
+                return model
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                with self._lock:
+                    self.shed += 1
+                return None
+            await asyncio.sleep(wait)
+
+    def report_success(self, model: str) -> None:
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self._failures[model] = 0
+            self._open_until[model] = 0.0
+
+    def report_rate_limited(self, model: str, retry_after: Optional[float] = None) -> None:
+        """Open the circuit for `model` with exponential backoff"""
+        with self._lock:
+            self._failures[model] += 1
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._failures[model] - 1))
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            self._open_until[model] = time.monotonic() + backoff
+            # Drain the bucket: the provider says there is no quota left
+            self._buckets[model].tokens = min(self._buckets[model].tokens, 0.0)
+
+    def status(self) -> Dict:
+        """Snapshot of each model's circuit and available tokens"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "shed": self.shed,
+                "models": {
+                    m: {
+                        "circuit_open": self._open_until[m] > now,
+                        "reopens_in": max(0.0, self._open_until[m] - now),
+                        "consecutive_rate_limits": self._failures[m],
+                        "tokens": round(self._buckets[m].tokens, 2),
+                    }
+                    for m in self.models
+                },
+            }
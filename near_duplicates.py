@@ -0,0 +1,281 @@
+"""
+Near-duplicate answer detection
+Flags answers to the same question from different students whose SBERT
+embeddings (the normalized vectors logica already computes for grading, so
+cache hits) have a cosine similarity of at least DUPLICATE_THRESHOLD. Matching
+answers are merged into clusters with a union-find.
+
+Each question has its own index:
+- batches (the first load, bulk imports) are compared exactly, with blocked
+  matrix products that never hold more than BLOCK_ROWS x n similarities
+- single new answers go through a random-hyperplane LSH (SimHash): only the
+  answers sharing a bucket in some table are compared, so a check touches a
+  small fraction of the question's answers. With the default 16 tables of 10
+  bits, a pair at cosine 0.9 is found about 98% of the time
+
+The detector follows the submissions table by id: every sync() reads only the
+rows written since the previous one, wherever they came from (this process,
+other app processes or the spool).
+
+Usage:
+    python near_duplicates.py [--threshold 0.9]     # print the clusters as JSON
+"""
+
+import argparse
+import json
+import sys
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import streamlit as st
+
+import database as db
+import logica
+import metrics
+
+DEFAULT_THRESHOLD = 0.9
+# Shorter answers ("no sé", "una red") are alike by nature, not copied
+MIN_WORDS = 4
+LSH_TABLES = 16
+LSH_BITS = 10
+# Batches of at least this many new answers are compared exactly
+EXACT_BATCH_MIN = 32
+BLOCK_ROWS = 512
+
+ROW_COLUMNS = ('id', 'timestamp', 'student_name', 'pregunta_id', 'respuesta', 'respuesta_completa')
+
+
+def answer_text(row: Dict) -> str:
+    """The whole answer: 'respuesta' is cut to 200 characters for display when respuesta_completa is set"""
+    return row.get('respuesta_completa') or row.get('respuesta') or ''
+
+
+class SimHashLSH:
+    """Multi-table random-hyperplane LSH over normalized vectors"""
+
+    def __init__(self, dim: int, tables: int = LSH_TABLES, bits: int = LSH_BITS, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.tables = tables
+        self.bits = bits
+        self.planes = rng.standard_normal((tables * bits, dim)).astype(np.float32)
+        self._weights = 1 << np.arange(bits, dtype=np.int64)
+        self._buckets: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(tables)]
+
+    def keys(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, tables) bucket key of each vector in each table"""
+        signs = (vectors @ self.planes.T > 0).reshape(len(vectors), self.tables, self.bits)
+        return signs @ self._weights
+
+    def add(self, keys: np.ndarray, first_row: int) -> None:
+        for offset, row_keys in enumerate(keys):
+            for table, key in enumerate(row_keys):
+                self._buckets[table][int(key)].append(first_row + offset)
+
+    def candidates(self, row_keys: np.ndarray) -> np.ndarray:
+        """Rows sharing a bucket with these keys in at least one table"""
+        found = [self._buckets[table].get(int(key), ()) for table, key in enumerate(row_keys)]
+        return np.unique(np.fromiter((row for rows in found for row in rows), dtype=np.int64))
+
+
+class QuestionIndex:
+    """The answers to one question: embeddings, LSH buckets and clusters of near-duplicates"""
+
+    def __init__(self, dim: int, threshold: float = DEFAULT_THRESHOLD, seed: int = 0):
+        self.threshold = threshold
+        self.rows: List[Dict] = []
+        self._emb = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self._lsh = SimHashLSH(dim, seed=seed)
+        self._parent: List[int] = []
+        # Highest similarity inside each cluster (kept on the root)
+        self._best: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _find(self, i: int) -> int:
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]
+            i = self._parent[i]
+        return i
+
+    def _union(self, i: int, j: int, similarity: float) -> None:
+        a, b = self._find(i), self._find(j)
+        best = max(similarity, self._best.get(a, 0.0), self._best.get(b, 0.0))
+        if a != b:
+            self._parent[b] = a
+            self._best.pop(b, None)
+        self._best[a] = best
+
+    def _append(self, emb: np.ndarray) -> int:
+        """Store the vectors (capacity doubles, so appends are amortized O(1)); returns the first new row"""
+        first = self._size
+        needed = first + len(emb)
+        if needed > len(self._emb):
+            grown = np.zeros((max(needed, 2 * len(self._emb), 64), self._emb.shape[1]), dtype=np.float32)
+            grown[:first] = self._emb[:first]
+            self._emb = grown
+        self._emb[first:needed] = emb
+        self._size = needed
+        self._parent.extend(range(first, needed))
+        return first
+
+    def _link(self, i: int, candidates: np.ndarray, similarities: np.ndarray) -> int:
+        """Union row i with the candidates above the threshold from another student; returns the links made"""
+        student = self.rows[i].get('student_name')
+        above = similarities >= self.threshold
+        links = 0
+        for j, similarity in zip(candidates[above], similarities[above]):
+            if self.rows[j].get('student_name') != student:
+                self._union(int(j), i, float(similarity))
+                links += 1
+        return links
+
+    def add(self, rows: Sequence[Dict], emb: np.ndarray) -> int:
+        """
+        Index new answers (rows with the ROW_COLUMNS, emb normalized) and link them to earlier ones
+        Returns: number of near-duplicate pairs found
+        """
+        if not len(rows):
+            return 0
+        emb = np.asarray(emb, dtype=np.float32)
+        keys = self._lsh.keys(emb)
+        first = self._append(emb)
+        self.rows.extend(dict(row) for row in rows)
+        links = 0
+
+        if len(rows) >= EXACT_BATCH_MIN:
+            # Exact: each block of new rows against every earlier row, one matrix product per block
+            for start in range(first, self._size, BLOCK_ROWS):
+                end = min(start + BLOCK_ROWS, self._size)
+                sims = self._emb[start:end] @ self._emb[:end].T
+                for offset, i in enumerate(range(start, end)):
+                    links += self._link(i, np.arange(i), sims[offset, :i])
+            self._lsh.add(keys, first)
+        else:
+            # Incremental: compare only with the rows that share an LSH bucket
+            for offset, i in enumerate(range(first, self._size)):
+                candidates = self._lsh.candidates(keys[offset])
+                if len(candidates):
+                    links += self._link(i, candidates, self._emb[candidates] @ self._emb[i])
+                self._lsh.add(keys[offset:offset + 1], i)
+        return links
+
+    def clusters(self) -> List[Dict]:
+        """Groups of two or more linked answers, each with its rows and highest similarity"""
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i in range(self._size):
+            root = self._find(i)
+            if root in self._best:
+                groups[root].append(i)
+        return [
+            {
+                "similarity": round(self._best[root], 4),
+                "students": len({self.rows[i].get('student_name') for i in members}),
+                "rows": [self.rows[i] for i in members],
+            }
+            for root, members in groups.items()
+        ]
+
+
+class DuplicateDetector:
+    """
+    Per-question QuestionIndex kept in sync with the submissions table.
+
+    fetch_after(after_id) returns the submissions with id > after_id (ROW_COLUMNS);
+    encode(texts) returns normalized embeddings; clean(text) is the text that is encoded.
+    """
+
+    def __init__(self, fetch_after: Callable[[Optional[int]], List[Dict]],
+                 encode: Callable[[List[str]], np.ndarray], clean: Callable[[str], str] = str,
+                 threshold: float = DEFAULT_THRESHOLD, min_words: int = MIN_WORDS):
+        self.fetch_after = fetch_after
+        self.encode = encode
+        self.clean = clean
+        self.threshold = threshold
+        self.min_words = min_words
+        self.last_id: Optional[int] = None
+        self.indexed = 0
+        self._indexes: Dict[str, QuestionIndex] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def synced(self) -> bool:
+        """True once the stored submissions have been loaded"""
+        return self.last_id is not None
+
+    def sync(self) -> int:
+        """Index the submissions written since the last sync; returns how many were read"""
+        with self._lock, metrics.timer("duplicates.sync"):
+            rows = sorted(self.fetch_after(self.last_id), key=lambda row: row['id'])
+            if not rows and self.last_id is None:
+                self.last_id = 0
+            if not rows:
+                return 0
+
+            kept, texts = [], []
+            for row in rows:
+                text = self.clean(answer_text(row))
+                if len(text.split()) >= self.min_words:
+                    kept.append(row)
+                    texts.append(text)
+            if texts:
+                emb = np.asarray(self.encode(texts), dtype=np.float32)
+                by_question: Dict[str, List[int]] = defaultdict(list)
+                for position, row in enumerate(kept):
+                    by_question[row.get('pregunta_id')].append(position)
+                for question_id, positions in by_question.items():
+                    index = self._indexes.get(question_id)
+                    if index is None:
+                        index = self._indexes[question_id] = QuestionIndex(emb.shape[1], self.threshold)
+                    index.add([kept[p] for p in positions], emb[positions])
+            self.indexed += len(kept)
+            self.last_id = rows[-1]['id']
+            return len(rows)
+
+    def clusters(self, pregunta_id: Optional[str] = None) -> List[Dict]:
+        """Clusters with answers from two or more students, largest and closest first"""
+        with self._lock:
+            indexes = self._indexes.items() if pregunta_id is None else [(pregunta_id, self._indexes.get(pregunta_id))]
+            found = [
+                {"pregunta_id": question_id, **cluster}
+                for question_id, index in indexes if index is not None
+                for cluster in index.clusters()
+                if cluster["students"] >= 2
+            ]
+        return sorted(found, key=lambda c: (-c["students"], -c["similarity"]))
+
+
+def _create_detector() -> DuplicateDetector:
+    return DuplicateDetector(
+        fetch_after=lambda after_id: db.get_submissions_after(after_id, ROW_COLUMNS),
+        encode=logica.codificar_respuestas,
+        clean=logica.preprocess_text,
+        threshold=float(logica.leer_secreto("DUPLICATE_THRESHOLD", DEFAULT_THRESHOLD)),
+    )
+
+
+@st.cache_resource
+def get_duplicate_detector() -> DuplicateDetector:
+    """Process-wide detector (DUPLICATE_THRESHOLD in secrets/env, 0.9 by default)"""
+    return _create_detector()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, help=f"cosine similarity (default DUPLICATE_THRESHOLD or {DEFAULT_THRESHOLD})")
+    args = parser.parse_args(argv)
+    detector = _create_detector()
+    if args.threshold is not None:
+        detector.threshold = args.threshold
+    detector.sync()
+    clusters = detector.clusters()
+    print(json.dumps(clusters, indent=2, ensure_ascii=False, default=str))
+    print(f"{detector.indexed} answers indexed, {len(clusters)} clusters", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
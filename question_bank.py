@@ -0,0 +1,149 @@
+"""
+Read-only, indexed question bank
+Built once per process from Dataset_preguntas_v1.csv and shared by every
+session: list columns are parsed once into tuples, and questions are looked up
+by id or by text through dictionaries instead of DataFrame scans
+"""
+
+import ast
+import math
+from typing import Dict, Iterator, Optional, Tuple
+
+
+def parse_tuple(value) -> Tuple[str, ...]:
+    """A list column ("['a', 'b']", a list, or a single value) as a tuple of strings"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ()
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value)
+        except Exception:
+            return (value,)
+    if isinstance(value, (list, tuple, set)):
+        return tuple(str(v) for v in value)
+    return (str(value),)
+
+
+def _text(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+class Question:
+    """
+    One bank question. Immutable; the raw reference columns are kept as they are
+    in the CSV because they appear verbatim in the Gemini prompt
+    """
+
+    __slots__ = (
+        'question_id', 'module', 'topic', 'question', 'hint',
+        'answer_correct', 'wrong_examples',
+        'correct_answers', 'wrong_answers', 'keywords',
+    )
+
+    def __init__(self, question_id: str, question: str, hint: str = "", answer_correct: str = "",
+                 wrong_examples: str = "", keywords=(), module: str = "", topic: str = "",
+                 correct_answers=None, wrong_answers=None):
+        # correct_answers / wrong_answers: already parsed lists (compiled artifact); parsed here otherwise
+        values = {
+            'question_id': question_id,
+            'module': module,
+            'topic': topic,
+            'question': question,
+            'hint': hint,
+            'answer_correct': answer_correct,
+            'wrong_examples': wrong_examples,
+            'correct_answers': parse_tuple(answer_correct if correct_answers is None else correct_answers),
+            'wrong_answers': parse_tuple(wrong_examples if wrong_answers is None else wrong_answers),
+            'keywords': parse_tuple(keywords),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Question is read-only (tried to set '{name}')")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Question is read-only (tried to delete '{name}')")
+
+    def __repr__(self) -> str:
+        return f"Question({self.question_id!r}, {self.question[:40]!r})"
+
+
+class QuestionBank:
+    """Ordered, read-only collection of Question with O(1) lookup by id and by text"""
+
+    __slots__ = ('_questions', '_by_id', '_by_text', '_positions', '_texts')
+
+    def __init__(self, questions=()):
+        questions = tuple(questions)
+        by_id: Dict[str, Question] = {}
+        by_text: Dict[str, Question] = {}
+        positions: Dict[str, int] = {}
+        for i, q in enumerate(questions):
+            if q.question_id in by_id:
+                raise ValueError(f"Duplicate QUESTION_ID: {q.question_id}")
+            by_id[q.question_id] = q
+            # With repeated texts the first question wins, like the old df[df['QUESTION'] == ...].iloc[0]
+            by_text.setdefault(q.question, q)
+            positions.setdefault(q.question, i)
+        object.__setattr__(self, '_questions', questions)
+        object.__setattr__(self, '_by_id', by_id)
+        object.__setattr__(self, '_by_text', by_text)
+        object.__setattr__(self, '_positions', positions)
+        object.__setattr__(self, '_texts', tuple(q.question for q in questions))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QuestionBank is read-only")
+
+    @classmethod
+    def from_dataframe(cls, df) -> "QuestionBank":
+        """Build the bank from the dataset columns (QUESTION_ID, QUESTION, HINT, ANSWER_CORRECT...)"""
+        if df is None or df.empty:
+            return cls()
+        columns = {
+            'question_id': 'QUESTION_ID', 'question': 'QUESTION', 'hint': 'HINT',
+            'answer_correct': 'ANSWER_CORRECT', 'wrong_examples': 'WRONG_EXAMPLES',
+            'keywords': 'KEYWORDS', 'module': 'MODULE', 'topic': 'TOPIC',
+        }
+        present = {field: column for field, column in columns.items() if column in df.columns}
+        rows = zip(*(df[column] for column in present.values()))
+        return cls(
+            Question(**{
+                field: value if field == 'keywords' else _text(value)
+                for field, value in zip(present, row)
+            })
+            for row in rows
+        )
+
+    def __len__(self) -> int:
+        return len(self._questions)
+
+    def __iter__(self) -> Iterator[Question]:
+        return iter(self._questions)
+
+    def __contains__(self, question_id) -> bool:
+        return question_id in self._by_id
+
+    def __getitem__(self, question_id: str) -> Question:
+        return self._by_id[question_id]
+
+    def get(self, question_id: str) -> Optional[Question]:
+        return self._by_id.get(question_id)
+
+    def by_text(self, text: str) -> Optional[Question]:
+        return self._by_text.get(text)
+
+    def position(self, text: str) -> Optional[int]:
+        """Index of a question text in texts (selectbox index), or None"""
+        return self._positions.get(text)
+
+    @property
+    def texts(self) -> Tuple[str, ...]:
+        """Question texts in bank order (selectbox options)"""
+        return self._texts
+
+    @property
+    def ids(self) -> Tuple[str, ...]:
+        return tuple(self._by_id)
@@ -0,0 +1,311 @@
+"""
+Retraining of the grading model from stored feature vectors
+Every submission is saved with its 7 features, so the logistic regression in
+model_kw.joblib and the t_low / t_high thresholds in params_kw.json can be
+refitted without encoding a single answer again:
+- answers the teacher resolved in the dashboard (resultado_docente) are the
+  labels, each weighing teacher_weight
+- every other stored answer is a soft target at the current model's
+  probability (one row per class, weighted p and 1 - p). This keeps the refit
+  anchored to the current model: with no teacher labels it reproduces it, and
+  the teacher labels move the boundary where the model was unsure
+The thresholds are recalibrated on the teacher labels only: each confident band
+must reach target_precision on them. The 'Revisar' band never gets narrower
+than min_band, so answers keep reaching the teacher. A held-out fifth of the
+teacher labels measures the model before and after.
+
+Applying writes both files atomically, with the model first and params_kw.json
+(holding the model's sha256) last. Running app processes pick the new files up
+within logica.INTERVALO_COMPROBACION_MODELO seconds; the current process
+reloads them at once.
+
+Usage:
+    python retrain.py              # fit and print the report (nothing is written)
+    python retrain.py --apply      # fit, write model_kw.joblib / params_kw.json and reload
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_TEACHER_WEIGHT = 5.0
+DEFAULT_TARGET_PRECISION = 0.9
+DEFAULT_MIN_BAND = 0.1
+MIN_TEACHER_LABELS = 20
+# Every HOLDOUT_EVERY-th teacher label (by id) is kept out of the evaluation fit
+HOLDOUT_EVERY = 5
+
+
+class NotEnoughLabels(ValueError):
+    """Fewer teacher-resolved answers than min_teacher_labels"""
+
+
+def training_set(rows: Sequence[Dict], feature_cols: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Arrays for the rows that have a complete feature vector
+    Returns: dict with ids, X (n, len(feature_cols)), label (1 = Correcta, 0 = Incorrecta,
+    -1 = no teacher label), teacher (bool) and score (the score stored with the row)
+    """
+    ids, X, labels, scores = [], [], [], []
+    for row in rows:
+        features = row.get('features')
+        if isinstance(features, str):
+            features = json.loads(features)
+        if not features or any(features.get(f) is None for f in feature_cols):
+            continue
+        ids.append(row.get('id'))
+        X.append([float(features[f]) for f in feature_cols])
+        labels.append({'Correcta': 1, 'Incorrecta': 0}.get(row.get('resultado_docente'), -1))
+        scores.append(np.nan if row.get('score') is None else float(row['score']))
+    labels = np.asarray(labels, dtype=np.int64)
+    return {
+        "ids": np.asarray(ids, dtype=object),
+        "X": np.asarray(X, dtype=np.float64).reshape(-1, len(feature_cols)),
+        "label": labels,
+        "teacher": labels >= 0,
+        "score": np.asarray(scores, dtype=np.float64),
+    }
+
+
+def predict_scores(model, X: np.ndarray) -> np.ndarray:
+    coef = np.asarray(model.coef_[0], dtype=np.float64)
+    return 1 / (1 + np.exp(-(X @ coef + float(model.intercept_[0]))))
+
+
+def fit_model(X: np.ndarray, label: np.ndarray, anchor: np.ndarray, feature_cols: Sequence[str],
+              base_model=None, teacher_weight: float = DEFAULT_TEACHER_WEIGHT):
+    """
+    LogisticRegression on teacher labels (label 0/1, weight teacher_weight) plus soft targets
+    (label -1: the row counts as Correcta with weight anchor and as Incorrecta with 1 - anchor),
+    warm-started from base_model's coefficients with the same regularization
+    """
+    import pandas as pd
+    from sklearn.base import clone
+    from sklearn.linear_model import LogisticRegression
+
+    hard = label >= 0
+    soft = ~hard & ~np.isnan(anchor)
+    X_fit = np.vstack([X[hard], X[soft], X[soft]])
+    y_fit = np.concatenate([label[hard], np.ones(soft.sum(), dtype=np.int64), np.zeros(soft.sum(), dtype=np.int64)])
+    w_fit = np.concatenate([np.full(hard.sum(), teacher_weight), anchor[soft], 1 - anchor[soft]])
+    if len(np.unique(y_fit[w_fit > 0])) < 2:
+        raise ValueError("The training rows contain a single class")
+
+    if base_model is not None:
+        model = clone(base_model).set_params(warm_start=True, max_iter=max(base_model.max_iter, 200))
+        model.coef_ = np.array(base_model.coef_, dtype=np.float64)
+        model.intercept_ = np.array(base_model.intercept_, dtype=np.float64)
+    else:
+        model = LogisticRegression(max_iter=200)
+    # Column names are kept in feature_names_in_, which logica.alinear_coeficientes checks
+    model.fit(pd.DataFrame(X_fit, columns=list(feature_cols)), y_fit, sample_weight=w_fit)
+    return model
+
+
+def calibrate_thresholds(scores: np.ndarray, y: np.ndarray,
+                         target_precision: float = DEFAULT_TARGET_PRECISION,
+                         fallback: Tuple[float, float] = (0.3509, 0.6018),
+                         min_band: float = DEFAULT_MIN_BAND) -> Dict[str, float]:
+    """
+    Thresholds from labelled scores (y: 1 = Correcta):
+    t_high: lowest score whose band [t_high, 1] is at least target_precision Correcta
+    t_low:  highest score whose band [0, t_low] is at least target_precision Incorrecta
+    best_threshold: the single cut with the highest accuracy
+    A band that never reaches the target keeps its fallback value. The bands never cross
+    best_threshold, and t_high - t_low is widened around it to at least min_band
+    """
+    order = np.argsort(scores)
+    s, yy = scores[order], y[order].astype(np.float64)
+    n, positives = len(s), yy.sum()
+    if n == 0:
+        return {"t_low": fallback[0], "t_high": fallback[1], "best_threshold": (fallback[0] + fallback[1]) / 2}
+
+    count = np.arange(1, n + 1)
+    below_neg = np.cumsum(1 - yy)               # Incorrecta with score <= s[i]
+    above_pos = positives - np.cumsum(yy) + yy  # Correcta with score >= s[i]
+    # Ties: a cut is only valid at the last (low band) or first (high band) of equal scores
+    last = np.append(s[1:] != s[:-1], True)
+    first = np.insert(s[1:] != s[:-1], 0, True)
+
+    low_ok = last & (below_neg >= target_precision * count)
+    high_ok = first & (above_pos >= target_precision * (n - count + 1))
+    t_low = float(s[low_ok].max()) if low_ok.any() else fallback[0]
+    t_high = float(s[high_ok].min()) if high_ok.any() else fallback[1]
+
+    # Accuracy of "Correcta above s[i]" at every valid cut
+    correct = np.where(last, below_neg + positives - np.cumsum(yy), -1)
+    best = float(s[int(np.argmax(correct))])
+
+    t_low, t_high = min(t_low, best), max(t_high, best)
+    if t_high - t_low < min_band:
+        t_low = max(0.0, min(t_low, best - min_band / 2))
+        t_high = min(1.0, max(t_high, best + min_band / 2))
+    return {"t_low": t_low, "t_high": t_high, "best_threshold": best}
+
+
+def three_class(scores: np.ndarray, t_low: float, t_high: float) -> np.ndarray:
+    return np.select([scores >= t_high, scores <= t_low], ['Correcta', 'Incorrecta'], default='Revisar')
+
+
+def _holdout_report(labels: np.ndarray, y: np.ndarray) -> Dict:
+    """Share of held-out teacher labels decided automatically, and how many of those were right"""
+    decided = labels != 'Revisar'
+    truth = np.where(y == 1, 'Correcta', 'Incorrecta')
+    return {
+        "decided": round(float(decided.mean()), 4) if len(labels) else None,
+        "accuracy_decided": round(float((labels[decided] == truth[decided]).mean()), 4) if decided.any() else None,
+    }
+
+
+def retrain(rows: Sequence[Dict], base_model=None, current_params: Optional[Dict] = None,
+            feature_cols: Optional[Sequence[str]] = None, teacher_weight: float = DEFAULT_TEACHER_WEIGHT,
+            target_precision: float = DEFAULT_TARGET_PRECISION, min_band: float = DEFAULT_MIN_BAND,
+            min_teacher_labels: int = MIN_TEACHER_LABELS) -> Tuple[object, Dict, Dict]:
+    """
+    Fit a new model and thresholds from stored submission rows
+    Returns: (model, params for params_kw.json, report)
+    Raises: NotEnoughLabels
+    """
+    start = time.perf_counter()
+    current_params = dict(current_params or {})
+    feature_cols = list(feature_cols or current_params.get("feature_cols") or [])
+    data = training_set(rows, feature_cols)
+    X, label, teacher = data["X"], data["label"], data["teacher"]
+    n_teacher = int(teacher.sum())
+    if n_teacher < min_teacher_labels:
+        raise NotEnoughLabels(f"{n_teacher} teacher-resolved answers, at least {min_teacher_labels} are needed")
+
+    current = (current_params.get("t_low", 0.3509), current_params.get("t_high", 0.6018))
+    # Soft targets: what the current model says (the stored score when there is no model file)
+    anchor = predict_scores(base_model, X) if base_model is not None else data["score"]
+    calibrate = dict(target_precision=target_precision, fallback=current, min_band=min_band)
+
+    # Evaluation: fit without the held-out teacher labels, compare with the current model on them
+    positions = np.flatnonzero(teacher)
+    holdout = np.zeros(len(label), dtype=bool)
+    holdout[positions[::HOLDOUT_EVERY]] = True
+    fit_rows = ~holdout & (teacher | ~np.isnan(anchor))
+    evaluation = {"holdout_teacher_labels": int(holdout.sum())}
+    if holdout.any():
+        model_eval = fit_model(X[fit_rows], label[fit_rows], anchor[fit_rows], feature_cols, base_model, teacher_weight)
+        fit_teacher = fit_rows & teacher
+        thresholds_eval = calibrate_thresholds(predict_scores(model_eval, X[fit_teacher]), label[fit_teacher], **calibrate)
+        after = three_class(predict_scores(model_eval, X[holdout]), thresholds_eval["t_low"], thresholds_eval["t_high"])
+        evaluation["after"] = _holdout_report(after, label[holdout])
+        if base_model is not None:
+            evaluation["before"] = _holdout_report(three_class(anchor[holdout], *current), label[holdout])
+
+    # Shipped model: every row
+    model = fit_model(X, label, anchor, feature_cols, base_model, teacher_weight)
+    scores = predict_scores(model, X)
+    thresholds = calibrate_thresholds(scores[teacher], label[teacher], **calibrate)
+    new_labels = three_class(scores, thresholds["t_low"], thresholds["t_high"])
+
+    params = {
+        **current_params,
+        **thresholds,
+        "feature_cols": feature_cols,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_train": int(len(label)),
+        "n_teacher_labels": n_teacher,
+        "teacher_weight": teacher_weight,
+        "target_precision": target_precision,
+    }
+    report = {
+        "rows": len(rows),
+        "training_rows": int(len(label)),
+        "teacher_labels": n_teacher,
+        "thresholds_before": {"t_low": current[0], "t_high": current[1]},
+        "thresholds_after": {k: round(v, 4) for k, v in thresholds.items()},
+        "coef_after": dict(zip(feature_cols, np.round(model.coef_[0], 4).tolist())),
+        "revisar_rate_after": round(float((new_labels == 'Revisar').mean()), 4),
+        "evaluation": evaluation,
+    }
+    if base_model is not None:
+        old_labels = three_class(anchor, *current)
+        report["coef_before"] = dict(zip(feature_cols, np.round(base_model.coef_[0], 4).tolist()))
+        report["revisar_rate_before"] = round(float((old_labels == 'Revisar').mean()), 4)
+        report["labels_changed"] = int((old_labels != new_labels).sum())
+    report["fit_s"] = round(time.perf_counter() - start, 3)
+    return model, params, report
+
+
+def _replace_file(path: str, write) -> None:
+    """write(tmp_path), keep the previous file as <path>.bak, then rename over path"""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    if os.path.exists(path):
+        shutil.copy2(path, f"{path}.bak")
+    os.replace(tmp_path, path)
+
+
+def save_model(model, params: Dict, model_path: str, params_path: str) -> Dict:
+    """Write the model, then params_kw.json with the model's sha256 (the file the app reloads on)"""
+    import joblib
+    from bank_artifact import file_sha256
+
+    _replace_file(model_path, lambda tmp: joblib.dump(model, tmp))
+    params = {**params, "model_sha256": file_sha256(model_path)}
+
+    def write_params(tmp):
+        with open(tmp, "w") as f:
+            json.dump(params, f, indent=2)
+
+    _replace_file(params_path, write_params)
+    return params
+
+
+def retrain_from_database(apply: bool = False, **options) -> Dict:
+    """
+    Load the stored features through database.py, retrain, and optionally write and hot-swap the model
+    Returns: the report (with "applied")
+    """
+    import database as db
+    import logica
+
+    start = time.perf_counter()
+    rows = db.get_training_rows()
+    load_s = time.perf_counter() - start
+    base_model, _ = logica.cargar_recursos_ml()
+    current = dict(logica.params or {})
+    current.update(t_low=logica.umbrales[0], t_high=logica.umbrales[1])
+    model, params, report = retrain(rows, base_model, current, logica.features, **options)
+    report["load_s"] = round(load_s, 3)
+    report["applied"] = False
+    if apply:
+        save_model(model, params, logica.RUTA_MODELO_KW, logica.RUTA_PARAMS_KW)
+        report["applied"] = logica.recargar_modelo()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="write model_kw.joblib / params_kw.json")
+    parser.add_argument("--teacher-weight", type=float, default=DEFAULT_TEACHER_WEIGHT)
+    parser.add_argument("--target-precision", type=float, default=DEFAULT_TARGET_PRECISION)
+    parser.add_argument("--min-band", type=float, default=DEFAULT_MIN_BAND, help="narrowest t_high - t_low")
+    parser.add_argument("--min-teacher-labels", type=int, default=MIN_TEACHER_LABELS)
+    args = parser.parse_args(argv)
+    try:
+        report = retrain_from_database(
+            apply=args.apply,
+            teacher_weight=args.teacher_weight,
+            target_precision=args.target_precision,
+            min_band=args.min_band,
+            min_teacher_labels=args.min_teacher_labels,
+        )
+    except NotEnoughLabels as e:
+        print(f"Not retrained: {e}")
+        return 1
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Storage backend interface
+database.py keeps the app-facing functions (error handling, metrics, caches) and
+delegates every read and write to a StorageBackend:
+- SupabaseBackend (storage_supabase.py): the hosted Postgres database
+- SQLiteBackend (storage_sqlite.py): a local, indexed file for single-classroom
+  deployments, load tests and offline development
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Columns that are safe to hand to the app (never the password)
+USER_COLUMNS = ('id', 'username', 'name', 'role', 'created_at')
+USER_TABLE_COLUMNS = USER_COLUMNS + ('password',)
+SUBMISSION_COLUMNS = (
+    'id', 'timestamp', 'username', 'student_name', 'pregunta_id', 'pregunta', 'respuesta',
+    'resultado', 'score', 'feedback', 'created_at', 'idempotency_key',
+    'features', 'resultado_docente', 'revisado_at', 'respuesta_completa',
+)
+# Added by FIX_SUBMISSION_FEATURES.sql: the 7 scoring features (JSON object keyed by
+# feature name) and the teacher's resolution of a 'Revisar' answer
+SUBMISSION_REVIEW_COLUMNS = ('features', 'resultado_docente', 'revisado_at')
+# Added by FIX_SUBMISSION_FULL_ANSWER.sql: the whole answer when 'respuesta' was cut for
+# display (NULL otherwise); near_duplicates.py compares this text
+SUBMISSION_FULL_ANSWER_COLUMNS = ('respuesta_completa',)
+TEACHER_LABELS = ('Correcta', 'Incorrecta')
+
+EMPTY_STATS = {"total": 0, "correctas": 0, "incorrectas": 0, "revisar": 0, "students": 0}
+STATS_GROUP_COLUMNS = ('student_name', 'username', 'pregunta_id')
+
+
+class StorageError(Exception):
+    """
+    Backend error carrying a Postgres-style SQLSTATE code when known
+    (class 22 = invalid data, class 23 = constraint violation)
+    """
+
+    def __init__(self, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class DuplicateKeyError(StorageError):
+    """A unique constraint (users.username, submissions.idempotency_key) rejected the row"""
+
+    def __init__(self, message: str):
+        super().__init__(message, code='23505')
+
+
+def parse_columns(columns, allowed: Sequence[str]) -> List[str]:
+    """
+    Normalize a column selection ('*', 'a, b' or a sequence) and validate it
+    Raises: ValueError for unknown columns
+    """
+    if isinstance(columns, str):
+        columns = list(allowed) if columns.strip() == '*' else [c.strip() for c in columns.split(',')]
+    columns = list(dict.fromkeys(columns))
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    return columns
+
+
+def validate_filters(filters: Optional[Dict], allowed: Iterable[str]) -> Dict:
+    filters = dict(filters or {})
+    unknown = [c for c in filters if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown filter columns: {unknown}")
+    return filters
+
+
+def compute_submission_stats(submissions: List[Dict]) -> Dict:
+    """Count results and distinct students in a list of submission rows"""
+    return {
+        "total": len(submissions),
+        "correctas": len([s for s in submissions if s.get('resultado') == 'Correcta']),
+        "incorrectas": len([s for s in submissions if s.get('resultado') == 'Incorrecta']),
+        "revisar": len([s for s in submissions if s.get('resultado') == 'Revisar']),
+        "students": len(set([s.get('student_name') for s in submissions]))
+    }
+
+
+def compute_submission_stats_grouped(submissions: List[Dict], group_by: str) -> List[Dict]:
+    """compute_submission_stats for each value of group_by, shaped like the grouped RPC rows"""
+    groups: Dict = {}
+    for s in submissions:
+        groups.setdefault(s.get(group_by), []).append(s)
+    return [
+        {"group_key": key, **compute_submission_stats(rows)}
+        for key, rows in sorted(groups.items(), key=lambda item: str(item[0]))
+    ]
+
+
+def stats_from_row(row: Dict) -> Dict:
+    """Normalize a submission_stats row (counts may come back as strings or None)"""
+    return {key: int(row.get(key) or 0) for key in EMPTY_STATS}
+
+
+class StorageBackend(ABC):
+    """
+    Persistence operations the app needs. Implementations raise on failure
+    (StorageError subclasses where the cause is known); database.py decides
+    how each failure is reported to the user.
+    """
+
+    name = "abstract"
+
+    # --- users ---
+
+    @abstractmethod
+    def insert_user(self, user: Dict) -> None:
+        """Insert one user; raises DuplicateKeyError if the username exists"""
+
+    @abstractmethod
+    def insert_users_ignore_existing(self, users: List[Dict]) -> List[Dict]:
+        """Insert many users in one statement, skipping existing usernames; returns the created rows"""
+
+    @abstractmethod
+    def find_user(self, username: str, password: str, columns: Sequence[str]) -> Optional[Dict]:
+        """The user with these credentials, or None"""
+
+    @abstractmethod
+    def list_users(self, columns: Sequence[str] = USER_COLUMNS) -> List[Dict]:
+        """Every user"""
+
+    # --- submissions ---
+
+    @abstractmethod
+    def insert_submission(self, submission: Dict) -> Dict:
+        """Insert one submission; returns the stored row including its id"""
+
+    @abstractmethod
+    def upsert_submissions(self, submissions: List[Dict]) -> List[Dict]:
+        """Insert many submissions in one statement, updating rows whose idempotency_key exists"""
+
+    @abstractmethod
+    def update_submissions(self, key_column: str, key, values: Dict) -> int:
+        """Set values on the submissions where key_column == key; returns the number of rows updated"""
+
+    @abstractmethod
+    def list_submissions(self, columns: Sequence[str], filters: Optional[Dict] = None,
+                         before_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Submissions matching every filter (column == value), newest first, optionally id < before_id"""
+
+    # --- statistics ---
+
+    @abstractmethod
+    def submission_stats(self, username: Optional[str] = None, pregunta_id: Optional[str] = None) -> Dict:
+        """EMPTY_STATS-shaped counts, optionally for one student and/or one question"""
+
+    @abstractmethod
+    def submission_stats_grouped(self, group_by: str) -> List[Dict]:
+        """Counts per value of group_by (one of STATS_GROUP_COLUMNS), with the value in 'group_key'"""
+
+    def close(self) -> None:
+        """Release connections (optional)"""
+
@@ -0,0 +1,259 @@
+"""
+Local SQLite storage backend
+One indexed database file with the same tables and constraints as the Supabase
+schema (after the FIX_*.sql migrations). Suited to a single app process: one
+classroom server, offline development and load tests without a network hop
+"""
+
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from storage import (
+    EMPTY_STATS,
+    STATS_GROUP_COLUMNS,
+    SUBMISSION_COLUMNS,
+    USER_COLUMNS,
+    USER_TABLE_COLUMNS,
+    DuplicateKeyError,
+    StorageBackend,
+    StorageError,
+    parse_columns,
+    stats_from_row,
+    validate_filters,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    name TEXT NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('teacher', 'student')),
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    username TEXT NOT NULL,
+    student_name TEXT NOT NULL,
+    pregunta_id TEXT NOT NULL,
+    pregunta TEXT NOT NULL,
+    respuesta TEXT NOT NULL,
+    resultado TEXT NOT NULL CHECK (resultado IN ('Correcta', 'Incorrecta', 'Revisar')),
+    score REAL NOT NULL,
+    feedback TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    idempotency_key TEXT UNIQUE,
+    features TEXT,
+    resultado_docente TEXT CHECK (resultado_docente IN ('Correcta', 'Incorrecta')),
+    revisado_at TEXT,
+    respuesta_completa TEXT
+);
+
+-- Keyset pagination and filters (same indexes as FIX_SUBMISSIONS_PAGINATION.sql)
+CREATE INDEX IF NOT EXISTS idx_submissions_username_id ON submissions(username, id DESC);
+CREATE INDEX IF NOT EXISTS idx_submissions_student_name_id ON submissions(student_name, id DESC);
+CREATE INDEX IF NOT EXISTS idx_submissions_resultado_id ON submissions(resultado, id DESC);
+CREATE INDEX IF NOT EXISTS idx_submissions_pregunta_id ON submissions(pregunta_id);
+"""
+
+# Columns added after the first release: databases created before them are altered on open
+_ADDED_SUBMISSION_COLUMNS = {
+    'features': "TEXT",
+    'resultado_docente': "TEXT CHECK (resultado_docente IN ('Correcta', 'Incorrecta'))",
+    'revisado_at': "TEXT",
+    'respuesta_completa': "TEXT",
+}
+
+# Stored as JSON text (jsonb in Postgres)
+_JSON_COLUMNS = ('features',)
+
+# sqlite3.IntegrityError message prefix -> Postgres SQLSTATE
+_CONSTRAINT_CODES = {
+    "NOT NULL constraint failed": "23502",
+    "CHECK constraint failed": "23514",
+}
+
+
+def _as_storage_error(error: sqlite3.IntegrityError) -> StorageError:
+    message = str(error)
+    if message.startswith("UNIQUE constraint failed"):
+        return DuplicateKeyError(message)
+    for prefix, code in _CONSTRAINT_CODES.items():
+        if message.startswith(prefix):
+            return StorageError(message, code=code)
+    return StorageError(message, code="23000")
+
+
+def _encode(column: str, value):
+    if column in _JSON_COLUMNS and value is not None and not isinstance(value, str):
+        return json.dumps(value)
+    return value
+
+
+def _decode(row: sqlite3.Row) -> Dict:
+    data = dict(row)
+    for column in _JSON_COLUMNS:
+        if isinstance(data.get(column), str):
+            data[column] = json.loads(data[column])
+    return data
+
+
+class SQLiteBackend(StorageBackend):
+    """StorageBackend over a local SQLite file (WAL mode, one shared connection)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(submissions)")}
+        with self._conn:
+            for column, definition in _ADDED_SUBMISSION_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE submissions ADD COLUMN {column} {definition}")
+
+    def _execute(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        with self._lock:
+            try:
+                with self._conn:
+                    return [_decode(row) for row in self._conn.execute(sql, params).fetchall()]
+            except sqlite3.IntegrityError as e:
+                raise _as_storage_error(e) from e
+
+    def _insert_sql(self, table: str, columns: Sequence[str], allowed: Sequence[str]) -> str:
+        columns = parse_columns(columns, allowed)
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    # --- users ---
+
+    def insert_user(self, user: Dict) -> None:
+        self._execute(self._insert_sql('users', user.keys(), USER_TABLE_COLUMNS), list(user.values()))
+
+    def insert_users_ignore_existing(self, users: List[Dict]) -> List[Dict]:
+        created = []
+        with self._lock, self._conn:
+            for user in users:
+                sql = self._insert_sql('users', user.keys(), USER_TABLE_COLUMNS) + " ON CONFLICT(username) DO NOTHING"
+                if self._conn.execute(sql, list(user.values())).rowcount:
+                    created.append(dict(user))
+        return created
+
+    def find_user(self, username: str, password: str, columns: Sequence[str]) -> Optional[Dict]:
+        columns = parse_columns(columns, USER_TABLE_COLUMNS)
+        rows = self._execute(
+            f"SELECT {', '.join(columns)} FROM users WHERE username = ? AND password = ? LIMIT 1",
+            (username, password),
+        )
+        return rows[0] if rows else None
+
+    def list_users(self, columns: Sequence[str] = USER_COLUMNS) -> List[Dict]:
+        columns = parse_columns(columns, USER_TABLE_COLUMNS)
+        return self._execute(f"SELECT {', '.join(columns)} FROM users ORDER BY id")
+
+    # --- submissions ---
+
+    def insert_submission(self, submission: Dict) -> Dict:
+        sql = self._insert_sql('submissions', submission.keys(), SUBMISSION_COLUMNS)
+        with self._lock:
+            try:
+                with self._conn:
+                    cursor = self._conn.execute(sql, [_encode(c, v) for c, v in submission.items()])
+            except sqlite3.IntegrityError as e:
+                raise _as_storage_error(e) from e
+            row = self._conn.execute("SELECT * FROM submissions WHERE id = ?", (cursor.lastrowid,)).fetchone()
+        return _decode(row)
+
+    def upsert_submissions(self, submissions: List[Dict]) -> List[Dict]:
+        if not submissions:
+            return []
+        # Same shape as a PostgREST bulk upsert: the union of the rows' columns, missing values as NULL
+        columns = parse_columns([c for s in submissions for c in s], SUBMISSION_COLUMNS)
+        if 'idempotency_key' not in columns:
+            raise ValueError("upsert_submissions needs an idempotency_key on every row")
+        updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c not in ('id', 'idempotency_key'))
+        sql = self._insert_sql('submissions', columns, SUBMISSION_COLUMNS) + f" ON CONFLICT(idempotency_key) DO UPDATE SET {updates}"
+        keys = [s.get('idempotency_key') for s in submissions]
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany(sql, [[_encode(c, s.get(c)) for c in columns] for s in submissions])
+            except sqlite3.IntegrityError as e:
+                raise _as_storage_error(e) from e
+            rows = self._conn.execute(
+                f"SELECT * FROM submissions WHERE idempotency_key IN ({', '.join('?' * len(keys))}) ORDER BY id",
+                keys,
+            ).fetchall()
+        return [_decode(row) for row in rows]
+
+    def update_submissions(self, key_column: str, key, values: Dict) -> int:
+        validate_filters({key_column: key, **values}, SUBMISSION_COLUMNS)
+        assignments = ', '.join(f"{c} = ?" for c in values)
+        params = [_encode(c, v) for c, v in values.items()]
+        with self._lock:
+            try:
+                with self._conn:
+                    sql = f"UPDATE submissions SET {assignments} WHERE {key_column} = ?"
+                    return self._conn.execute(sql, [*params, key]).rowcount
+            except sqlite3.IntegrityError as e:
+                raise _as_storage_error(e) from e
+
+    def list_submissions(self, columns: Sequence[str], filters: Optional[Dict] = None,
+                         before_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        columns = parse_columns(columns, SUBMISSION_COLUMNS)
+        conditions, params = [], []
+        for column, value in validate_filters(filters, SUBMISSION_COLUMNS).items():
+            conditions.append(f"{column} = ?")
+            params.append(value)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        sql = f"SELECT {', '.join(columns)} FROM submissions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._execute(sql, params)
+
+    # --- statistics ---
+
+    _STATS_SELECT = """
+        COUNT(*) AS total,
+        SUM(resultado = 'Correcta') AS correctas,
+        SUM(resultado = 'Incorrecta') AS incorrectas,
+        SUM(resultado = 'Revisar') AS revisar,
+        COUNT(DISTINCT student_name) AS students
+    """
+
+    def submission_stats(self, username: Optional[str] = None, pregunta_id: Optional[str] = None) -> Dict:
+        rows = self._execute(
+            f"SELECT {self._STATS_SELECT} FROM submissions "
+            "WHERE (? IS NULL OR username = ?) AND (? IS NULL OR pregunta_id = ?)",
+            (username, username, pregunta_id, pregunta_id),
+        )
+        return stats_from_row(rows[0]) if rows else dict(EMPTY_STATS)
+
+    def submission_stats_grouped(self, group_by: str) -> List[Dict]:
+        if group_by not in STATS_GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {STATS_GROUP_COLUMNS}")
+        rows = self._execute(
+            f"SELECT {group_by} AS group_key, {self._STATS_SELECT} FROM submissions GROUP BY 1 ORDER BY 1"
+        )
+        return [{"group_key": row['group_key'], **stats_from_row(row)} for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,254 @@
+"""
+Supabase (hosted Postgres through PostgREST) storage backend
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+from postgrest.types import ReturnMethod
+from postgrest.utils import SyncClient
+from supabase import Client, ClientOptions, create_client
+
+from storage import (
+    EMPTY_STATS,
+    STATS_GROUP_COLUMNS,
+    SUBMISSION_COLUMNS,
+    SUBMISSION_FULL_ANSWER_COLUMNS,
+    SUBMISSION_REVIEW_COLUMNS,
+    USER_COLUMNS,
+    USER_TABLE_COLUMNS,
+    DuplicateKeyError,
+    StorageBackend,
+    StorageError,
+    compute_submission_stats,
+    compute_submission_stats_grouped,
+    parse_columns,
+    stats_from_row,
+    validate_filters,
+)
+
+# HTTP settings for the PostgREST session (one pooled, keep-alive session per process)
+HTTP_TIMEOUT_SECONDS = 10.0
+HTTP_CONNECT_TIMEOUT_SECONDS = 5.0
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0)
+
+# Submission columns added by later migrations: until a script is applied, its columns are
+# left out of writes and read back as None
+OPTIONAL_SUBMISSION_COLUMNS = {
+    'FIX_SUBMISSION_FEATURES.sql': SUBMISSION_REVIEW_COLUMNS,
+    'FIX_SUBMISSION_FULL_ANSWER.sql': SUBMISSION_FULL_ANSWER_COLUMNS,
+}
+
+
+def is_unique_violation(error: Exception) -> bool:
+    """Postgres 23505: a unique constraint (e.g. users.username) rejected the row"""
+    return getattr(error, 'code', None) == '23505'
+
+
+def is_missing_function(error: Exception) -> bool:
+    """PostgREST PGRST202 / Postgres 42883: the RPC function does not exist"""
+    return getattr(error, 'code', None) in ('PGRST202', '42883')
+
+
+def is_missing_column(error: Exception) -> bool:
+    """
+    PostgREST PGRST204 (written column) / Postgres 42703 (selected column):
+    the column is not in the table (migration not applied)
+    """
+    return getattr(error, 'code', None) in ('PGRST204', '42703')
+
+
+def _configure_http_session(client: Client, timeout: httpx.Timeout) -> None:
+    """
+    Replace the default PostgREST HTTP session with one that has explicit
+    timeouts and connection-pool / keep-alive limits
+    """
+    rest = client.postgrest
+    default_session = rest.session
+    rest.session = SyncClient(
+        base_url=default_session.base_url,
+        headers=default_session.headers,
+        timeout=timeout,
+        limits=HTTP_LIMITS,
+        follow_redirects=True,
+        http2=True,
+    )
+    default_session.close()
+
+
+def create_supabase_client(url: str, key: str, timeout_seconds: float = HTTP_TIMEOUT_SECONDS) -> Client:
+    """Supabase client with explicit timeouts and a pooled keep-alive HTTP session"""
+    timeout = httpx.Timeout(float(timeout_seconds), connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+    # The app has its own users table: no Supabase Auth session to refresh or persist
+    options = ClientOptions(
+        schema="public",
+        auto_refresh_token=False,
+        persist_session=False,
+        postgrest_client_timeout=timeout,
+    )
+    client = create_client(supabase_url=url, supabase_key=key, options=options)
+    _configure_http_session(client, timeout)
+    return client
+
+
+def _select(columns, allowed: Sequence[str]) -> str:
+    """Validated select clause; '*' is passed through so PostgREST returns the rows as stored"""
+    if isinstance(columns, str) and columns.strip() == '*':
+        return '*'
+    return ', '.join(parse_columns(columns, allowed))
+
+
+def _as_storage_error(error: Exception) -> Exception:
+    """Map PostgREST API errors to StorageError / DuplicateKeyError (other errors pass through)"""
+    code = getattr(error, 'code', None)
+    if code is None:
+        return error
+    message = getattr(error, 'message', None) or str(error)
+    if is_unique_violation(error):
+        return DuplicateKeyError(message)
+    return StorageError(message, code=str(code))
+
+
+class SupabaseBackend(StorageBackend):
+    """StorageBackend over a supabase Client (or any object with the same query-builder API)"""
+
+    name = "supabase"
+
+    def __init__(self, client: Client):
+        self.client = client
+        # Cleared the first time the stats functions are missing (FIX_SUBMISSION_STATS.sql not
+        # applied or a local stand-in without them); from then on counts are computed in Python
+        self.stats_rpc_available = True
+        # OPTIONAL_SUBMISSION_COLUMNS the submissions table turned out not to have;
+        # from then on they are not written or selected
+        self.missing_columns = set()
+
+    def _run(self, query):
+        try:
+            return query.execute().data or []
+        except Exception as e:
+            raise _as_storage_error(e) from e
+
+    def _skip_missing_columns(self, error: StorageError, columns) -> bool:
+        """
+        On a missing-column error, record the optional columns it refers to (among `columns`)
+        in missing_columns and return True; False for any other error
+        """
+        if not is_missing_column(error):
+            return False
+        used = [(script, group) for script, group in OPTIONAL_SUBMISSION_COLUMNS.items()
+                if any(c in columns and c not in self.missing_columns for c in group)]
+        # PostgREST names the column; if it does not, skip the first migration the request used
+        named = [(script, group) for script, group in used if any(c in str(error) for c in group)]
+        for script, group in (named or used)[:1]:
+            self.missing_columns.update(group)
+            print(f"⚠️ submissions has no {', '.join(group)} column(s) (run {script}); continuing without them")
+            return True
+        return False
+
+    def _write_submissions(self, build, rows: List[Dict]) -> List[Dict]:
+        """Run build(rows), retrying without the optional columns the table does not have"""
+        rows = [{k: v for k, v in row.items() if k not in self.missing_columns} for row in rows]
+        try:
+            return self._run(build(rows))
+        except StorageError as e:
+            if not self._skip_missing_columns(e, {k for row in rows for k in row}):
+                raise
+            return self._write_submissions(build, rows)
+
+    # --- users ---
+
+    def insert_user(self, user: Dict) -> None:
+        self._run(self.client.table('users').insert(user, returning=ReturnMethod.minimal))
+
+    def insert_users_ignore_existing(self, users: List[Dict]) -> List[Dict]:
+        return self._run(self.client.table('users').upsert(users, on_conflict='username', ignore_duplicates=True))
+
+    def find_user(self, username: str, password: str, columns: Sequence[str]) -> Optional[Dict]:
+        rows = self._run(
+            self.client.table('users')
+            .select(_select(columns, USER_TABLE_COLUMNS))
+            .eq('username', username)
+            .eq('password', password)
+            .limit(1)
+        )
+        return rows[0] if rows else None
+
+    def list_users(self, columns: Sequence[str] = USER_COLUMNS) -> List[Dict]:
+        return self._run(self.client.table('users').select(_select(columns, USER_TABLE_COLUMNS)))
+
+    # --- submissions ---
+
+    def insert_submission(self, submission: Dict) -> Dict:
+        rows = self._write_submissions(lambda rows: self.client.table('submissions').insert(rows[0]), [submission])
+        return rows[0] if rows else dict(submission)
+
+    def upsert_submissions(self, submissions: List[Dict]) -> List[Dict]:
+        return self._write_submissions(
+            lambda rows: self.client.table('submissions').upsert(rows, on_conflict='idempotency_key'), submissions
+        )
+
+    def update_submissions(self, key_column: str, key, values: Dict) -> int:
+        validate_filters({key_column: key, **values}, SUBMISSION_COLUMNS)
+        # PostgREST returns the updated rows; RLS without an UPDATE policy silently yields none
+        return len(self._run(self.client.table('submissions').update(values).eq(key_column, key)))
+
+    def list_submissions(self, columns: Sequence[str], filters: Optional[Dict] = None,
+                         before_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        wanted = [] if _select(columns, SUBMISSION_COLUMNS) == '*' else parse_columns(columns, SUBMISSION_COLUMNS)
+        # Optional columns the table does not have are not selected and come back as None
+        skipped = [c for c in wanted if c in self.missing_columns]
+        query = self.client.table('submissions').select(', '.join(c for c in wanted if c not in skipped) or '*')
+        for column, value in validate_filters(filters, SUBMISSION_COLUMNS).items():
+            query = query.eq(column, value)
+        if before_id is not None:
+            query = query.lt('id', before_id)
+        query = query.order('id', desc=True)
+        if limit is not None:
+            query = query.limit(limit)
+        try:
+            rows = self._run(query)
+        except StorageError as e:
+            if not self._skip_missing_columns(e, wanted):
+                raise
+            return self.list_submissions(columns, filters, before_id, limit)
+        for row in rows:
+            row.update(dict.fromkeys(skipped))
+        return rows
+
+    # --- statistics ---
+
+    def _call_stats_rpc(self, fn: str, params: Dict) -> Optional[List[Dict]]:
+        """Rows returned by a stats function, or None when the functions are not installed"""
+        if not self.stats_rpc_available:
+            return None
+        try:
+            return self.client.rpc(fn, params).execute().data or []
+        except Exception as e:
+            if not is_missing_function(e):
+                raise _as_storage_error(e) from e
+            self.stats_rpc_available = False
+            print(f"⚠️ RPC '{fn}' not found (run FIX_SUBMISSION_STATS.sql); computing stats in Python")
+            return None
+
+    def submission_stats(self, username: Optional[str] = None, pregunta_id: Optional[str] = None) -> Dict:
+        rows = self._call_stats_rpc('submission_stats', {'p_username': username, 'p_pregunta_id': pregunta_id})
+        if rows is not None:
+            return stats_from_row(rows[0]) if rows else dict(EMPTY_STATS)
+
+        # Fallback: fetch only the columns the counts need
+        filters = {k: v for k, v in (('username', username), ('pregunta_id', pregunta_id)) if v is not None}
+        query = self.client.table('submissions').select('resultado, student_name')
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        return compute_submission_stats(self._run(query))
+
+    def submission_stats_grouped(self, group_by: str) -> List[Dict]:
+        if group_by not in STATS_GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {STATS_GROUP_COLUMNS}")
+        rows = self._call_stats_rpc('submission_stats_grouped', {'p_group_by': group_by})
+        if rows is not None:
+            return [{"group_key": row.get('group_key'), **stats_from_row(row)} for row in rows]
+
+        columns = ', '.join(dict.fromkeys(('resultado', 'student_name', group_by)))
+        return compute_submission_stats_grouped(self._run(self.client.table('submissions').select(columns)), group_by)
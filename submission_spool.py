@@ -0,0 +1,283 @@
+"""
+Write-behind queue for student submissions
+Submissions are appended to a local SQLite spool (WAL mode) on the request path
+and a background flusher bulk-inserts them into Supabase with retries. Every row
+carries an idempotency key, so a batch that is retried after a lost response is
+never inserted twice
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import streamlit as st
+
+import database as db
+import logica
+import metrics
+
+# Errors that retrying the same row can never fix: Postgres class 22 (data exception),
+# 23 (integrity violation) and 42 (access rule or schema: 42501 RLS denial, 42P10 missing
+# ON CONFLICT index), plus PostgREST request/schema errors. PGRST0xx are connection
+# errors and are retried like a network failure
+_DATA_ERROR_CLASSES = ("22", "23", "42")
+_TRANSIENT_POSTGREST_PREFIX = "PGRST0"
+
+
+def spool_enabled() -> bool:
+    """SUBMISSION_SPOOL = true in secrets/env turns the write-behind queue on"""
+    return str(logica.leer_secreto("SUBMISSION_SPOOL", "false")).strip().lower() in ("1", "true", "yes")
+
+
+def new_idempotency_key() -> str:
+    return uuid.uuid4().hex
+
+
+def _is_data_error(error: Exception) -> bool:
+    code = str(getattr(error, "code", "") or "")
+    if code.startswith("PGRST"):
+        return not code.startswith(_TRANSIENT_POSTGREST_PREFIX)
+    return code[:2] in _DATA_ERROR_CLASSES
+
+
+class SubmissionSpool:
+    """
+    Durable FIFO of submissions waiting to be written.
+
+    writer(rows) must write all rows or raise; it is called with batches of up
+    to batch_size rows. on_written(rows) receives the rows written for the first
+    time (e.g. to update cached summaries). A row whose payload changes while a
+    batch is in flight (set_feedback) stays queued and is written again, so
+    writer must upsert on idempotency_key.
+    """
+
+    def __init__(self, path: str, writer: Callable[[List[Dict]], object],
+                 on_written: Optional[Callable[[List[Dict]], None]] = None,
+                 batch_size: int = 100, flush_interval: float = 1.0,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.path = path
+        self.writer = writer
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.flushed = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # synchronous=FULL: an acknowledged submission survives a power loss
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS submission_spool (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                written INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                enqueued_at REAL NOT NULL
+            )
+            """
+        )
+
+    # --- request path ---
+
+    def enqueue(self, submission: Dict) -> str:
+        """
+        Durably queue a submission and wake the flusher
+        Returns: the submission's idempotency key (assigned if missing)
+        """
+        row = dict(submission)
+        row.setdefault("idempotency_key", new_idempotency_key())
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO submission_spool (idempotency_key, payload, enqueued_at) VALUES (?, ?, ?)",
+                (row["idempotency_key"], json.dumps(row, default=str), time.time()),
+            )
+        self._wake.set()
+        return row["idempotency_key"]
+
+    def set_feedback(self, idempotency_key: str, feedback: str) -> bool:
+        """
+        Add the feedback to a submission that is still queued
+        Returns: False when the row already left the spool (update it in the database instead)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM submission_spool WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+            if row is None:
+                return False
+            payload = json.loads(row[0])
+            payload["feedback"] = feedback
+            self._conn.execute(
+                "UPDATE submission_spool SET payload = ?, version = version + 1 WHERE idempotency_key = ?",
+                (json.dumps(payload, default=str), idempotency_key),
+            )
+        self._wake.set()
+        return True
+
+    # --- flusher ---
+
+    def start(self) -> None:
+        """Start the background flusher (idempotent); rows left by a previous run are sent first"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="submission-spool", daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._backoff:
+                time.sleep(self._backoff)
+            try:
+                while self.flush_once() == self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"❌ Submission spool flusher error: {e}")
+
+    def _next_batch(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT idempotency_key, payload, version, written FROM submission_spool "
+                "WHERE dead = 0 ORDER BY seq LIMIT ?",
+                (self.batch_size,),
+            ).fetchall()
+
+    def flush_once(self) -> int:
+        """
+        Write one batch
+        Returns: number of rows written (0 when the spool is empty or the write failed)
+        """
+        batch = self._next_batch()
+        if not batch:
+            return 0
+
+        with metrics.timer("spool.flush") as span:
+            try:
+                self.writer([json.loads(payload) for _, payload, _, _ in batch])
+            except Exception as e:
+                span.outcome = "error"
+                if _is_data_error(e) and len(batch) > 1:
+                    # One bad row must not block the queue: retry the batch row by row
+                    return sum(self._write_single(row) for row in batch)
+                self._record_failure(batch, e, dead=_is_data_error(e))
+                return 0
+
+        self._mark_written(batch)
+        return len(batch)
+
+    def _write_single(self, row) -> int:
+        try:
+            self.writer([json.loads(row[1])])
+        except Exception as e:
+            self._record_failure([row], e, dead=_is_data_error(e))
+            return 0
+        self._mark_written([row])
+        return 1
+
+    def _mark_written(self, batch) -> None:
+        first_time = [json.loads(payload) for _, payload, _, written in batch if not written]
+        with self._lock:
+            for key, _, version, _ in batch:
+                # Rows changed by set_feedback in the meantime stay queued for another write
+                self._conn.execute(
+                    "DELETE FROM submission_spool WHERE idempotency_key = ? AND version = ?", (key, version)
+                )
+                self._conn.execute("UPDATE submission_spool SET written = 1 WHERE idempotency_key = ?", (key,))
+        self.flushed += len(batch)
+        self._backoff = 0.0
+        if self.on_written and first_time:
+            self.on_written(first_time)
+
+    def _record_failure(self, batch, error: Exception, dead: bool) -> None:
+        self.failures += 1
+        self.last_error = str(error)
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE submission_spool SET attempts = attempts + 1, last_error = ?, dead = ? "
+                "WHERE idempotency_key = ?",
+                [(str(error), int(dead), key) for key, *_ in batch],
+            )
+        if dead:
+            print(f"❌ Submission rejected by the database, kept in the spool: {error}")
+        else:
+            # Database unreachable: keep everything and back off exponentially
+            self._backoff = min(self.max_backoff, max(self.base_backoff, self._backoff * 2))
+            print(f"⚠️ Submission flush failed, retrying in {self._backoff:.0f}s: {error}")
+
+    def requeue_dead(self) -> int:
+        """Queue the rejected rows again (e.g. after applying a missing migration); returns how many"""
+        with self._lock:
+            requeued = self._conn.execute("UPDATE submission_spool SET dead = 0 WHERE dead = 1").rowcount
+        self._wake.set()
+        return requeued
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Flush synchronously until the spool is empty; True if it was emptied in time"""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            if not self.flush_once():
+                time.sleep(min(self.base_backoff, max(0.0, deadline - time.monotonic())))
+        return self.pending() == 0
+
+    # --- monitoring ---
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM submission_spool WHERE dead = 0").fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Queue depth, rejected rows, oldest pending age and flush counters for this process"""
+        with self._lock:
+            pending, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(enqueued_at) FROM submission_spool WHERE dead = 0"
+            ).fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM submission_spool WHERE dead = 1").fetchone()[0]
+        return {
+            "pending": pending,
+            "dead": dead,
+            "oldest_age_s": time.time() - oldest if oldest else 0.0,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+def _apply_to_summary(rows: List[Dict]) -> None:
+    for row in rows:
+        db.student_summary.apply_insert(row)
+
+
+@st.cache_resource
+def get_submission_spool() -> SubmissionSpool:
+    """Process-wide spool (SUBMISSION_SPOOL_PATH, default submission_spool.sqlite3) with its flusher running"""
+    spool = SubmissionSpool(
+        logica.leer_secreto("SUBMISSION_SPOOL_PATH", "submission_spool.sqlite3"),
+        writer=db.bulk_insert_submissions,
+        on_written=_apply_to_summary,
+        batch_size=int(logica.leer_secreto("SUBMISSION_SPOOL_BATCH", 100)),
+    )
+    spool.start()
+    return spool
+
+
+def save_feedback(idempotency_key: str, feedback: str) -> bool:
+    """Attach deferred feedback to a spooled submission, wherever it currently is; True once stored"""
+    if get_submission_spool().set_feedback(idempotency_key, feedback):
+        return True
+    return db.update_submission_feedback(idempotency_key, feedback, key_column='idempotency_key')
@@ -0,0 +1,126 @@
+"""
+database_async against benchmarks/fakes.PostgrestStub: the real sync and async supabase
+clients talk HTTP to an in-memory PostgREST stand-in (no Supabase project needed)
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fakes import STUB_KEY, FakeAPIError, FakeSupabase, PostgrestStub  # noqa: E402
+from storage import EMPTY_STATS, compute_submission_stats, compute_submission_stats_grouped  # noqa: E402
+
+RESULTADOS = ("Correcta", "Incorrecta", "Revisar")
+
+
+def _stats_rpc(client, p_username=None, p_pregunta_id=None):
+    rows = [r for r in client.tables["submissions"]
+            if p_username in (None, r["username"]) and p_pregunta_id in (None, r["pregunta_id"])]
+    return [compute_submission_stats(rows)]
+
+
+def _stats_grouped_rpc(client, p_group_by):
+    return compute_submission_stats_grouped(client.tables["submissions"], p_group_by)
+
+
+def _seed(client: FakeSupabase, n_submissions: int = 120) -> None:
+    client.tables["users"] = [
+        {"id": 1, "username": "teacher", "password": "x", "name": "Docente", "role": "teacher"},
+        {"id": 2, "username": "ana", "password": "x", "name": "Ana", "role": "student"},
+        {"id": 3, "username": "luis", "password": "x", "name": "Luis", "role": "student"},
+    ]
+    for i in range(1, n_submissions + 1):
+        username = "ana" if i % 3 else "luis"
+        client.tables["submissions"].append({
+            "id": i, "timestamp": f"2026-01-01T00:00:{i:03d}", "username": username,
+            "student_name": username.title(), "pregunta_id": "Q001", "pregunta": "p",
+            "respuesta": f"respuesta {i}", "resultado": RESULTADOS[i % 3], "score": 0.5,
+        })
+    client._next_id["submissions"] = n_submissions + 1
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "unused.sqlite3"))
+    import database as db
+    import database_async as db_async
+    from storage_supabase import SupabaseBackend, create_supabase_client
+
+    server = PostgrestStub(delay=0.05)
+    _seed(server.client)
+    server.start()
+    monkeypatch.setenv("SUPABASE_URL", server.url)
+    monkeypatch.setenv("SUPABASE_KEY", STUB_KEY)
+    monkeypatch.setattr(db, "backend", SupabaseBackend(create_supabase_client(server.url, STUB_KEY)))
+    # A fresh async client bound to this stub
+    monkeypatch.setattr(db_async, "_client", None)
+    db.student_summary.invalidate()
+    yield server
+    db.student_summary.invalidate()
+    server.stop()
+
+
+def _with_stats_functions(server):
+    server.client.functions.update(submission_stats=_stats_rpc, submission_stats_grouped=_stats_grouped_rpc)
+
+
+def test_student_history_pages_and_counts_concurrently(stub):
+    import database_async as db_async
+    _with_stats_functions(stub)
+
+    first = db_async.load_student_history("ana")
+    assert first["stats"] == _stats_rpc(stub.client, p_username="ana")[0]
+    assert first["stats"]["total"] == 80
+    assert len(first["rows"]) == 50
+    assert [r["id"] for r in first["rows"]] == sorted((r["id"] for r in first["rows"]), reverse=True)
+    assert set(first["rows"][0]) == {"id", *db_async.STUDENT_HISTORY_COLUMNS}
+    # Stats RPC and page query overlapped on the stub
+    assert {("POST", "rpc/submission_stats"), ("GET", "submissions")} <= set(stub.requests)
+    assert stub.max_in_flight >= 2
+
+    second = db_async.load_student_history("ana", before_id=first["next_cursor"])
+    assert len(second["rows"]) == 30
+    assert second["next_cursor"] is None
+    ids = [r["id"] for r in first["rows"] + second["rows"]]
+    assert sorted(ids) == [r["id"] for r in stub.client.tables["submissions"] if r["username"] == "ana"]
+
+
+def test_student_history_counts_in_python_without_stats_functions(stub):
+    import database as db
+    import database_async as db_async
+
+    history = db_async.load_student_history("luis")
+    assert history["stats"] == _stats_rpc(stub.client, p_username="luis")[0]
+    assert len(history["rows"]) == 40
+    assert db.backend.stats_rpc_available is False
+
+
+def test_teacher_dashboard(stub):
+    import database as db
+    import database_async as db_async
+    _with_stats_functions(stub)
+
+    dashboard = db_async.load_teacher_dashboard()
+    assert [s["group_key"] for s in dashboard["students"]] == ["Ana", "Luis"]
+    assert dashboard["stats"]["total"] == 120
+    assert dashboard["stats"]["students"] == 2
+    assert {u["username"] for u in dashboard["users"]} == {"teacher", "ana", "luis"}
+    assert "password" not in dashboard["users"][0]
+    assert db.student_summary.get() == dashboard["students"]
+
+
+def test_student_history_defaults_when_the_server_fails(stub, monkeypatch):
+    import database_async as db_async
+
+    def fail(*args):
+        raise FakeAPIError("connection to the database failed", "PGRST000")
+    monkeypatch.setattr(stub, "dispatch", fail)
+
+    history = db_async.load_student_history("ana")
+    assert history == {"stats": EMPTY_STATS, "rows": [], "next_cursor": None}
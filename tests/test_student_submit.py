@@ -0,0 +1,85 @@
+"""
+Student submit path, run through Streamlit's AppTest against the local SQLite
+backend with the offline HashingEncoder (no model download, no Supabase)
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_SCRIPT = f"""
+import os, sys
+sys.path.insert(0, {ROOT!r})
+sys.path.insert(0, {os.path.join(ROOT, 'benchmarks')!r})
+os.chdir({ROOT!r})
+import logica
+from fakes import HashingEncoder
+if logica._encoder is None:
+    logica.configurar_encoder(HashingEncoder())
+exec(compile(open({os.path.join(ROOT, 'app.py')!r}, encoding='utf-8').read(), 'app.py', 'exec'))
+"""
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+
+    db_path = str(tmp_path / "evalia.sqlite3")
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_DB_PATH", db_path)
+    monkeypatch.setenv("EMBEDDING_CACHE_MB", "0")
+    monkeypatch.setenv("FEEDBACK_CACHE_PATH", "")
+    # Gemini points at a closed port, so feedback falls back to FEEDBACK_FALLBACK
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("GEMINI_BASE_URL", "http://127.0.0.1:9/")
+    monkeypatch.syspath_prepend(ROOT)
+    # database opens its backend once per process: bind this test's SQLite file
+    import database as db
+    db.init_backend.clear()
+    monkeypatch.setattr(db, "backend", db.init_backend())
+    db.initialize_default_users()
+
+    at = AppTest.from_string(APP_SCRIPT, default_timeout=120)
+    at.run()
+    return at, db_path
+
+
+def _login(at, username, password):
+    at.text_input[0].input(username)
+    at.text_input[1].input(password)
+    next(b for b in at.button if "Iniciar" in b.label).click()
+    at.run()
+
+
+def test_punctuation_only_answer_is_graded_and_stored(app):
+    at, db_path = app
+    _login(at, "student1", "student123")
+    at.text_area[0].input("???")
+    next(b for b in at.button if "Enviar" in b.label).click()
+    at.run()
+
+    assert not at.exception
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT respuesta, features FROM submissions").fetchall()
+    assert len(rows) == 1
+    respuesta, features = rows[0]
+    assert respuesta == "???"
+    assert '"kw_recall": 0.0' in features
+
+
+def test_long_answer_keeps_the_full_text(app):
+    at, db_path = app
+    _login(at, "student1", "student123")
+    answer = "La codificación one-hot representa cada palabra como un vector binario " * 5
+    at.text_area[0].input(answer)
+    next(b for b in at.button if "Enviar" in b.label).click()
+    at.run()
+
+    assert not at.exception
+    with sqlite3.connect(db_path) as conn:
+        respuesta, completa = conn.execute("SELECT respuesta, respuesta_completa FROM submissions").fetchone()
+    assert respuesta == answer[:200] + "..."
+    assert completa == answer